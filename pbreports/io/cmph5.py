@@ -0,0 +1,188 @@
+
+"""
+Read the alignments of a (legacy) cmp.h5 file as numpy columns.
+
+The AlignmentIndex (one row per alignment), movie and reference tables are
+read in bulk, so the reports don't need to create a CmpH5Alignment for every
+alignment to get its movie, hole number, read length or number of errors.
+"""
+import logging
+import math
+
+import numpy as np
+
+from pbcore.io import CmpH5Reader
+
+from pbreports.io.group_by import group_by
+
+log = logging.getLogger(__name__)
+
+# Optional dataset of the alignment Z-scores (one value per alignment)
+Z_SCORE_DATASET = "/AlnInfo/ZScore"
+# Number of alignments of each slice of a QualityValue dataset
+QV_CHUNK_SIZE = 10000
+
+
+def _lookup(ids, keys, values):
+    """Return the values of the (unsorted) keys for every id"""
+    sorter = np.argsort(keys)
+    i = np.searchsorted(keys, ids, sorter=sorter)
+    return np.asarray(values)[sorter[i]]
+
+
+def _to_raw_qv_threshold(qv_threshold):
+    """
+    Return the smallest raw (integer) QualityValue q with q / 10.0 >=
+    qv_threshold, so the raw uint8 values can be compared directly.
+    """
+    q = int(math.ceil(qv_threshold * 10))
+    # ceil(qv_threshold * 10) can be off by one due to float rounding
+    while q > 0 and (q - 1) / 10.0 >= qv_threshold:
+        q -= 1
+    while q / 10.0 < qv_threshold:
+        q += 1
+    return max(q, 0)
+
+
+def _get_qv_counts(h5, index, qv_thresholds, chunk_size=QV_CHUNK_SIZE):
+    """
+    Return an array (nalignments x nthresholds) with the number of (aligned)
+    QualityValue of every alignment that are >= each threshold.
+
+    The QualityValue dataset of each alignment group is read in slices that
+    span the Offset_begin/Offset_end of (at most) chunk_size alignments, and
+    the raw uint8 values are compared to the thresholds (see
+    _to_raw_qv_threshold).
+    """
+    counts = np.zeros((len(index), len(qv_thresholds)), dtype=np.int64)
+    raw_thresholds = [_to_raw_qv_threshold(t) for t in qv_thresholds]
+    group_ids = np.asarray(h5["/AlnGroup/ID"])
+    group_paths = np.asarray(h5["/AlnGroup/Path"])
+    for group_id in np.unique(index.AlnGroupID):
+        rows = np.flatnonzero(index.AlnGroupID == group_id)
+        path = _lookup([group_id], group_ids, group_paths)[0]
+        dataset_name = path + "/QualityValue"
+        if dataset_name not in h5:
+            log.warn("No QualityValue in alignment group {p}".format(p=path))
+            continue
+        dataset = h5[dataset_name]
+        rows = rows[np.argsort(index.Offset_begin[rows], kind='mergesort')]
+        for i in xrange(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            begins = index.Offset_begin[chunk].astype(np.int64)
+            ends = index.Offset_end[chunk].astype(np.int64)
+            offset = begins.min()
+            qvs = np.asarray(dataset[offset:ends.max()])
+            begins -= offset
+            ends -= offset
+            # n_high[j] is the number of QVs[:j] >= the threshold
+            is_high = np.empty(len(qvs), dtype=bool)
+            n_high = np.zeros(len(qvs) + 1, dtype=np.int64)
+            for k, raw_threshold in enumerate(raw_thresholds):
+                np.greater_equal(qvs, raw_threshold, out=is_high)
+                np.cumsum(is_high, out=n_high[1:])
+                counts[chunk, k] = n_high[ends] - n_high[begins]
+    return counts
+
+
+class AlignmentColumns(object):
+
+    """
+    Columns of the alignments of a cmp.h5 file.
+
+    :ivar index: (numpy recarray) the AlignmentIndex (HoleNumber, rStart,
+    rEnd, nMM, nIns, nDel, MapQV, ...)
+    :ivar movie_names: (numpy array) movie name of every alignment
+    :ivar reference_names: (numpy array) reference (FullName) of every
+    alignment
+    :ivar z_scores: (numpy array) Z-score of every alignment, or None if the
+    file doesn't have Z-scores
+    :ivar qv_counts: (numpy array) number of QVs >= each of the qv_thresholds
+    (nalignments x nthresholds), or None
+    """
+
+    def __init__(self, index, movie_names, reference_names, z_scores=None,
+                 qv_counts=None):
+        self.index = index
+        self.movie_names = movie_names
+        self.reference_names = reference_names
+        self.z_scores = z_scores
+        self.qv_counts = qv_counts
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self))
+        return "<{k} nalignments:{n} >".format(**_d)
+
+    def __len__(self):
+        return len(self.index)
+
+    @staticmethod
+    def from_reader(reader, qv_thresholds=None):
+        """
+        :type reader: CmpH5Reader
+        :param qv_thresholds: (list) if provided, count the QualityValues of
+        every alignment that are >= each threshold (qv / 10.0 >= threshold)
+        """
+        index = reader.alignmentIndex
+        movies = reader.movieInfoTable
+        references = reader.referenceInfoTable
+        movie_names = _lookup(index.MovieID, movies.ID, movies.Name)
+        reference_names = _lookup(index.RefGroupID, references.ID,
+                                  references.FullName)
+        z_scores = None
+        if Z_SCORE_DATASET in reader.file:
+            z_scores = np.asarray(reader.file[Z_SCORE_DATASET],
+                                  dtype=np.float64).ravel()
+        qv_counts = None
+        if qv_thresholds is not None:
+            qv_counts = _get_qv_counts(reader.file, index, qv_thresholds)
+        return AlignmentColumns(index, movie_names, reference_names,
+                                z_scores=z_scores, qv_counts=qv_counts)
+
+    @property
+    def read_lengths(self):
+        return (self.index.rEnd.astype(np.int64) -
+                self.index.rStart.astype(np.int64))
+
+    @property
+    def n_errors(self):
+        """Number of mismatches, insertions and deletions"""
+        return (self.index.nMM.astype(np.int64) + self.index.nIns +
+                self.index.nDel)
+
+    @property
+    def accuracies(self):
+        """1 - (errors / read length)"""
+        return 1.0 - self.n_errors / self.read_lengths.astype(np.float64)
+
+    def take(self, rows):
+        """
+        Return the alignments of an array of row indices (or a boolean mask)
+        """
+        def _take(a):
+            return None if a is None else a[rows]
+        return AlignmentColumns(self.index[rows], self.movie_names[rows],
+                                self.reference_names[rows],
+                                z_scores=_take(self.z_scores),
+                                qv_counts=_take(self.qv_counts))
+
+    def iter_movies(self):
+        """
+        Yield (movie name, AlignmentColumns) of every movie (sorted by name).
+        The alignments of a movie are in file order.
+        """
+        names, order, bounds = group_by(self.movie_names)
+        for i, name in enumerate(names):
+            yield name, self.take(order[bounds[i]:bounds[i + 1]])
+
+
+def read_alignment_columns(cmp_h5, qv_thresholds=None):
+    """
+    Read the alignment columns of a cmp.h5 file.
+
+    :param qv_thresholds: see AlignmentColumns.from_reader
+    :rtype: AlignmentColumns
+    """
+    with CmpH5Reader(cmp_h5) as reader:
+        return AlignmentColumns.from_reader(reader,
+                                            qv_thresholds=qv_thresholds)
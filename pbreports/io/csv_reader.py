@@ -1,10 +1,175 @@
 import sys
 import os
 import logging
+import itertools
+import functools
+
 import numpy as np
 
+from pbreports.io import npy_cache
+from pbreports.util import pool_map
+
 log = logging.getLogger(__name__)
 
+# Default number of csv rows that are parsed into a single numpy block
+CHUNK_SIZE = 5000
+
+# Number of bytes read at a time to count the lines of a file
+_BLOCK_SIZE = 1 << 20
+
+
+def _lines_to_array(lines, column_names, column_dtypes):
+    """
+    Convert a list of csv lines to a numpy structured array with a field
+    for each column in column_dtypes (in the csv column order).
+
+    Only the fields of the requested columns are kept from each split line.
+    """
+    ncolumns = len(column_names)
+    indices = [(name, i) for i, name in enumerate(column_names)
+               if name in column_dtypes]
+    columns = [[] for _ in indices]
+    for line in lines:
+        row = line.strip().split(",")
+        if len(row) != ncolumns:
+            raise ValueError("Malformed row '{r}'. Expected {n} columns.".format(
+                r=",".join(row), n=ncolumns))
+        for column, (_, i) in zip(columns, indices):
+            column.append(row[i])
+
+    dtype = [(name, column_dtypes[name][0]) for name, _ in indices]
+    data = np.empty(len(lines), dtype=dtype)
+    for column, (name, _) in zip(columns, indices):
+        data[name] = np.array(column, dtype=column_dtypes[name][0])
+    return data
+
+
+def _count_lines(f):
+    """Count the (remaining) lines of a file handle, one block at a time"""
+    nlines = 0
+    last = ''
+    while True:
+        block = f.read(_BLOCK_SIZE)
+        if not block:
+            break
+        nlines += block.count('\n')
+        last = block[-1]
+    # the last line might not be terminated
+    if last not in ('', '\n'):
+        nlines += 1
+    return nlines
+
+
+def csv_lines_to_chunks(lines, column_names, column_dtypes,
+                        chunk_size=CHUNK_SIZE):
+    """
+    Parse csv lines (without the header) into blocks of typed numpy columns.
+
+    :param lines: iterable of csv lines (e.g., a file handle)
+    :param column_names: (list) column names in the order of the csv
+    :param column_dtypes: (dict) { Name: ( dType, f(str->dType) ) } of the
+    columns to load. The other csv columns are skipped.
+    :param chunk_size: (int) max number of rows per block
+
+    :return: generator of numpy structured arrays
+    :raises: ValueError if a row doesn't have the expected number of columns
+    """
+    it = iter(lines)
+    while True:
+        block = list(itertools.islice(it, chunk_size))
+        if not block:
+            break
+        yield _lines_to_array(block, column_names, column_dtypes)
+
+
+def get_byte_ranges(path, nranges, offset=0):
+    """
+    Split a file into (at most) nranges byte ranges that start and end on
+    line boundaries.
+
+    :param path: (str) Path to file
+    :param nranges: (int) Number of ranges
+    :param offset: (int) Start of the first range (e.g., to skip a header)
+
+    :return: list of (start, end) tuples. There is always at least one
+    (possibly empty) range.
+    """
+    size = os.path.getsize(path)
+    boundaries = [offset]
+    with open(path, 'rb') as f:
+        for i in xrange(1, nranges):
+            pos = offset + (size - offset) * i // nranges
+            if pos <= boundaries[-1]:
+                continue
+            # move to the start of the next line (pos can already be one)
+            f.seek(pos - 1)
+            f.readline()
+            pos = f.tell()
+            if boundaries[-1] < pos < size:
+                boundaries.append(pos)
+    boundaries.append(size)
+    ranges = [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:])
+              if start < end]
+    return ranges if ranges else [(offset, size)]
+
+
+def iter_lines_in_byte_range(path, start, end):
+    """
+    Iterate over the lines in a (line aligned) byte range of a file.
+
+    See get_byte_ranges
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            if pos >= end:
+                break
+            pos += len(line)
+            yield line
+
+
+def _apply_to_byte_range(func, path, byte_range):
+    return func(iter_lines_in_byte_range(path, *byte_range))
+
+
+def map_byte_ranges(func, path, nproc=1):
+    """
+    Split the rows of a csv file (after the header line) into nproc line
+    aligned byte ranges and call func(lines) on the lines of each range.
+
+    With nproc > 1, the ranges are processed by a pool of worker processes,
+    so func must be picklable (e.g., a functools.partial of a module level
+    function).
+
+    :return: list of the func results, in file order
+    """
+    with open(path, 'r') as f:
+        header_size = len(f.readline())
+
+    byte_ranges = get_byte_ranges(path, nproc, offset=header_size)
+    f = functools.partial(_apply_to_byte_range, func, path)
+
+    log.info("Processing {n} byte ranges of {f}".format(n=len(byte_ranges),
+                                                        f=path))
+    return pool_map(f, byte_ranges, nproc)
+
+
+def get_cache_path(path, column_dtypes, cache_dir=None):
+    """
+    Return the path of the .npy sidecar cache of a csv file.
+
+    The file name is keyed by the absolute path, size and mtime of the csv
+    and by the column map, so a modified csv (or a different set of
+    columns) never maps to a stale cache.
+
+    :param cache_dir: (str) directory of the cache. Defaults to the
+    directory of the csv.
+    """
+    columns = sorted((name, np.dtype(v[0]).str)
+                     for name, v in column_dtypes.iteritems())
+    return npy_cache.get_cache_path(path, columns, cache_dir)
+
 
 class CsvReader(object):
 
@@ -32,7 +197,17 @@ class CsvReader(object):
     >    print( i['#Bases')
     """
 
-    def __init__(self, path, column_dtypes, strict):
+    def __init__(self, path, column_dtypes, strict, row_filter=None,
+                 chunk_size=CHUNK_SIZE, cache=False, cache_dir=None):
+        """
+        :param row_filter: optional f(numpy structured array) -> boolean mask
+        of the rows to keep, e.g., lambda d: d['PassedFilter'] > 0. It is
+        applied to each block of rows while loading.
+        :param chunk_size: (int) number of csv rows parsed per block
+        :param cache: (bool) Write the parsed (unfiltered) array to a .npy
+        sidecar and memory map it in later loads. See get_cache_path
+        :param cache_dir: (str) directory of the cache (default: csv dir)
+        """
         if not os.path.exists(path):
             raise IOError('File does not exist: {f}'.format(f=path))
 
@@ -41,32 +216,80 @@ class CsvReader(object):
         self._np_array = None
         self._num_records = 0
         self._strict = strict
+        self._row_filter = row_filter
+        self._chunk_size = chunk_size
+        self._cache = cache
+        self._cache_dir = cache_dir
 
     def load(self):
         '''
         Load data into a numpy array.
         Should be called after reader construction.
+
+        Only the columns in the column_dtypes map are converted. The rows are
+        parsed in blocks of chunk_size and copied into a typed buffer.
+        Without a row filter, the lines are counted first and the buffer is
+        allocated once, so the peak memory is close to the size of the
+        returned array. With a row filter, the buffer is grown geometrically
+        (in place) and is at most twice the size of the returned array.
+
+        If the cache is enabled, the array is memory mapped (read-only) from
+        the sidecar when it is up to date, and written after parsing
+        otherwise.
         '''
-        titles = None
-        f = None
-        try:
-            data = []
-            f = open(self._path, "r")
-            for line in f:
-                line_parts = line.strip().split(",")
-                if titles is None:
-                    titles = self._validate_titles(line_parts)
-                else:
-                    line_values = [line_parts[v[1]] for v in titles]
-                    data.append(tuple(line_values))
-                    self._num_records += 1
+        if not self._cache:
+            self._np_array = self._load_csv(self._row_filter)
+            return
+
+        cache_path = get_cache_path(self._path, self._column_dtypes,
+                                    self._cache_dir)
+        data = npy_cache.load_cache(cache_path)
+        if data is None:
+            data = self._load_csv(None)
+            npy_cache.write_cache(cache_path, data)
+        else:
+            log.info("Loaded csv cache {f}".format(f=cache_path))
+            self._num_records = len(data)
+        if self._row_filter is not None:
+            data = data[self._row_filter(data)]
+        self._np_array = data
 
+    def _load_csv(self, row_filter):
+        """
+        Parse the csv and return the numpy array of the (filtered) rows.
+        """
+        with open(self._path, "r") as f:
+            column_names = f.readline().strip().split(",")
+            titles = self._validate_titles(column_names)
+            column_dtypes = dict((name, self._column_dtypes[name])
+                                 for name, idx in titles)
             dTypes = [(name, self._column_dtypes[name][0])
                       for name, idx in titles]
-            self._np_array = np.array(data, dtype=dTypes)
-        finally:
-            if f is not None:
-                f.close()
+
+            if row_filter is None:
+                # the number of rows is known, so the array is allocated once
+                start = f.tell()
+                capacity = _count_lines(f)
+                f.seek(start)
+            else:
+                capacity = 0
+            data = np.empty(capacity, dtype=dTypes)
+            nrows = 0
+            for chunk in csv_lines_to_chunks(f, column_names, column_dtypes,
+                                             self._chunk_size):
+                self._num_records += len(chunk)
+                if row_filter is not None:
+                    chunk = chunk[row_filter(chunk)]
+                n = nrows + len(chunk)
+                if n > len(data):
+                    # double the capacity to amortize the reallocations
+                    data.resize(max(n, 2 * len(data)), refcheck=False)
+                data[nrows:n] = chunk
+                nrows = n
+
+        # release the unused tail of the buffer
+        data.resize(nrows, refcheck=False)
+        return data
 
     def _validate_titles(self, titles):
         """
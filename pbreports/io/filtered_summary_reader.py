@@ -27,11 +27,14 @@ class FilteredSummaryReader(CsvReader):
                       "SNR": (float, float),
                       "ArtifactScore": ("|S64", str)}
 
-    def __init__(self, path, column_map=None, strict=False):
+    def __init__(self, path, column_map=None, strict=False, row_filter=None,
+                 cache=False, cache_dir=None):
 
         if column_map is None:
             column_map = FilteredSummaryReader._column_dtypes
-        CsvReader.__init__(self, path, column_map, strict)
+        CsvReader.__init__(self, path, column_map, strict,
+                           row_filter=row_filter, cache=cache,
+                           cache_dir=cache_dir)
 
     @property
     def num_reads(self):
@@ -0,0 +1,72 @@
+
+"""
+Read the records of a GFF file into numpy columns (one value per record)
+instead of creating a Gff3Record for every line, so per-sequence sums can be
+computed with numpy group-bys (see pbreports.io.group_by).
+"""
+import gzip
+import array
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def _open(file_name):
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, 'rb')
+    return open(file_name, 'r')
+
+
+def read_gff_columns(gff_file, attribute_names=(), seqids=None):
+    """
+    Read the seqid (first word), start, end and attributes of the records
+    of a GFF file.
+
+    :param attribute_names: (list) names of the attributes to read (every
+    record must have them)
+    :param seqids: (set) if provided, only the records of these seqids are
+    read
+    :return: dict of column name -> numpy array. 'seqid', 'start', 'end' and
+    the (string) attribute columns
+    """
+    seqid_col = []
+    start_col = array.array('l')
+    end_col = array.array('l')
+    attribute_cols = [[] for _ in attribute_names]
+    with _open(gff_file) as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.rstrip('\n').split('\t')
+            seqid = fields[0].split()[0]
+            if seqids is not None and seqid not in seqids:
+                continue
+            seqid_col.append(seqid)
+            start_col.append(int(fields[3]))
+            end_col.append(int(fields[4]))
+            if attribute_names:
+                attributes = dict(x.split('=', 1)
+                                  for x in fields[8].split(';') if x)
+                for col, name in zip(attribute_cols, attribute_names):
+                    col.append(attributes[name])
+
+    columns = {'seqid': np.array(seqid_col, dtype=str),
+               'start': np.frombuffer(start_col, dtype='l').astype(np.int64),
+               'end': np.frombuffer(end_col, dtype='l').astype(np.int64)}
+    for col, name in zip(attribute_cols, attribute_names):
+        columns[name] = np.array(col, dtype=str)
+    return columns
+
+
+def to_numeric(values, ncols=1, dtype=np.float64):
+    """
+    Convert a column of (comma separated) numeric attribute values, e.g.
+    'cov2=12.5,3.2', to a numpy array (nrecords x ncols)
+    """
+    if len(values) == 0:
+        return np.zeros((0, ncols), dtype=dtype)
+    data = np.fromstring(','.join(values), dtype=dtype, sep=',')
+    return data.reshape(len(values), ncols)
+
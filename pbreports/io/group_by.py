@@ -0,0 +1,18 @@
+"""
+Group the rows of numpy columns by a key column (e.g. the movie name of
+every alignment, or the seqid of every GFF record).
+"""
+import numpy as np
+
+
+def group_by(keys):
+    """
+    Return (unique keys, order, bounds): the rows of the i-th (sorted) key
+    are order[bounds[i]:bounds[i + 1]], in their original order.
+
+    :param keys: (numpy array or list) key of every row
+    """
+    names, indices = np.unique(keys, return_inverse=True)
+    order = np.argsort(indices, kind='mergesort')
+    bounds = np.searchsorted(indices[order], np.arange(len(names) + 1))
+    return names, order, bounds
@@ -0,0 +1,101 @@
+
+"""
+.npy sidecar caches of arrays computed from (large) input files.
+
+The cache file name is keyed by the absolute path, size and mtime of the
+input file (and by any additional key), so a modified input never maps to a
+stale cache. The name is <basename>.<path and key hash>.<size and mtime
+hash>.npy, and writing a cache removes the older versions (same path and
+key) of the file, so the cache doesn't grow when an input is modified.
+"""
+import os
+import logging
+import hashlib
+import tempfile
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def get_cache_path(path, key=None, cache_dir=None):
+    """
+    Return the path of the .npy sidecar cache of a file.
+
+    :param key: additional (repr-able) key, e.g. the parsed columns
+    :param cache_dir: (str) directory of the cache. Defaults to the
+    directory of the file.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    if cache_dir is None:
+        cache_dir = os.path.dirname(path)
+    name = "{b}.{k}.{v}.npy".format(
+        b=os.path.basename(path),
+        k=hashlib.md5(repr((path, key))).hexdigest(),
+        v=hashlib.md5(repr((st.st_size, st.st_mtime))).hexdigest())
+    return os.path.join(cache_dir, name)
+
+
+def _get_stale_paths(cache_path):
+    """Return the other versions of a cache (same file and key)"""
+    cache_dir, name = os.path.split(cache_path)
+    # <basename>.<path and key hash>.
+    prefix = name.rsplit(".", 2)[0] + "."
+    return [os.path.join(cache_dir, n) for n in os.listdir(cache_dir)
+            if n.startswith(prefix) and n.endswith(".npy") and n != name]
+
+
+def _get_file_mode():
+    """Mode of a new (non executable) file with the current umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def load_cache(cache_path):
+    """
+    Memory map a .npy cache. Return None if the cache doesn't exist or can't
+    be read.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        return np.load(cache_path, mmap_mode='r')
+    except (IOError, ValueError) as e:
+        log.warn("Unable to load cache {f}: {e}".format(f=cache_path, e=e))
+        return None
+
+
+def write_cache(cache_path, data):
+    """
+    Write an array to a .npy cache. The file is written to a temporary file
+    and then renamed, so a concurrent reader never sees a partial cache.
+    The cache has the default (umask) permissions of a new file, so it can
+    be shared by the users of the directory. The older versions of the
+    cache are removed. Failures (e.g., read-only directory) are logged and
+    ignored.
+    """
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp",
+                                        dir=os.path.dirname(cache_path))
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, data)
+        # mkstemp creates the file with mode 0600
+        os.chmod(tmp_path, _get_file_mode())
+        os.rename(tmp_path, cache_path)
+        log.info("Wrote cache {f}".format(f=cache_path))
+    except (IOError, OSError) as e:
+        log.warn("Unable to write cache {f}: {e}".format(f=cache_path, e=e))
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+
+    for stale_path in _get_stale_paths(cache_path):
+        try:
+            os.remove(stale_path)
+            log.info("Removed stale cache {f}".format(f=stale_path))
+        except OSError as e:
+            log.warn("Unable to remove stale cache {f}: {e}".format(
+                f=stale_path, e=e))
@@ -0,0 +1,262 @@
+
+"""
+Get the sequence lengths of FASTA and FASTQ files without creating a record
+(and the sequence string) for every read.
+
+FASTA files are read in large blocks that are processed with numpy. If a
+samtools faidx index (.fai) is present (and not older than the FASTA), the
+lengths are read from the index.
+
+The lengths of a file can be cached in a .npy sidecar (see
+pbreports.io.npy_cache), so several reports that need the number of reads,
+the total length or the N50 of the same file only scan it once.
+"""
+import os
+import gzip
+import logging
+
+import numpy as np
+
+from pbcore.io import ContigSet
+
+from pbreports.io import npy_cache
+
+log = logging.getLogger(__name__)
+
+# Number of bytes read at a time
+BLOCK_SIZE = 1 << 20
+
+_FASTA_EXTS = (".fasta", ".fa", ".fna", ".fsa")
+_FASTQ_EXTS = (".fastq", ".fq")
+
+_HEADER = ord('>')
+_NEWLINE = ord('\n')
+# bytes <= ' ' (newlines, carriage returns, spaces, tabs) aren't residues
+_SPACE = ord(' ')
+_PHRED_OFFSET = 33
+
+
+def _open(file_name):
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, 'rb')
+    return open(file_name, 'rb')
+
+
+def _strip_gz(file_name):
+    if file_name.endswith(".gz"):
+        return file_name[:-len(".gz")]
+    return file_name
+
+
+def get_fai_file(fasta_file):
+    """
+    Return the path of the .fai index of a FASTA file, or None if it doesn't
+    exist or is older than the FASTA file.
+    """
+    fai_file = fasta_file + ".fai"
+    if os.path.isfile(fai_file) and \
+            os.path.getmtime(fai_file) >= os.path.getmtime(fasta_file):
+        return fai_file
+    return None
+
+
+def read_fai_lengths(fai_file):
+    """Return the sequence lengths (2nd column) of a .fai index"""
+    with open(fai_file) as f:
+        lengths = [int(line.split('\t', 2)[1]) for line in f if line.strip()]
+    return np.array(lengths, dtype=np.int64)
+
+
+class _FastaScanner(object):
+
+    """
+    Count the residues of each record of a FASTA file, one block at a time.
+
+    The state between two blocks is the length of the current record,
+    whether the block started at the beginning of a line and whether it
+    started in a header line.
+    """
+
+    def __init__(self):
+        self.lengths = []
+        self.current = None
+        self.at_line_start = True
+        self.in_header = False
+
+    def add_block(self, block):
+        data = np.frombuffer(block, dtype=np.uint8)
+        n = len(data)
+        newlines = np.flatnonzero(data == _NEWLINE)
+
+        # first byte of every line of the block
+        line_starts = newlines + 1
+        if line_starts.size and line_starts[-1] == n:
+            line_starts = line_starts[:-1]
+        if self.at_line_start:
+            line_starts = np.concatenate(([0], line_starts))
+        starts = line_starts[data[line_starts] == _HEADER]
+
+        # end (exclusive) of every header line. A header line that isn't
+        # terminated in this block ends at n
+        header_starts = starts
+        if self.in_header:
+            header_starts = np.concatenate(([0], starts))
+        i = np.searchsorted(newlines, header_starts)
+        header_ends = np.empty(len(header_starts), dtype=np.int64)
+        found = i < len(newlines)
+        header_ends[found] = newlines[i[found]] + 1
+        header_ends[~found] = n
+
+        # the residues are between the end of a header line (or the start of
+        # the block) and the next header (or the end of the block). Every
+        # byte that isn't a newline or space is a residue
+        spaces = np.flatnonzero(data <= _SPACE)
+        if self.in_header:
+            begins = header_ends
+        else:
+            begins = np.concatenate(([0], header_ends))
+        ends = np.concatenate((starts, [n]))
+        counts = (ends - np.searchsorted(spaces, ends)) - \
+            (begins - np.searchsorted(spaces, begins))
+
+        # the residues before the first header of the block belong to the
+        # current record, the others to the record of the previous header
+        if self.current is not None:
+            self.current += int(counts[0])
+        elif counts[0] != 0:
+            raise ValueError("Residues found before the first FASTA header")
+        if len(starts):
+            if self.current is not None:
+                self.lengths.append(self.current)
+            self.lengths.extend(counts[1:-1].tolist())
+            self.current = int(counts[-1])
+
+        self.at_line_start = data[-1] == _NEWLINE
+        self.in_header = bool(len(header_ends)) and header_ends[-1] == n and \
+            not self.at_line_start
+
+    def finish(self):
+        if self.current is not None:
+            self.lengths.append(self.current)
+            self.current = None
+        return np.array(self.lengths, dtype=np.int64)
+
+
+def scan_fasta_lengths(fasta_file, block_size=BLOCK_SIZE):
+    """
+    Read a FASTA file in blocks of block_size bytes and return the number of
+    residues of each record (in file order).
+    """
+    scanner = _FastaScanner()
+    with _open(fasta_file) as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            scanner.add_block(block)
+    return scanner.finish()
+
+
+def get_fasta_lengths(fasta_file, block_size=BLOCK_SIZE):
+    """
+    Return a numpy array with the length of each record of a FASTA file (in
+    file order). The .fai index is used if present.
+    """
+    fai_file = get_fai_file(fasta_file)
+    if fai_file is not None:
+        log.debug("Reading lengths from {f}".format(f=fai_file))
+        return read_fai_lengths(fai_file)
+    return scan_fasta_lengths(fasta_file, block_size=block_size)
+
+
+def _iter_fastq(fastq_file):
+    """
+    Yield (header, sequence length, quality lines) of each record of a FASTQ
+    file. Sequences and qualities may span several lines.
+    """
+    with _open(fastq_file) as f:
+        lines = iter(f)
+        for line in lines:
+            if not line.strip():
+                continue
+            if not line.startswith('@'):
+                raise ValueError("Invalid FASTQ header in {f}: {l}".format(
+                    f=fastq_file, l=line.rstrip()))
+            header = line[1:].strip()
+            n = 0
+            for line in lines:
+                if line.startswith('+'):
+                    break
+                n += len(line.rstrip())
+            # the quality lines have the same number of characters
+            qv_lines = []
+            nqv = 0
+            while nqv < n:
+                qv_line = next(lines).rstrip()
+                qv_lines.append(qv_line)
+                nqv += len(qv_line)
+            yield header, n, qv_lines
+
+
+def get_fastq_lengths(fastq_file):
+    """
+    Return a numpy array with the length of each record of a FASTQ file (in
+    file order).
+    """
+    return np.fromiter((n for _, n, _ in _iter_fastq(fastq_file)),
+                       dtype=np.int64)
+
+
+def iter_fastq_qv_sums(fastq_file):
+    """
+    Yield (header, length, sum of the quality values) of each record of a
+    FASTQ file. The (Phred+33) quality lines are decoded with numpy, without
+    creating a record or a list of per-base values.
+    """
+    for header, n, qv_lines in _iter_fastq(fastq_file):
+        qv_sum = sum(int(np.frombuffer(qv_line, dtype=np.uint8).sum())
+                     for qv_line in qv_lines) - _PHRED_OFFSET * n
+        yield header, n, qv_sum
+
+
+def _get_file_lengths(file_name):
+    name = _strip_gz(file_name).lower()
+    if name.endswith(_FASTQ_EXTS):
+        return get_fastq_lengths(file_name)
+    elif not name.endswith(_FASTA_EXTS):
+        log.warn("Unknown extension of {f}. Assuming FASTA".format(
+            f=file_name))
+    return get_fasta_lengths(file_name)
+
+
+def get_sequence_lengths(file_name, cache=False, cache_dir=None):
+    """
+    Return a numpy array with the sequence lengths of a FASTA, FASTQ (both
+    can be gzipped) or ContigSet XML file.
+
+    :param cache: (bool) Write the lengths of each file to a .npy sidecar
+    and memory map it in later calls. The sidecar is keyed by the path, size
+    and mtime of the file (see npy_cache.get_cache_path)
+    :param cache_dir: (str) directory of the cache (default: file dir)
+    """
+    if file_name.lower().endswith(".xml"):
+        with ContigSet(file_name) as ds:
+            resources = ds.toExternalFiles()
+        lengths = [get_sequence_lengths(f, cache=cache, cache_dir=cache_dir)
+                   for f in resources]
+        if not lengths:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(lengths)
+
+    if not cache:
+        return _get_file_lengths(file_name)
+
+    cache_path = npy_cache.get_cache_path(file_name, "sequence_lengths",
+                                          cache_dir)
+    lengths = npy_cache.load_cache(cache_path)
+    if lengths is None:
+        lengths = _get_file_lengths(file_name)
+        npy_cache.write_cache(cache_path, lengths)
+    else:
+        log.info("Loaded sequence lengths cache {f}".format(f=cache_path))
+    return lengths
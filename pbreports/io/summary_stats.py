@@ -0,0 +1,180 @@
+
+"""
+Streaming loader of the Pipeline Summary Stats (sts.xml) of a DataSet.
+
+Only the fields used by the loading, adapter and filtering stats reports
+are extracted (per DataSetMetadata, i.e., per collection) and the XML
+elements are discarded as soon as they are parsed, so the memory usage
+doesn't depend on the number of subdatasets.
+
+The returned objects have the same attribute names as the corresponding
+pbcore DataSet objects, so the reports can use either of them.
+"""
+import logging
+import xml.etree.cElementTree as ET
+
+import numpy as np
+
+from pbcore.io import DataSet
+
+log = logging.getLogger(__name__)
+
+# element name -> SummaryStats list attribute
+_CONTINUOUS_DISTS = {"ReadLenDist": "readLenDists",
+                     "ReadQualDist": "readQualDists",
+                     "MedianInsertDist": "medianInsertDists"}
+
+# element name -> (SummaryStats attribute, f(str -> value))
+_VALUES = {"NumSequencingZmws": ("numSequencingZmws", int),
+           "AdapterDimerFraction": ("adapterDimerFraction", float),
+           "ShortInsertFraction": ("shortInsertFraction", float)}
+
+
+class ContinuousDistribution(object):
+
+    def __init__(self, bins, minBinValue, binWidth):
+        self.bins = bins
+        self.minBinValue = minBinValue
+        self.binWidth = binWidth
+
+    @property
+    def labels(self):
+        return [self.minBinValue + i * self.binWidth
+                for i in xrange(len(self.bins))]
+
+
+class DiscreteDistribution(object):
+
+    def __init__(self, bins):
+        self.bins = bins
+
+
+class SummaryStats(object):
+
+    def __init__(self):
+        self.numSequencingZmws = None
+        self.adapterDimerFraction = None
+        self.shortInsertFraction = None
+        self.prodDist = None
+        self.readLenDists = []
+        self.readQualDists = []
+        self.medianInsertDists = []
+
+
+class Collection(object):
+
+    def __init__(self, context):
+        self.context = context
+
+
+class Metadata(object):
+
+    def __init__(self, is_root=False):
+        self.is_root = is_root
+        self.summaryStats = None
+        self.collections = []
+
+
+class StatsDataSet(object):
+
+    def __init__(self, metadata, subdatasets):
+        self.metadata = metadata
+        self.subdatasets = subdatasets
+
+
+def _local_name(tag):
+    """Strip the namespace of an element tag"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def load_summary_stats(path):
+    """
+    Incrementally parse a DataSet XML (or a sts.xml) and return a
+    StatsDataSet.
+
+    The summary stats of the top level DataSetMetadata (or the PipeStats of
+    a sts.xml) are in metadata.summaryStats (None if not present) and the
+    ones of each subdataset are in subdatasets.
+    """
+    # open elements
+    stack = []
+    metadata = None
+    stats = None
+    # (bins, values) of the distribution being parsed
+    dist = None
+    root_metadata = None
+    subdatasets = []
+
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        tag = _local_name(elem.tag)
+        if event == "start":
+            if tag == "DataSetMetadata" or (tag == "PipeStats" and
+                                            not stack):
+                metadata = Metadata(is_root=len(stack) <= 1)
+            if tag in ("SummaryStats", "PipeStats") and metadata is not None:
+                stats = SummaryStats()
+                metadata.summaryStats = stats
+            elif tag == "CollectionMetadata" and metadata is not None:
+                metadata.collections.append(Collection(elem.get("Context")))
+            elif stats is not None and (tag in _CONTINUOUS_DISTS or
+                                        tag == "ProdDist"):
+                dist = ([], {})
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if dist is not None:
+            if tag == "BinCount":
+                dist[0].append(int(elem.text))
+            elif tag in ("MinBinValue", "BinWidth"):
+                dist[1][tag] = float(elem.text)
+            elif tag in _CONTINUOUS_DISTS:
+                bins, values = dist
+                getattr(stats, _CONTINUOUS_DISTS[tag]).append(
+                    ContinuousDistribution(np.array(bins, dtype=np.int64),
+                                           values.get("MinBinValue", 0.0),
+                                           values.get("BinWidth", 1.0)))
+                dist = None
+            elif tag == "ProdDist":
+                stats.prodDist = DiscreteDistribution(
+                    np.array(dist[0], dtype=np.int64))
+                dist = None
+        elif stats is not None and tag in _VALUES:
+            name, f = _VALUES[tag]
+            setattr(stats, name, f(elem.text))
+
+        if tag in ("SummaryStats", "PipeStats"):
+            stats = None
+        if tag == "DataSetMetadata" or (tag == "PipeStats" and not stack):
+            if metadata.is_root:
+                root_metadata = metadata
+            else:
+                subdatasets.append(StatsDataSet(metadata, []))
+            metadata = None
+
+        # the element (and its already parsed children) is no longer needed
+        elem.clear()
+        if stack:
+            del stack[-1][:]
+
+    if root_metadata is None:
+        root_metadata = Metadata(is_root=True)
+    return StatsDataSet(root_metadata, subdatasets)
+
+
+def load_dataset_stats(stats_xml):
+    """
+    Return the summary stats of a DataSet XML (or sts.xml).
+
+    The XML is parsed with load_summary_stats. If the top level metadata
+    doesn't have summary stats (e.g., they are in a sts.xml that is an
+    external resource), fall back to loading the pbcore DataSet.
+    """
+    dset = load_summary_stats(stats_xml)
+    if dset.metadata.summaryStats is None:
+        log.info("No summary stats in {f}. Loading DataSet".format(
+            f=stats_xml))
+        dset = DataSet(stats_xml)
+        if not dset.metadata.summaryStats:
+            dset.loadStats(stats_xml)
+    return dset
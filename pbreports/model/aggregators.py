@@ -1,10 +1,56 @@
 import math
 import abc
 import logging
+import fractions
+
+import numpy as np
 
 log = logging.getLogger(__name__)
 
 
+def exact_sum(values):
+    """
+    Sum a numpy array without any rounding error.
+
+    Integer arrays are summed to a python int. Float arrays are summed to a
+    fractions.Fraction, so partial sums of different blocks of values can be
+    added in any order and always give the same (exact) result.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'biu':
+        return int(values.sum(dtype=np.int64))
+    # value = mantissa * 2 ** exponent, where mantissa * 2 ** 53 is an integer
+    mantissas, exponents = np.frexp(values.astype(np.float64))
+    ints = (mantissas * 2.0 ** 53).astype(np.int64)
+    total = fractions.Fraction(0)
+    for exponent in np.unique(exponents):
+        xs = ints[exponents == exponent]
+        # split into 26 bit halves so the int64 sums can't overflow
+        high = int((xs >> 26).sum())
+        low = int((xs & ((1 << 26) - 1)).sum())
+        total += (fractions.Fraction((high << 26) + low) *
+                  fractions.Fraction(2) ** (int(exponent) - 53))
+    return total
+
+
+def to_number(value):
+    """Convert an exact (Fraction) total to a float"""
+    if isinstance(value, fractions.Fraction):
+        return float(value)
+    return value
+
+
+def to_bin_indices(values, dx):
+    """
+    Vectorized version of int(math.ceil(v / dx)) used by the histogram
+    aggregators (including the python 2 integer division when both the value
+    and dx are ints).
+    """
+    if values.dtype.kind in 'biu' and isinstance(dx, (int, long)):
+        return values // dx
+    return np.ceil(values / float(dx)).astype(np.int64)
+
+
 class BaseAggregator(object):
     __metaclass__ = abc.ABCMeta
 
@@ -12,6 +58,35 @@ class BaseAggregator(object):
     def apply(self, record):
         pass
 
+    def apply_chunk(self, chunk):
+        """
+        Apply a block of records. The chunk is a numpy structured array
+        with a field for each column (see pbreports.io.csv_reader).
+
+        Subclasses should override this with a vectorized version.
+        """
+        for record in chunk.view(np.recarray):
+            self.apply(record)
+
+    @abc.abstractmethod
+    def merge(self, other):
+        """
+        Add the state of another aggregator of the same type (computed from
+        the records that follow the records of this aggregator) to this
+        aggregator.
+        """
+        pass
+
+
+def merge_aggregators(aggregators, others):
+    """
+    Merge the aggregators of the {name: aggregator} dict others into the
+    dict of aggregators (by name).
+    """
+    for name, aggregator in aggregators.iteritems():
+        aggregator.merge(others[name])
+    return aggregators
+
 
 class BaseAttribute(object):
     # This class is to be used for aggregators that
@@ -36,6 +111,12 @@ class CountAggregator(BaseAggregatorAttribute):
     def apply(self, record):
         self.total += 1
 
+    def apply_chunk(self, chunk):
+        self.total += int(chunk.shape[0])
+
+    def merge(self, other):
+        self.total += other.total
+
     def __repr__(self):
         _d = dict(k=self.__class__.__name__, t=self.total, f=self.record_field)
         return "<{k} {f} total={t} >".format(**_d)
@@ -59,6 +140,19 @@ class MinAggregator(BaseAggregatorAttribute):
         if v < self.value:
             self.value = v
 
+    def apply_chunk(self, chunk):
+        values = chunk[self.record_field]
+        if values.size == 0:
+            return
+        v = values.min().item()
+        if self.value is None or v < self.value:
+            self.value = v
+
+    def merge(self, other):
+        if other.value is not None:
+            if self.value is None or other.value < self.value:
+                self.value = other.value
+
     def __repr__(self):
         _d = dict(k=self.__class__.__name__, t=self.value, f=self.record_field)
         return "<{k} {f} min={t} >".format(**_d)
@@ -82,6 +176,19 @@ class MaxAggregator(BaseAggregatorAttribute):
         if v > self.value:
             self.value = v
 
+    def apply_chunk(self, chunk):
+        values = chunk[self.record_field]
+        if values.size == 0:
+            return
+        v = values.max().item()
+        if self.value is None or v > self.value:
+            self.value = v
+
+    def merge(self, other):
+        if other.value is not None:
+            if self.value is None or other.value > self.value:
+                self.value = other.value
+
     def __repr__(self):
         _d = dict(k=self.__class__.__name__, t=self.value, f=self.record_field)
         return "<{k} {f} max={t}>".format(**_d)
@@ -100,15 +207,21 @@ class SumAggregator(BaseAggregatorAttribute):
     def apply(self, record):
         self.total += getattr(record, self.record_field)
 
+    def apply_chunk(self, chunk):
+        self.total += exact_sum(chunk[self.record_field])
+
+    def merge(self, other):
+        self.total += other.total
+
     def __repr__(self):
         _d = dict(k=self.__class__.__name__,
-                  t=self.total,
+                  t=to_number(self.total),
                   f=self.record_field)
         return "<{k} {f} total={t} >".format(**_d)
 
     @property
     def attribute(self):
-        return self.total
+        return to_number(self.total)
 
 
 class MeanAggregator(BaseAggregatorAttribute):
@@ -123,14 +236,23 @@ class MeanAggregator(BaseAggregatorAttribute):
         v = getattr(record, self.record_field)
         self.total += v
 
+    def apply_chunk(self, chunk):
+        values = chunk[self.record_field]
+        self.nvalues += int(values.shape[0])
+        self.total += exact_sum(values)
+
+    def merge(self, other):
+        self.nvalues += other.nvalues
+        self.total += other.total
+
     @property
     def mean(self):
         if self.nvalues == 0:
             return 0.0
-        return self.total / self.nvalues
+        return to_number(self.total / self.nvalues)
 
     def __repr__(self):
-        _d = dict(n=self.nvalues, t=self.total,
+        _d = dict(n=self.nvalues, t=to_number(self.total),
                   k=self.__class__.__name__,
                   f=self.record_field,
                   m=self.mean)
@@ -149,6 +271,9 @@ class HistogramAggregator(BaseAggregator):
         # bin width
         self.dx = dx
         self.bins = [0 for _ in xrange(nbins)]
+        # increasing running max values. Only these values can add bins,
+        # which is needed to merge histograms.
+        self.running_maxima = []
 
     @property
     def nbins(self):
@@ -172,13 +297,8 @@ class HistogramAggregator(BaseAggregator):
         """
         return [self.dx * i for i in xrange(self.nbins)]
 
-    def apply(self, record):
-        """Adaptively compute the histogram. If there are not enough bins,
-        more will be added."""
-        v = getattr(record, self.record_field)
-        # If value is larger than the current list of bins
-        n = int(math.ceil(v / self.dx))
-
+    def _add_bins_for(self, v):
+        """Add more bins if there are not enough bins for value v"""
         max_v = (self.nbins - 1) * self.dx
 
         if v >= max_v:
@@ -190,11 +310,54 @@ class HistogramAggregator(BaseAggregator):
             for _ in xrange(i):
                 self.bins.append(0)
 
+    def _update_running_maxima(self, v):
+        if not self.running_maxima or v > self.running_maxima[-1]:
+            self.running_maxima.append(v)
+            self._add_bins_for(v)
+
+    def apply(self, record):
+        """Adaptively compute the histogram. If there are not enough bins,
+        more will be added."""
+        v = getattr(record, self.record_field)
+        # If value is larger than the current list of bins
+        n = int(math.ceil(v / self.dx))
+
+        self._update_running_maxima(v)
+
         #log.info((v, n, max_v ))
         #log.info("{k} {f} Adding value {v} index={n} to nbins {b} dx {x}".format(v=v, b=self.nbins, x=self.dx, n=n, f=self.record_field, k=self.__class__.__name__))
 
         self.bins[n] += 1
 
+    def apply_chunk(self, chunk):
+        """Vectorized apply. This gives the same bins as calling apply on
+        each record of the chunk in order."""
+        values = chunk[self.record_field]
+        if values.size == 0:
+            return
+        # Only a new running max can add bins, so replay those in order
+        running_max = np.maximum.accumulate(values)
+        is_new_max = np.ones(values.shape[0], dtype=bool)
+        is_new_max[1:] = running_max[1:] > running_max[:-1]
+        for v in values[is_new_max].tolist():
+            self._update_running_maxima(v)
+
+        counts = np.bincount(to_bin_indices(values, self.dx),
+                             minlength=self.nbins)
+        self.bins = (np.array(self.bins, dtype=np.int64) + counts).tolist()
+
+    def merge(self, other):
+        """The other histogram must have been computed with the same min
+        value, dx and initial number of bins."""
+        for v in other.running_maxima:
+            self._update_running_maxima(v)
+        if other.nbins > self.nbins:
+            # the extra bins of other are necessarily empty
+            other_bins = other.bins[:self.nbins]
+        else:
+            other_bins = other.bins + [0] * (self.nbins - other.nbins)
+        self.bins = [i + j for i, j in zip(self.bins, other_bins)]
+
     def __repr__(self):
         _d = dict(k=self.__class__.__name__,
                   f=self.record_field,
@@ -0,0 +1,159 @@
+"""
+Statistics computed directly from binned distributions (e.g., the
+ContinuousDistribution elements of a sts.xml), without expanding the bins
+into one value per read.
+"""
+import math
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class BinnedDistribution(object):
+
+    """
+    Histogram with fixed width bins. Bin i covers
+
+    [min_value + i * bin_width, min_value + (i + 1) * bin_width)
+    """
+
+    def __init__(self, bins, min_value, bin_width):
+        self.bins = np.asarray(bins, dtype=np.int64)
+        self.min_value = float(min_value)
+        self.bin_width = float(bin_width)
+
+    @staticmethod
+    def from_sts_dist(dist):
+        """
+        :param dist: pbcore ContinuousDistribution (e.g., an item of
+        summaryStats.readLenDists)
+        """
+        return BinnedDistribution(dist.bins, dist.minBinValue, dist.binWidth)
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=self.nbins, m=self.min_value,
+                  w=self.bin_width, c=self.count)
+        return "<{k} nbins:{n} min:{m} width:{w} count:{c} >".format(**_d)
+
+    @property
+    def nbins(self):
+        return len(self.bins)
+
+    @property
+    def max_value(self):
+        """Upper edge of the last bin"""
+        return self.min_value + self.nbins * self.bin_width
+
+    @property
+    def labels(self):
+        """Lower edge of each bin"""
+        return self.min_value + self.bin_width * np.arange(self.nbins)
+
+    @property
+    def bin_means(self):
+        """Center of each bin"""
+        return self.labels + self.bin_width / 2.0
+
+    @property
+    def count(self):
+        return int(self.bins.sum())
+
+    @property
+    def total(self):
+        """Approximate sum of the values (every value is its bin center)"""
+        return float(np.dot(self.bins, self.bin_means))
+
+    @property
+    def mean(self):
+        n = self.count
+        return self.total / n if n != 0 else 0.0
+
+    @property
+    def n50(self):
+        return compute_n50_from_distributions([self])
+
+    def percentile(self, q):
+        """
+        Return the center of the bin of the nearest-rank q-th percentile
+        (0 <= q <= 100).
+        """
+        n = self.count
+        if n == 0:
+            return 0.0
+        rank = max(int(math.ceil(q / 100.0 * n)), 1)
+        i = np.searchsorted(np.cumsum(self.bins), rank)
+        return float(self.bin_means[i])
+
+    def rebin(self, min_value, bin_width, nbins):
+        """
+        Return a new distribution on a different grid. The counts of each bin
+        are moved to the bin that contains the bin center. Values outside of
+        the new grid are added to the first or last bin.
+        """
+        indices = np.floor((self.bin_means - min_value) / bin_width)
+        indices = np.clip(indices, 0, nbins - 1).astype(np.int64)
+        bins = np.bincount(indices, weights=self.bins, minlength=nbins)
+        return BinnedDistribution(bins.astype(np.int64), min_value, bin_width)
+
+
+def merge_distributions(distributions):
+    """
+    Merge a list of BinnedDistribution into a single distribution.
+
+    Distributions with the same min value and bin width are added bin by
+    bin. Otherwise, they are re-binned on a common grid that starts at the
+    smallest min value and uses the largest bin width.
+    """
+    if not distributions:
+        raise ValueError("No distributions to merge")
+    min_value = min(d.min_value for d in distributions)
+    bin_width = max(d.bin_width for d in distributions)
+    same_grid = all(d.min_value == min_value and d.bin_width == bin_width
+                    for d in distributions)
+    if same_grid:
+        nbins = max(d.nbins for d in distributions)
+    else:
+        max_value = max(d.max_value for d in distributions)
+        nbins = max(int(math.ceil((max_value - min_value) / bin_width)), 1)
+        distributions = [d.rebin(min_value, bin_width, nbins)
+                         for d in distributions]
+
+    bins = np.zeros(nbins, dtype=np.int64)
+    for d in distributions:
+        bins[:d.nbins] += d.bins
+    return BinnedDistribution(bins, min_value, bin_width)
+
+
+def compute_n50_from_distributions(distributions):
+    """
+    Compute the N50 of the values of a list of BinnedDistribution.
+
+    Every value is approximated by its bin center, except for the last bin
+    of each distribution which uses the lower edge (see compute_n50 for the
+    definition of the N50).
+    """
+    values = []
+    counts = []
+    for d in distributions:
+        if d.nbins == 0:
+            continue
+        v = d.bin_means
+        v[-1] = d.labels[-1]
+        values.append(v)
+        counts.append(d.bins)
+    if not values:
+        return 0
+    values = np.concatenate(values)
+    counts = np.concatenate(counts)
+    nonzero = counts > 0
+    if not nonzero.any():
+        return 0
+    values = values[nonzero]
+    counts = counts[nonzero]
+    order = np.argsort(values, kind='mergesort')
+    values = values[order]
+    cumulative = np.cumsum(values * counts[order])
+    half_total = cumulative[-1] / 2.0
+    return values[np.argmax(cumulative >= half_total)]
@@ -2,6 +2,9 @@
 import os
 import logging
 
+import matplotlib
+import matplotlib.colors
+import matplotlib.lines
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import numpy as np
@@ -259,6 +262,194 @@ def apply_histogram_data(ax, data, bins, axis_labels=('', ''),
             f=data_file, e=err))
 
 
+# Above this many points, apply_density_scatter draws a binned raster
+# instead of one vector marker per point.
+MAX_SCATTER_POINTS = 100000
+
+
+def _to_bin_index(values, vmin, vmax, nbins):
+    """Map values onto [0, nbins) bin indices. Out of range values are
+    returned as -1."""
+    width = (vmax - vmin) / float(nbins)
+    if width <= 0:
+        return np.zeros(values.shape, dtype=np.int64)
+    idx = np.floor((values - vmin) / width)
+    # the upper edge is included in the last bin (same as np.histogram)
+    idx[values == vmax] = nbins - 1
+    idx[(idx < 0) | (idx >= nbins)] = -1
+    return idx.astype(np.int64)
+
+
+def _data_extent(x, y):
+    """Return the (xmin, xmax, ymin, ymax) of the finite points"""
+    def _min_max(values):
+        finite = values[np.isfinite(values)]
+        if finite.size == 0:
+            return 0.0, 1.0
+        vmin, vmax = float(finite.min()), float(finite.max())
+        if vmin == vmax:
+            return vmin - 0.5, vmax + 0.5
+        return vmin, vmax
+    return _min_max(x) + _min_max(y)
+
+
+def _is_valid_extent(extent):
+    """An extent must have a non-zero width and height"""
+    if extent is None:
+        return False
+    xmin, xmax, ymin, ymax = extent
+    return xmin < xmax and ymin < ymax
+
+
+def bin_points(x, y, nbins=(300, 300), extent=None, categories=None,
+               ncategories=1, weights=None):
+    """
+    Bin points into a 2-D count grid in a single vectorized pass.
+
+    :param x: (array) x values
+    :param y: (array) y values
+    :param nbins: (tuple) (nx, ny) number of bins along each axis
+    :param extent: (tuple) (xmin, xmax, ymin, ymax) of the grid. If None
+    (or empty), the extent of the data is used. Points outside the extent are dropped.
+    :param categories: (array, None) Integer category of each point in
+    [0, ncategories). Points in any other category are dropped.
+    :param ncategories: (int) number of categories
+    :param weights: (array, None) number of points at each (x, y)
+
+    :return: (tuple) counts array of shape (ncategories, ny, nx), extent
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    nx, ny = nbins
+    if not _is_valid_extent(extent):
+        extent = _data_extent(x, y)
+    xmin, xmax, ymin, ymax = [float(v) for v in extent]
+
+    keep = np.isfinite(x) & np.isfinite(y)
+    x = np.where(keep, x, xmin)
+    y = np.where(keep, y, ymin)
+    ix = _to_bin_index(x, xmin, xmax, nx)
+    iy = _to_bin_index(y, ymin, ymax, ny)
+    keep &= (ix >= 0) & (iy >= 0)
+
+    flat = iy * nx + ix
+    if categories is not None:
+        cats = np.asarray(categories, dtype=np.int64)
+        keep &= (cats >= 0) & (cats < ncategories)
+        flat += cats * (nx * ny)
+    else:
+        ncategories = 1
+
+    if weights is not None:
+        weights = np.asarray(weights)[keep]
+    counts = np.bincount(flat[keep], weights=weights,
+                         minlength=ncategories * nx * ny)
+    return counts.reshape(ncategories, ny, nx), (xmin, xmax, ymin, ymax)
+
+
+def _single_color_cmap(color):
+    """Colormap ramping from a faint to an opaque version of color"""
+    r, g, b = matplotlib.colors.colorConverter.to_rgb(color)
+    return matplotlib.colors.LinearSegmentedColormap.from_list(
+        "density_{c}".format(c=color), [(r, g, b, 0.2), (r, g, b, 1.0)])
+
+
+def apply_density_scatter(ax, x, y, categories=None, colors=('#226F96',),
+                          max_points=MAX_SCATTER_POINTS, nbins=(300, 300),
+                          extent=None, style='image', jitter=0.0,
+                          alpha=0.5, marker_size=12, weights=None):
+    """
+    Scatter plot that scales to millions of points.
+
+    Inputs with at most max_points points are drawn as a true scatter plot.
+    Larger inputs are binned with bin_points and drawn as one rasterized
+    image per category (style='image') or with ax.hexbin (style='hexbin'),
+    with the color intensity following the log of the point density.
+
+    Arguments:\n
+    axes - required param, see get_fig_axes()\n
+    x, y - arrays of point coordinates\n
+    categories - optional int array of per point color index into colors\n
+    colors - list of colors, one per category\n
+    max_points - point budget for drawing a true scatter plot\n
+    nbins - (nx, ny) grid resolution for the density plot\n
+    extent - (xmin, xmax, ymin, ymax) of the density grid\n
+    style - 'image' or 'hexbin'\n
+    jitter - std dev of the gaussian noise added to scatter points to avoid
+    aliasing of integer values (not used for the density plot)\n
+    weights - optional number of points at each (x, y), e.g., when plotting
+    the distinct values of a large dataset (not used for the scatter plot)\n
+
+    returns:
+        - list of legend handles, one per category (None for categories
+          without any points)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    ncategories = len(colors)
+    if categories is None:
+        categories = np.zeros(x.shape[0], dtype=np.int64)
+    categories = np.asarray(categories)
+
+    handles = []
+    if x.shape[0] <= max_points:
+        for i, color in enumerate(colors):
+            sel = categories == i
+            n = np.count_nonzero(sel)
+            if n == 0:
+                handles.append(None)
+                continue
+            xs, ys = x[sel], y[sel]
+            if jitter:
+                xs = xs + jitter * np.random.randn(n)
+                ys = ys + jitter * np.random.randn(n)
+            handles.append(ax.scatter(xs, ys, c=color, lw=0, alpha=alpha,
+                                      s=marker_size))
+        return handles
+
+    log.info("Plotting density of {n} points (max scatter points {m})".format(
+        n=x.shape[0], m=max_points))
+
+    if style == 'hexbin':
+        if not _is_valid_extent(extent):
+            extent = _data_extent(x.astype(np.float64), y.astype(np.float64))
+        for i, color in enumerate(colors):
+            sel = categories == i
+            if not np.any(sel):
+                handles.append(None)
+                continue
+            C = None if weights is None else np.asarray(weights)[sel]
+            ax.hexbin(x[sel], y[sel], C=C, reduce_C_function=np.sum,
+                      gridsize=nbins[0], extent=extent,
+                      mincnt=1, bins='log', cmap=_single_color_cmap(color),
+                      linewidths=0)
+            handles.append(_density_legend_handle(color))
+        return handles
+
+    counts, extent = bin_points(x, y, nbins=nbins, extent=extent,
+                                categories=categories,
+                                ncategories=ncategories, weights=weights)
+    for i, color in enumerate(colors):
+        grid = counts[i]
+        max_count = grid.max()
+        if max_count == 0:
+            handles.append(None)
+            continue
+        ax.imshow(np.ma.masked_equal(grid, 0), extent=extent, origin='lower',
+                  aspect='auto', interpolation='nearest',
+                  cmap=_single_color_cmap(color),
+                  norm=matplotlib.colors.LogNorm(vmin=1,
+                                                 vmax=max(max_count, 2)))
+        handles.append(_density_legend_handle(color))
+    return handles
+
+
+def _density_legend_handle(color):
+    """Proxy artist so density plots can be used in a legend"""
+    return matplotlib.lines.Line2D([], [], linestyle='none', marker='o',
+                                   color=color, mec=color)
+
+
 def set_tick_label_font_size(ax, minor, major):
     """Convenience function for changing font size of major and minor ticks"""
     for tick in ax.xaxis.get_major_ticks() + ax.yaxis.get_major_ticks():
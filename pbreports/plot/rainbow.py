@@ -15,12 +15,14 @@ import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 
-from pbcore.io import openDataFile, DataSet, CmpH5Reader
+from pbcore.io import openDataFile, DataSet
 from pbcommand.models.report import Report, PlotGroup, Plot
 
-from pbreports.plot.helper import save_figure_with_thumbnail
+from pbreports.plot.helper import (save_figure_with_thumbnail,
+                                   apply_density_scatter)
 from pbreports.io.validators import (validate_file,
                                      validate_output_dir)
+from pbreports.io.cmph5 import read_alignment_columns
 
 log = logging.getLogger(__name__)
 
@@ -46,13 +48,17 @@ def _read_in_file(in_fn, reference=None):
     Returns:
         A 2D array of lengths, percent accuracy and color by MapQV
     """
-    def _openAlignments():
-        if in_fn.endswith(".cmp.h5"):
-            return CmpH5Reader(in_fn)
-        else:
-            return openDataFile(in_fn)
+    if in_fn.endswith(".cmp.h5"):
+        # the cmp.h5 columns are read in bulk
+        columns = read_alignment_columns(in_fn)
+        if reference is not None:
+            columns = columns.take(columns.reference_names == reference)
+        data = np.array([columns.read_lengths, columns.accuracies,
+                         columns.index.MapQV.astype(float)])
+        return data.transpose()
+
     lengths, percent_accs, map_qvs = [], [], []
-    with _openAlignments() as alignments:
+    with openDataFile(in_fn) as alignments:
         for row in alignments:
             if reference == None or row.referenceName == reference:
                 try:
@@ -89,27 +95,29 @@ def _make_plot(data, png_fn, bounds=None, dpi=60, nolegend=False):
     #'#e31a1c', '#fdbf6f', '#ff7f00', '#cab2d6', '#6a3d9a',
     #'#ffff99']
     qv_colors = ['#fc9272', '#fb6a4a', '#ef3b2c', '#cb181d']
-    # qv_colors.extend(qv_colors)
-    # qv_colors.extend(qv_colors)
     # plot by z-values
     qv_min = 1.0
-    #qv_delta = 3.0
-    handles = []
-    labels = []
     # Make sure the max actually gets in a bin
     qv_max = max(data[:, 2]) + 1
     qv_delta = (qv_max - qv_min) / len(qv_colors)
-    for qv_bin, color in zip(
-            #np.arange(qv_min, qv_min + qv_delta * len(qv_colors), qv_delta),
-            np.arange(qv_min, qv_max, qv_delta),
-            qv_colors):
-        if qv_bin > qv_max:
-            break
-        qv_bin_max = qv_bin + qv_delta
-        points = data[(data[:, 2] >= qv_bin) * (data[:, 2] < qv_bin_max), :]
-        if len(points[:, 0]) > 0:
-            l, = axes.plot(points[:, 0], points[:, 1], 'o', c=color, mec=color,
-                           alpha=0.5, ms=2.0)
+    qv_bins = np.arange(qv_min, qv_max, qv_delta)[:len(qv_colors)]
+    # index of the QV bin of every point, -1 for points below qv_min
+    qv_bin_idx = np.floor((data[:, 2] - qv_min) / qv_delta).astype(int)
+    qv_bin_idx[data[:, 2] < qv_min] = -1
+
+    extent = None
+    if bounds:
+        intbounds = map(int, bounds.split(":"))
+        extent = tuple(intbounds)
+    bin_handles = apply_density_scatter(axes, data[:, 0], data[:, 1],
+                                        categories=qv_bin_idx,
+                                        colors=qv_colors[:len(qv_bins)],
+                                        extent=extent, alpha=0.5,
+                                        marker_size=4)
+    handles = []
+    labels = []
+    for qv_bin, l in zip(qv_bins, bin_handles):
+        if l is not None:
             handles.append(l)
             labels.append('QV >= %d' % qv_bin)
     if not nolegend:
@@ -118,10 +126,9 @@ def _make_plot(data, png_fn, bounds=None, dpi=60, nolegend=False):
                     labelspacing=0.3, handlelength=0.5)
         axes.get_legend().get_frame().set_edgecolor('#a0a0a0')
 
-    if bounds:
-        intbounds = map(int, bounds.split(":"))
-        axes.set_xlim(xmin=intbounds[0], xmax=intbounds[1])
-        axes.set_ylim(ymin=intbounds[2], ymax=intbounds[3])
+    if extent is not None:
+        axes.set_xlim(xmin=extent[0], xmax=extent[1])
+        axes.set_ylim(ymin=extent[2], ymax=extent[3])
     axes.set_xlabel('Subread Length / bp')
     axes.set_ylabel('% Accuracy')
     save_figure_with_thumbnail(fig, png_fn, dpi=int(dpi))
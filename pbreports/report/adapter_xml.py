@@ -14,10 +14,12 @@ from pbcommand.common_options import add_debug_option
 from pbcommand.models import FileTypes, get_pbparser
 from pbcommand.cli import pbparser_runner
 from pbcommand.utils import setup_log
-from pbcore.io import DataSet
 
+from pbreports.io.summary_stats import load_dataset_stats
 from pbreports.plot.helper import (get_fig_axes_lpr,
                                    save_figure_with_thumbnail, get_green)
+from pbreports.model.distribution import (BinnedDistribution,
+                                          merge_distributions)
 
 __version__ = '0.1.0'
 
@@ -42,9 +44,17 @@ def to_report(stats_xml, output_dir, dpi=72):
     :rtype: Report
     """
     log.info("Analyzing XML {f}".format(f=stats_xml))
-    dset = DataSet(stats_xml)
-    if not dset.metadata.summaryStats:
-        dset.loadStats(stats_xml)
+    dset = load_dataset_stats(stats_xml)
+    return to_report_from_dataset(dset, output_dir, dpi=dpi)
+
+
+def to_report_from_dataset(dset, output_dir, dpi=72):
+    """
+    Generate the report from a DataSet with the summary stats already
+    loaded (see pbreports.report.stats_xml)
+
+    :rtype: Report
+    """
     if not dset.metadata.summaryStats.medianInsertDists:
         raise RuntimeError("No Pipeline Summary Stats (sts.xml) found")
 
@@ -57,25 +67,26 @@ def to_report(stats_xml, output_dir, dpi=72):
         decimals=2)
 
     plots = []
-    # Pull some histograms (may have dupes (unmergeable distributions)):
-    for i, ins_len_dist in enumerate(
-            dset.metadata.summaryStats.medianInsertDists):
-        # make a bar chart:
-        fig, ax = get_fig_axes_lpr()
-        ax.bar(map(float, ins_len_dist.labels), ins_len_dist.bins,
-               color=get_green(0), edgecolor=get_green(0),
-               width=(ins_len_dist.binWidth * 0.75))
-        ax.set_xlabel('Median Distance Between Adapters')
-        ax.set_ylabel('Reads')
-        png_fn = os.path.join(output_dir,
-                              "interAdapterDist{i}.png".format(i=i))
-        png_base, thumbnail_base = save_figure_with_thumbnail(fig, png_fn,
-                                                              dpi=dpi)
-
-        # build the report:
-        plots.append(Plot("adapter_xml_plot_{i}".format(i=i),
-                          os.path.relpath(png_base, output_dir),
-                          thumbnail=os.path.relpath(thumbnail_base, output_dir)))
+    # Pull some histograms (unmergeable distributions are re-binned on a
+    # common grid):
+    ins_len_dist = merge_distributions(
+        [BinnedDistribution.from_sts_dist(d)
+         for d in dset.metadata.summaryStats.medianInsertDists])
+    # make a bar chart:
+    fig, ax = get_fig_axes_lpr()
+    ax.bar(ins_len_dist.labels, ins_len_dist.bins,
+           color=get_green(0), edgecolor=get_green(0),
+           width=(ins_len_dist.bin_width * 0.75))
+    ax.set_xlabel('Median Distance Between Adapters')
+    ax.set_ylabel('Reads')
+    png_fn = os.path.join(output_dir, "interAdapterDist0.png")
+    png_base, thumbnail_base = save_figure_with_thumbnail(fig, png_fn,
+                                                          dpi=dpi)
+
+    # build the report:
+    plots.append(Plot("adapter_xml_plot_0",
+                      os.path.relpath(png_base, output_dir),
+                      thumbnail=os.path.relpath(thumbnail_base, output_dir)))
 
     plot_groups = [PlotGroup("adapter_xml_plot_group",
                              title="Observed Insert Length Distribution",
@@ -4,9 +4,12 @@ import os
 import sys
 import logging
 import argparse
+import itertools
 from pprint import pformat
 from collections import defaultdict
 
+import numpy as np
+
 from pbcommand.models.report import Report, Table, Column
 from pbcommand.models import FileTypes, get_pbparser
 from pbcommand.cli import pbparser_runner
@@ -22,6 +25,9 @@ __version__ = '0.1.1'
 class Constants(object):
     TOOL_ID = "pbreports.tasks.amplicon_analysis_consensus"
 
+# Number of ZMW mapping rows parsed at a time
+CHUNK_SIZE = 10000
+
 # TODO: I really shouldn't have this much logic in a report file.
 #    this should be moved into FSharp as soon as reasonable
 
@@ -66,31 +72,43 @@ def parse_summary(summary):
     return summary_data
 
 
-def parse_mappings(mappings_file):
-    # Declare a helper function for parsing the heading of the ZMW mappings
-    # file
-    def parse_mappings_header(header):
-        parts = header.strip().split(',')
-        return {i: v for i, v in enumerate(parts[1:])}
+def _sum_mapping_chunk(lines, sums):
+    """
+    Parse the weights of a block of ZMW mapping rows into a 2-D array and
+    add the sum of each column to the sums of each consensus.
+    """
+    weights = ','.join([line.rstrip().split(',', 1)[1] for line in lines])
+    data = np.fromstring(weights, sep=',').reshape(len(lines), len(sums))
+    return sums + data.sum(axis=0)
+
 
-    # Parse and sum the mapping weights from each ZMW
-    position_sums = {}
+def parse_mappings(mappings_file, chunk_size=CHUNK_SIZE):
+    """
+    Sum the mapping weights of the ZMWs to each consensus sequence.
+
+    The rows are read in blocks of chunk_size rows and each block is summed
+    with numpy. The sums can differ from a sequential sum of the weights in
+    the last bits (float rounding).
+
+    :return: dict of consensus name -> sum of the weights
+    """
+    # Parse the consensus names from the heading of the ZMW mappings file
     with open(mappings_file) as handle:
-        consensus_positions = parse_mappings_header(handle.next())
-        for line in handle:
-            weights = [float(w) for w in line.strip().split(',')[1:]]
-            for i, w in enumerate(weights):
-                try:
-                    position_sums[i] += w
-                except:
-                    position_sums[i] = w
-
-    # Convert the sums-by-position into sums-by-consensus and return
-    consensus_sums = {}
-    for key, weight_sum in position_sums.iteritems():
-        consensus = consensus_positions[key]
-        consensus_sums[consensus] = weight_sum
-    return consensus_sums
+        consensus_names = handle.next().strip().split(',')[1:]
+        sums = np.zeros(len(consensus_names))
+        nrows = 0
+        while True:
+            lines = [line for line in itertools.islice(handle, chunk_size)
+                     if line.strip()]
+            if not lines:
+                break
+            sums = _sum_mapping_chunk(lines, sums)
+            nrows += len(lines)
+
+    if nrows == 0:
+        return {}
+    return {consensus: float(weight_sum)
+            for consensus, weight_sum in zip(consensus_names, sums)}
 
 
 def tabulate_results(summary_data, consensus_sums):
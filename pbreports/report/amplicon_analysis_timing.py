@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 """Amplicon Analysis Timing Report"""
 
-from collections import defaultdict
 from pprint import pformat
 import datetime
 import logging
@@ -30,37 +29,71 @@ class Constants(object):
 
 LOG_LINE_REGEX = re.compile('^\d+-\d+-\d+\s+\d+:\d+:\d+')
 LOG_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+LOG_DATE_FORMAT = "%Y-%m-%d"
+
+
+class _TimestampParser(object):
+
+    """
+    Parse the LOG_TIME_FORMAT timestamps of the log lines. The date part is
+    only parsed when it differs from the previous line, and consecutive
+    lines with the same timestamp aren't parsed again.
+    """
+
+    def __init__(self):
+        self._date_part = None
+        self._date = None
+        self._datetime_part = None
+        self._datetime = None
+
+    def parse(self, datetime_part):
+        if datetime_part == self._datetime_part:
+            return self._datetime
+        date_part, time_part = datetime_part.split(None, 1)
+        if date_part != self._date_part:
+            self._date = datetime.datetime.strptime(date_part,
+                                                    LOG_DATE_FORMAT)
+            self._date_part = date_part
+        hour, minute, second = time_part.split(':')
+        self._datetime = self._date.replace(hour=int(hour),
+                                            minute=int(minute),
+                                            second=int(second))
+        self._datetime_part = datetime_part
+        return self._datetime
 
 
 def parse_log_file(log_file):
 
-    # Parse the LAA log lines from the task's logfile
-    time_stamps = defaultdict(list)
+    # Parse the LAA log lines from the task's logfile. Only the first and
+    # last timestamps of each barcode are kept
+    time_extents = {}
+    parser = _TimestampParser()
     with open(log_file) as handle:
-        rollover_count = 0
         for line in handle:
             if not LOG_LINE_REGEX.match(line):
                 continue
 
             # Parse the barcode and timestamp from each line
-            datetime_part = line.split('.')[0]
-            parts = line.strip().split()
+            datetime_part = line.split('.', 1)[0]
+            parts = line.split(None, 3)
             barcode = parts[2] if parts[1].endswith('Barcode') else None
-            line_time = datetime.datetime.strptime(
-                datetime_part, LOG_TIME_FORMAT)
-
-            # Save the results
-            if barcode is not None:
-                time_stamps[barcode].append(line_time)
-            time_stamps['All'].append(line_time)
-
-    # Compute and return the difference between the min and max time for each
-    # barcode
-    time_extents = {}
-    for k, v in time_stamps.iteritems():
-        barcode = k if k == 'All' else k[1:-2]
-        time_extents[barcode] = max(v) - min(v)
-    return time_extents
+            line_time = parser.parse(datetime_part)
+
+            # Update the min and max time of the barcode
+            for key in (barcode, 'All'):
+                if key is None:
+                    continue
+                extent = time_extents.get(key)
+                if extent is None:
+                    time_extents[key] = [line_time, line_time]
+                elif line_time < extent[0]:
+                    extent[0] = line_time
+                elif line_time > extent[1]:
+                    extent[1] = line_time
+
+    # Return the difference between the min and max time for each barcode
+    return {(k if k == 'All' else k[1:-2]): v[1] - v[0]
+            for k, v in time_extents.iteritems()}
 
 
 def create_table(timings):
@@ -3,17 +3,23 @@ import sys
 import time
 import logging
 import argparse
+import functools
 import re
 from pprint import pformat
 
+import numpy as np
+
 from pbcommand.cli import pacbio_args_runner, \
     get_default_argparser_with_base_opts
 from pbcommand.models.report import Report, Table, Column
 from pbcommand.utils import setup_log
-from pbcore.io.BasH5IO import BasH5Reader
+from pbcore.io import openDataFile, BarcodeSet, IndexedBamReader
+from pbcore.io.BasH5IO import BasH5Reader, INSERT_REGION, HQ_REGION
 from pbcore.io.BarcodeH5Reader import BarcodeH5Reader
 
-from pbreports.io.validators import bas_fofn_to_bas_files, validate_fofn
+from pbreports.io.validators import (bas_fofn_to_bas_files, validate_fofn,
+                                     validate_file)
+from pbreports.util import pool_map
 
 
 log = logging.getLogger(__name__)
@@ -95,51 +101,266 @@ def _labels_reads_iterator(bas_barcode_tuple_list, subreads=True):
                     yield label, read
 
 
-def run_to_report(bas_barcode_tuple_list, subreads=True):
-    """ Generate a Report instance from a list of tuples.
+def _search(sorted_keys, keys):
+    """
+    Return the index of each key in sorted_keys and whether the key was
+    found.
+    """
+    if len(sorted_keys) == 0:
+        return (np.zeros(len(keys), dtype=np.int64),
+                np.zeros(len(keys), dtype=bool))
+    i = np.searchsorted(sorted_keys, keys)
+    i[i == len(sorted_keys)] = 0
+    return i, sorted_keys[i] == keys
 
-    :param bas_barcode_tuple_list: [(path/to/movie.bas.h5, path/to/movie.bc.h5), ...]
-    :param subreads: If the ccs fofn is given this needs to be set to False
+
+def _subread_counts_from_region_table(region_table, hole_numbers,
+                                      label_indices, nlabels):
     """
+    Compute the number of subreads and subread bases of each barcode label
+    from a bas.h5 region table.
 
-    class MyRow(object):
+    The subreads of a ZMW are its insert regions clipped to its HQ region
+    (empty subreads are discarded), as in BasH5Reader Zmw.subreads.
 
-        def __init__(self, label):
-            self.label = label
-            self.bases = 0
-            self.reads = 0
+    :param region_table: region table record array (of all the parts)
+    :param hole_numbers: (np.array) sorted hole numbers of the labeled ZMWs
+    :param label_indices: (np.array) label index of each labeled ZMW
+    :return: (reads, bases) arrays indexed by label index
+    """
+    hq = region_table[region_table['regionType'] == HQ_REGION]
+    inserts = region_table[region_table['regionType'] == INSERT_REGION]
+    insert_holes = inserts['holeNumber']
+
+    # HQ region of the ZMW of each insert region
+    order = np.argsort(hq['holeNumber'], kind='mergesort')
+    i, has_hq = _search(hq['holeNumber'][order], insert_holes)
+    hq_start = np.where(has_hq, hq['regionStart'][order][i], 0)
+    hq_end = np.where(has_hq, hq['regionEnd'][order][i], 0)
+    starts = np.maximum(inserts['regionStart'], hq_start)
+    ends = np.minimum(inserts['regionEnd'], hq_end)
+
+    j, is_labeled = _search(hole_numbers, insert_holes)
+    keep = has_hq & is_labeled & (starts < ends)
+    labels = label_indices[j[keep]]
+    reads = np.bincount(labels, minlength=nlabels)
+    bases = np.bincount(labels, weights=(ends - starts)[keep],
+                        minlength=nlabels)
+    return reads, bases.astype(np.int64)
+
+
+def _movie_barcode_counts(bas_barcode_tuple, subreads=True):
+    """
+    Compute the number of reads and bases of each barcode label of a movie.
+    This is run in the worker processes when nproc > 1.
+
+    With subreads, the counts are computed from the region table. The CCS
+    reads are read ZMW by ZMW.
+
+    :param bas_barcode_tuple: (path/to/movie.bas.h5, path/to/movie.bc.h5)
+    :return: dict of label -> (reads, bases)
+    """
+    if not subreads:
+        counts = {}
+        for label, read in _labels_reads_iterator([bas_barcode_tuple],
+                                                  subreads=False):
+            reads, bases = counts.get(label, (0, 0))
+            counts[label] = (reads + 1, bases + len(read))
+        return counts
+
+    bas_file, barcode_file = bas_barcode_tuple
+    log.info("Processing: %s %s" % (bas_file, barcode_file))
+    basH5 = BasH5Reader(bas_file)
+    bcH5 = BarcodeH5Reader(barcode_file)
+
+    labels = list(bcH5.barcodeLabels)
+    hole_numbers, label_indices = [], []
+    for label_index, label in enumerate(labels):
+        for labeledZmw in bcH5.labeledZmwsFromBarcodeLabel(label):
+            hole_numbers.append(labeledZmw.holeNumber)
+            label_indices.append(label_index)
+    hole_numbers = np.array(hole_numbers, dtype=np.int64)
+    label_indices = np.array(label_indices, dtype=np.int64)
+    order = np.argsort(hole_numbers, kind='mergesort')
+
+    region_table = np.concatenate([part.regionTable for part in basH5.parts])
+    reads, bases = _subread_counts_from_region_table(
+        region_table, hole_numbers[order], label_indices[order], len(labels))
+    return {label: (int(reads[i]), int(bases[i]))
+            for i, label in enumerate(labels) if reads[i] > 0}
+
+
+def _bam_file_to_barcode_counts(file_name):
+    """
+    Compute the number of reads and bases of each (forward, reverse) barcode
+    pair of a BAM file from its .pbi. This is run in the worker processes
+    when nproc > 1.
 
-    label2row = {}
+    The read lengths are qEnd - qStart. The .pbi of CCS reads doesn't have
+    the query range, so the CCS read lengths are taken from the records.
 
-    for label, read in _labels_reads_iterator(bas_barcode_tuple_list, subreads=subreads):
-        if not label in label2row:
-            label2row[label] = MyRow(label)
-        label2row[label].bases += len(read)
-        label2row[label].reads += 1
+    :return: dict of (bcForward, bcReverse) -> (reads, bases)
+    """
+    log.info("Processing: {f}".format(f=file_name))
+    with IndexedBamReader(file_name) as bam:
+        if not bam.pbi.hasBarcodeInfo:
+            raise ValueError("{f} doesn't have barcode information".format(
+                f=file_name))
+        bc_forward = np.asarray(bam.bcForward, dtype=np.int64)
+        bc_reverse = np.asarray(bam.bcReverse, dtype=np.int64)
+        read_lengths = (np.asarray(bam.qEnd, dtype=np.int64) -
+                        np.asarray(bam.qStart, dtype=np.int64))
+        if len(read_lengths) and (np.asarray(bam.qStart) < 0).any():
+            read_lengths = np.fromiter((r.peer.query_length for r in bam),
+                                       dtype=np.int64, count=len(bam))
+    return _barcode_pair_counts(bc_forward, bc_reverse, read_lengths)
+
+
+def _barcode_pair_counts(bc_forward, bc_reverse, read_lengths):
+    """
+    Compute the number of reads and bases of each (forward, reverse) barcode
+    pair from the (.pbi) columns of the reads.
 
+    :return: dict of (bcForward, bcReverse) -> (reads, bases)
+    """
+    # reads without a barcode call are -1
+    barcoded = (bc_forward >= 0) & (bc_reverse >= 0)
+    pairs = np.column_stack((bc_forward[barcoded], bc_reverse[barcoded]))
+    if len(pairs) == 0:
+        return {}
+    keys = pairs[:, 0] * (pairs[:, 1].max() + 1) + pairs[:, 1]
+    _, first, inverse = np.unique(keys, return_index=True,
+                                  return_inverse=True)
+    reads = np.bincount(inverse)
+    bases = np.bincount(inverse, weights=read_lengths[barcoded])
+    return {tuple(pairs[k].tolist()): (int(n), int(b))
+            for k, n, b in zip(first, reads, bases)}
+
+
+def _merge_counts(results):
+    """Sum a list of dicts of key -> (reads, bases)"""
+    counts = {}
+    for result in results:
+        for key, (reads, bases) in result.iteritems():
+            n, b = counts.get(key, (0, 0))
+            counts[key] = (n + reads, b + bases)
+    return counts
+
+
+def _to_report(label_counts):
+    """
+    :param label_counts: dict of label -> (reads, bases)
+    """
     columns = [Column('barcode', header="Barcode Name"),
                Column('number_of_reads', header="Reads"),
                Column('number_of_bases', header="Bases")]
 
     table = Table('barcode_table', title='Barcodes', columns=columns)
-    labels = sorted(label2row.keys())
+    labels = sorted(label_counts.keys())
     for label in labels:
-        row = label2row[label]
+        reads, bases = label_counts[label]
         table.add_data_by_column_id('barcode', label)
-        table.add_data_by_column_id('number_of_reads', row.reads)
-        table.add_data_by_column_id('number_of_bases', row.bases)
+        table.add_data_by_column_id('number_of_reads', reads)
+        table.add_data_by_column_id('number_of_bases', bases)
 
     report = Report('barcode', tables=[table])
     return report
 
 
+def run_to_report(bas_barcode_tuple_list, subreads=True, nproc=1):
+    """ Generate a Report instance from a list of tuples.
+
+    :param bas_barcode_tuple_list: [(path/to/movie.bas.h5, path/to/movie.bc.h5), ...]
+    :param subreads: If the ccs fofn is given this needs to be set to False
+    :param nproc: number of processes (the movies are processed in parallel)
+    """
+    log.info("Using {b} with subreads mode? {t}".format(
+        b=bas_barcode_tuple_list, t=subreads))
+    for item in bas_barcode_tuple_list:
+        if len(item) != 2:
+            raise ValueError(
+                "Expected tuple of (path/to/movie.bas.h5, path/to/movie.bc.h5)")
+
+    f = functools.partial(_movie_barcode_counts, subreads=subreads)
+    results = pool_map(f, list(bas_barcode_tuple_list), nproc)
+    return _to_report(_merge_counts(results))
+
+
+def _get_barcode_names(barcode_set):
+    """Return the barcode names of a BarcodeSet (XML or FASTA)"""
+    with BarcodeSet(barcode_set) as ds:
+        return [record.id for record in ds]
+
+
+def run_bam_to_report(reads_file, barcode_set=None, nproc=1):
+    """ Generate a Report instance from barcoded BAM files.
+
+    The reads and bases of each barcode pair are computed from the .pbi
+    bcForward, bcReverse, qStart and qEnd columns. The label of a pair is
+    "{forward}--{reverse}", with the barcode names of the barcode_set if
+    specified (and the barcode indices otherwise).
+
+    :param reads_file: path to a SubreadSet/ConsensusReadSet XML or BAM
+    :param barcode_set: path to a BarcodeSet XML or FASTA
+    :param nproc: number of processes (the BAM files are processed in
+    parallel)
+    """
+    with openDataFile(reads_file) as ds:
+        bam_files = ds.toExternalFiles()
+    pair_counts = _merge_counts(pool_map(_bam_file_to_barcode_counts,
+                                          bam_files, nproc))
+    names = None
+    if barcode_set is not None:
+        names = _get_barcode_names(barcode_set)
+    return _to_report(_to_label_counts(pair_counts, names))
+
+
+def _to_label_counts(pair_counts, names=None):
+    """
+    Label the (forward, reverse) barcode pairs "{forward}--{reverse}", with
+    the barcode names if specified (and the barcode indices otherwise).
+
+    :param pair_counts: dict of (bcForward, bcReverse) -> (reads, bases)
+    :return: dict of label -> (reads, bases)
+    """
+    def _to_name(i):
+        return str(i) if names is None else names[i]
+
+    return {"{f}--{r}".format(f=_to_name(f), r=_to_name(r)): counts
+            for (f, r), counts in pair_counts.iteritems()}
+
+
+def _is_bam_input(file_name):
+    return file_name.endswith((".xml", ".bam"))
+
+
+def _validate_reads_input(file_name):
+    """A bas.h5 FOFN or a SubreadSet/ConsensusReadSet XML or BAM"""
+    if _is_bam_input(file_name):
+        return validate_file(file_name)
+    return validate_fofn(file_name)
+
+
+def _validate_barcode_input(file_name):
+    """A bc.h5 FOFN or a BarcodeSet XML or FASTA"""
+    if file_name.endswith((".xml", ".fasta", ".fa")):
+        return validate_file(file_name)
+    return validate_fofn(file_name)
+
+
 def args_runner(args):
     log.info("Starting {f} version {v} report generation".format(
         f=__file__, v=__version__))
-    # generate list of tuples
-    bas_barcode_tuple_list = _to_tuple_list(args.bas_fofn, args.barcode_fofn)
-    use_subreads = not args.ccs
-    report = run_to_report(bas_barcode_tuple_list, subreads=use_subreads)
+    if _is_bam_input(args.bas_fofn):
+        report = run_bam_to_report(args.bas_fofn, args.barcode_fofn,
+                                   nproc=args.nproc)
+    else:
+        # generate list of tuples
+        bas_barcode_tuple_list = _to_tuple_list(args.bas_fofn,
+                                                args.barcode_fofn)
+        use_subreads = not args.ccs
+        report = run_to_report(bas_barcode_tuple_list, subreads=use_subreads,
+                               nproc=args.nproc)
     log.info(pformat(report.to_dict()))
     report.write_json(args.report_json)
     return 0
@@ -148,14 +369,20 @@ def args_runner(args):
 def get_parser():
     p = get_default_argparser_with_base_opts(
         version=__version__, description=__doc__)
-    p.add_argument('bas_fofn', help="Bas h5 FOFN.", type=validate_fofn)
-    p.add_argument('barcode_fofn', type=validate_fofn, help="Barcode h5 FOFN.")
+    p.add_argument('bas_fofn', type=_validate_reads_input,
+                   help="Bas h5 FOFN, or barcoded SubreadSet/ConsensusReadSet "
+                        "XML or BAM.")
+    p.add_argument('barcode_fofn', type=_validate_barcode_input,
+                   help="Barcode h5 FOFN, or BarcodeSet XML or FASTA (for a "
+                        "BAM input).")
     p.add_argument('report_json',
                    help="Path to write Report json output.")
     # this is necessary for BasH5Reader to handle the differences between the
     # .ccs.h5 files and .bas.h5 files.
     p.add_argument('--ccs', action='store_true',
                    help='Use consensus reads instead of subreads.')
+    p.add_argument('--nproc', default=1, type=int,
+                   help="Number of processes used to read the movies.")
     return p
 
 
@@ -16,18 +16,21 @@ import numpy as np
 
 from pbcommand.models.report import (Report, Table, Column, Attribute, Plot,
                                      PlotGroup)
-from pbcommand.models import FileTypes, get_pbparser
+from pbcommand.models import FileTypes, SymbolTypes, get_pbparser
 from pbcommand.cli import pbparser_runner
 from pbcommand.utils import setup_log
 from pbcore.io import ConsensusReadSet
 
 from pbreports.plot.helper import (get_fig_axes_lpr, apply_histogram_data,
-                                   get_blue, get_green, Line, apply_line_data)
-from pbreports.util import accuracy_as_phred_qv
+                                   get_blue, get_green, apply_density_scatter)
+from pbreports.util import accuracy_as_phred_qv, pool_map
 
 log = logging.getLogger(__name__)
 __version__ = '0.44'
 
+# accuracies are rounded to this number of decimals in the histograms
+ACCURACY_DECIMALS = 5
+
 
 class Constants(object):
 
@@ -114,10 +117,153 @@ class MovieResult(object):
         return "<" + str(self) + " > "
 
 
-# FIXME(nechols)(2016-02-18): this is very inefficient
+def _count_values(columns, counts=None):
+    """
+    Count the distinct rows of equal length arrays.
+
+    :param columns: list of np.array
+    :param counts: (np.array) count of each row (default 1)
+    :return: (list of np.array of the distinct rows (sorted), np.array of
+    counts)
+    """
+    n = len(columns[0])
+    if counts is None:
+        counts = np.ones(n, dtype=np.int64)
+    if n == 0:
+        return [c[:0] for c in columns], np.zeros(0, dtype=np.int64)
+    order = np.lexsort(columns[::-1])
+    columns = [c[order] for c in columns]
+    is_first = np.zeros(n, dtype=np.bool)
+    is_first[0] = True
+    for c in columns:
+        is_first[1:] |= c[1:] != c[:-1]
+    groups = np.cumsum(is_first) - 1
+    counts = np.bincount(groups, weights=counts[order]).astype(np.int64)
+    return [c[is_first] for c in columns], counts
+
+
+class MovieSummary(object):
+
+    """
+    Compact summary of the CCS reads of a movie.
+
+    Instead of the per read arrays of MovieResult, only the totals and the
+    counts of the distinct read lengths and (number of passes, accuracy)
+    pairs are kept. Summaries of the same movie (e.g., from different BAM
+    files) can be merged.
+    """
+
+    def __init__(self, movie_name, nreads, total_bases, accuracy_sum,
+                 num_passes_sum, read_length_counts, passes_accuracy_counts):
+        self.movie_name = movie_name
+        self.nreads = nreads
+        self.total_bases = total_bases
+        self.accuracy_sum = accuracy_sum
+        self.num_passes_sum = num_passes_sum
+        # ([read lengths], counts)
+        self.read_length_counts = read_length_counts
+        # ([num passes, accuracies], counts)
+        self.passes_accuracy_counts = passes_accuracy_counts
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, m=self.movie_name,
+                  n=self.nreads)
+        return "<{k} {m} nreads:{n} >".format(**_d)
+
+    @staticmethod
+    def from_movie_result(movie_result):
+        m = movie_result
+        accuracies = np.round(m.accuracies, decimals=ACCURACY_DECIMALS)
+        return MovieSummary(m.movie_name,
+                            len(m.read_lengths),
+                            int(m.read_lengths.sum()),
+                            float(m.accuracies.sum()),
+                            int(m.num_passes.sum()),
+                            _count_values([m.read_lengths]),
+                            _count_values([m.num_passes, accuracies]))
+
+    @staticmethod
+    def merge(movie_name, summaries):
+        if not summaries:
+            return MovieSummary.from_movie_result(MovieResult(
+                None, movie_name, np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.float), np.zeros(0, dtype=np.int64)))
+
+        def _merge_counts(counts):
+            ncolumns = len(counts[0][0])
+            columns = [np.concatenate([c[0][i] for c in counts])
+                       for i in xrange(ncolumns)]
+            return _count_values(columns,
+                                 np.concatenate([c[1] for c in counts]))
+
+        return MovieSummary(
+            movie_name,
+            sum(m.nreads for m in summaries),
+            sum(m.total_bases for m in summaries),
+            sum(m.accuracy_sum for m in summaries),
+            sum(m.num_passes_sum for m in summaries),
+            _merge_counts([m.read_length_counts for m in summaries]),
+            _merge_counts([m.passes_accuracy_counts for m in summaries]))
+
+    def _mean(self, total):
+        return total / float(self.nreads) if self.nreads > 0 else 0.0
+
+    @property
+    def mean_read_length(self):
+        return self._mean(self.total_bases)
+
+    @property
+    def mean_accuracy(self):
+        return self._mean(self.accuracy_sum)
+
+    @property
+    def mean_num_passes(self):
+        return self._mean(self.num_passes_sum)
+
+    @property
+    def accuracy_counts(self):
+        """([accuracies], counts)"""
+        (_, accuracies), counts = self.passes_accuracy_counts
+        return _count_values([accuracies], counts)
+
+    @property
+    def num_passes_counts(self):
+        """([num passes], counts)"""
+        (num_passes, _), counts = self.passes_accuracy_counts
+        return _count_values([num_passes], counts)
+
+
+def _group_by_movie(read_groups, rg_ids):
+    """
+    Group reads by movie name.
+
+    :param read_groups: BAM readGroupTable
+    :param rg_ids: (np.array) read group id of each read (e.g., pbi qId)
+    :return: list of (movie name, np.array of read indices) sorted by movie
+    name
+    """
+    movie_names = sorted(set(rg["MovieName"] for rg in read_groups))
+    ids = np.array([rg["ID"] for rg in read_groups])
+    movie_indices = np.array([movie_names.index(rg["MovieName"])
+                              for rg in read_groups], dtype=np.int64)
+    # movie index of each read
+    sorter = np.argsort(ids)
+    read_movies = movie_indices[sorter][np.searchsorted(ids, rg_ids,
+                                                        sorter=sorter)]
+    order = np.argsort(read_movies, kind='mergesort')
+    ends = np.cumsum(np.bincount(read_movies, minlength=len(movie_names)))
+    starts = ends - np.bincount(read_movies, minlength=len(movie_names))
+    return [(movie_name, order[start:end]) for movie_name, start, end
+            in zip(movie_names, starts, ends)]
+
+
 def _bam_file_to_movie_results(file_name):
     """
     Read what is assumed to be a single BAM file (as a ConsensusReadSet).
+
+    The records are read once (for the read length and number of passes).
+    The read quality and read group are taken from the pbi, and the reads
+    are split by movie with a single sort.
     """
     from pbcore.io import IndexedBamReader
     results = []
@@ -125,52 +271,65 @@ def _bam_file_to_movie_results(file_name):
         for rg in bam.readGroupTable:
             assert rg["ReadType"] == "CCS"
 
-        movies = list(set([rg["MovieName"] for rg in bam.readGroupTable]))
-        for movie_name in movies:
-            def _base_calls():
-                for r in bam:
-                    if r.movieName == movie_name:
-                        yield r.peer.query_length
+        nreads = len(bam)
+        read_lengths = np.zeros(nreads, dtype=np.int64)
+        num_passes = np.zeros(nreads, dtype=np.int64)
+        for i, r in enumerate(bam):
+            read_lengths[i] = r.peer.query_length
+            num_passes[i] = r.numPasses
+        accuracies = np.asarray(bam.readQual, dtype=np.float)
 
-            def _num_passes():
-                for r in bam:
-                    if r.movieName == movie_name:
-                        yield r.numPasses
+        for movie_name, indices in _group_by_movie(bam.readGroupTable,
+                                                   np.asarray(bam.qId)):
+            results.append(MovieResult(
+                file_name, movie_name, read_lengths[indices],
+                accuracies[indices], num_passes[indices]))
+        return results
 
-            def _accuracy():
-                for r in bam:
-                    if r.movieName == movie_name:
-                        yield r.readScore
 
-            read_lengths = np.fromiter(_base_calls(), dtype=np.int64, count=-1)
-            num_passes = np.fromiter(_num_passes(), dtype=np.int64, count=-1)
-            accuracy = np.fromiter(_accuracy(), dtype=np.float, count=-1)
+def _bam_file_to_movie_summaries(file_name):
+    """
+    Return a MovieSummary for each movie of a BAM file. This is run in the
+    worker processes when nproc > 1.
+    """
+    return [MovieSummary.from_movie_result(m)
+            for m in _bam_file_to_movie_results(file_name)]
 
-            results.append(MovieResult(
-                file_name, movie_name, read_lengths, accuracy, num_passes))
-        return results
 
+def _compute_movie_summaries(bam_files, nproc=1):
+    """
+    Summarize the CCS reads of the BAM files by movie.
+
+    With nproc > 1, the BAM files are processed by a pool of worker
+    processes. The summaries of the same movie are merged.
+
+    :return: list of MovieSummary sorted by movie name
+    """
+    results = pool_map(_bam_file_to_movie_summaries, bam_files, nproc)
 
-def _movie_results_to_attributes(movie_results):
+    summaries = OrderedDict()
+    for movie_summary in (m for ms in results for m in ms):
+        summaries.setdefault(movie_summary.movie_name, []).append(
+            movie_summary)
+    return [MovieSummary.merge(movie_name, summaries[movie_name])
+            for movie_name in sorted(summaries.keys())]
+
+
+def _movie_summaries_to_attributes(movie_summaries):
     """Create the necessary attributes for the CCS report"""
-    rs = [m.read_lengths for m in movie_results]
-    read_lengths = np.concatenate(rs)
-    ac = [m.accuracies for m in movie_results]
-    accuracies = np.concatenate(ac)
-    npass = [m.num_passes for m in movie_results]
-    num_passes = np.concatenate(npass)
-
-    m_readlength = int(read_lengths.mean()) if read_lengths.size > 0 else 0.0
+    m = MovieSummary.merge("all", movie_summaries)
+
+    m_readlength = int(m.mean_read_length) if m.nreads > 0 else 0.0
     m_accuracy = np.round(
-        accuracies.mean(), decimals=4) if accuracies.size > 0 else 0.0
-    m_npasses = np.round(num_passes.mean()) if num_passes.size > 0 else 0.0
+        m.mean_accuracy, decimals=4) if m.nreads > 0 else 0.0
+    m_npasses = np.round(m.mean_num_passes) if m.nreads > 0 else 0.0
     m_qv = int(round(accuracy_as_phred_qv(float(m_accuracy))))
 
     n_reads_at = Attribute(
-        Constants.A_NREADS, read_lengths.shape[0], name=Constants.ATTR_LABELS[
+        Constants.A_NREADS, m.nreads, name=Constants.ATTR_LABELS[
             Constants.A_NREADS])
     t_bases_at = Attribute(
-        Constants.A_TOTAL_BASES, read_lengths.sum(), name=Constants.ATTR_LABELS[Constants.A_TOTAL_BASES])
+        Constants.A_TOTAL_BASES, m.total_bases, name=Constants.ATTR_LABELS[Constants.A_TOTAL_BASES])
     m_readlength_at = Attribute(
         Constants.A_MEAN_READLENGTH, m_readlength, name=Constants.ATTR_LABELS[Constants.A_MEAN_READLENGTH])
     m_accuracy_at = Attribute(
@@ -187,8 +346,8 @@ def _movie_results_to_attributes(movie_results):
     return attributes
 
 
-def _movie_results_to_table(movie_results):
-    """Group movie results by movie name and build a report table.
+def _movie_summaries_to_table(movie_summaries):
+    """Build a report table with one row per movie summary.
 
     Table has movie name, # of CCS bases, Total CCS bases,
     mean CCS readlength and mean CCS accuracy.
@@ -207,31 +366,17 @@ def _movie_results_to_table(movie_results):
 
     table = Table(Constants.T_ID, title="Consensus reads", columns=columns)
 
-    movie_names = {m.movie_name for m in movie_results}
-
-    for movie_name in movie_names:
-        rs = [
-            m.read_lengths for m in movie_results if m.movie_name == movie_name]
-        read_lengths = np.concatenate(rs)
-        ac = [
-            m.accuracies for m in movie_results if m.movie_name == movie_name]
-        accuracies = np.concatenate(ac)
-        npass = [
-            m.num_passes for m in movie_results if m.movie_name == movie_name]
-        num_passes = np.concatenate(npass)
-
-        m_readlength = int(
-            read_lengths.mean()) if read_lengths.size > 0 else 0.0
+    for m in movie_summaries:
+        m_readlength = int(m.mean_read_length) if m.nreads > 0 else 0.0
         m_accuracy = np.round(
-            accuracies.mean(), decimals=4) if accuracies.size > 0 else 0.0
+            m.mean_accuracy, decimals=4) if m.nreads > 0 else 0.0
         m_npasses = np.round(
-            num_passes.mean(), decimals=3) if num_passes.size > 0 else 0.0
-        m_qv = int(round(accuracy_as_phred_qv(float(accuracies.mean()))))
+            m.mean_num_passes, decimals=3) if m.nreads > 0 else 0.0
+        m_qv = int(round(accuracy_as_phred_qv(float(m.mean_accuracy))))
 
-        table.add_data_by_column_id(Constants.C_MOVIE_NAME, movie_name)
-        table.add_data_by_column_id(Constants.A_NREADS, read_lengths.shape[0])
-        table.add_data_by_column_id(
-            Constants.A_TOTAL_BASES, read_lengths.sum())
+        table.add_data_by_column_id(Constants.C_MOVIE_NAME, m.movie_name)
+        table.add_data_by_column_id(Constants.A_NREADS, m.nreads)
+        table.add_data_by_column_id(Constants.A_TOTAL_BASES, m.total_bases)
         table.add_data_by_column_id(Constants.A_MEAN_READLENGTH, m_readlength)
         table.add_data_by_column_id(Constants.A_MEAN_ACCURACY, m_accuracy)
         table.add_data_by_column_id(Constants.A_MEAN_QV, m_qv)
@@ -240,17 +385,19 @@ def _movie_results_to_table(movie_results):
     return table
 
 
-def _make_histogram(datum, axis_labels, nbins, barcolor):
+def _make_histogram(datum, axis_labels, nbins, barcolor, weights=None):
     """Create a fig, ax instance and generate a histogram.
 
     :param datum: np.array
     :param axis_labels: (tuple of str) (axis label, y axis label)
+    :param weights: (np.array) optional count of each value of datum
     :return: matplotlib fig, ax
     """
     # axis_labels = ('Median Distance Between Adapters', 'Pre-Filter Reads')
     fig, ax = get_fig_axes_lpr()
     apply_histogram_data(
-        ax, datum, nbins, axis_labels=axis_labels, barcolor=barcolor)
+        ax, datum, nbins, axis_labels=axis_labels, barcolor=barcolor,
+        weights=weights)
     return fig, ax
 
 
@@ -263,13 +410,15 @@ def to_cdf(points):
     return datum
 
 
-def _make_histogram_with_cdf(datum, axis_labels, nbins, barcolor):
+def _make_histogram_with_cdf(datum, axis_labels, nbins, barcolor,
+                             weights=None):
     """
 
     """
-    fig, ax = _make_histogram(datum, axis_labels, nbins, barcolor)
+    fig, ax = _make_histogram(datum, axis_labels, nbins, barcolor,
+                              weights=weights)
 
-    bins, bin_edges = np.histogram(datum, bins=nbins)
+    bins, bin_edges = np.histogram(datum, bins=nbins, weights=weights)
 
     rax = ax.twinx()
 
@@ -292,10 +441,11 @@ def _make_histogram_with_cdf(datum, axis_labels, nbins, barcolor):
     return fig, ax
 
 
-def _custom_histogram_with_cdf(new_rlabel, threshold, datum, axis_labels, nbins, barcolor):
-    fig, ax = _make_histogram(datum, axis_labels, nbins, barcolor)
+def _custom_histogram_with_cdf(new_rlabel, threshold, datum, axis_labels, nbins, barcolor, weights=None):
+    fig, ax = _make_histogram(datum, axis_labels, nbins, barcolor,
+                              weights=weights)
 
-    bins, bin_edges = np.histogram(datum, bins=nbins)
+    bins, bin_edges = np.histogram(datum, bins=nbins, weights=weights)
 
     rax = ax.twinx()
 
@@ -333,31 +483,28 @@ def _custom_histogram_with_cdf(new_rlabel, threshold, datum, axis_labels, nbins,
 def scatter_plot_accuracy_vs_numpasses(data,
                                        axis_labels=(
                                            "Number of passes", "Predicted accuracy (Phred QV)"),
-                                       nbins=None, barcolor=None):
+                                       nbins=None, barcolor=None, weights=None):
     """
     """
     npasses, accuracy = data
     qvs = accuracy_as_phred_qv(accuracy)
     fig, ax = get_fig_axes_lpr()
-    data = [Line(xData=npasses,
-                 yData=qvs,
-                 style='o')]
-    apply_line_data(
-        ax=ax,
-        line_models=data,
-        axis_labels=axis_labels,
-        only_whole_ticks=False)
+    apply_density_scatter(ax, npasses, qvs, colors=(get_blue(3),),
+                          alpha=1.0, marker_size=20, weights=weights)
+    ax.set_xlabel(axis_labels[0])
+    ax.set_ylabel(axis_labels[1])
     return fig, ax
 
 
-def __create_plot(_make_plot_func, plot_id, axis_labels, nbins, plot_name, barcolor, datum, output_dir, dpi=72):
+def __create_plot(_make_plot_func, plot_id, axis_labels, nbins, plot_name, barcolor, datum, output_dir, dpi=72, weights=None):
     """Internal function used to create Plot instances.
 
     This should probably have a special container class to capture all the
     plot config options.
     """
 
-    fig, ax = _make_plot_func(datum, axis_labels, nbins, barcolor)
+    fig, ax = _make_plot_func(datum, axis_labels, nbins, barcolor,
+                              weights=weights)
     path = os.path.join(output_dir, plot_name)
     try:
         fig.tight_layout()
@@ -402,25 +549,28 @@ create_scatter_plot = functools.partial(__create_plot,
                                         Constants.I_CCS_SCATTER_PLOT, get_blue(3))
 
 
-def to_report(ccs_subread_set, output_dir):
+def to_report(ccs_subread_set, output_dir, nproc=1):
     bam_files = list(ccs_subread_set.toExternalFiles())
     log.info("Generating report from files: {f}".format(f=bam_files))
-    movie_results = []
-    for fn in bam_files:
-        movie_results.extend(_bam_file_to_movie_results(fn))
-    log.debug("\n" + pformat(movie_results))
-
-    rs = [m.read_lengths for m in movie_results]
-    readlengths = np.concatenate(rs)
-    ac = [m.accuracies for m in movie_results]
-    accuracies = np.concatenate(ac)
-    ps = [m.num_passes for m in movie_results]
-    num_passes = np.concatenate(ps)
-
-    readlength_plot = create_readlength_plot(readlengths, output_dir)
-    accuracy_plot = create_accuracy_plot(accuracies, output_dir)
-    npasses_plot = create_npasses_plot(num_passes, output_dir)
-    scatter_plot = create_scatter_plot((num_passes, accuracies), output_dir)
+    movie_summaries = _compute_movie_summaries(bam_files, nproc=nproc)
+    log.debug("\n" + pformat(movie_summaries))
+
+    m = MovieSummary.merge("all", movie_summaries)
+    (readlengths, ), readlength_counts = m.read_length_counts
+    (accuracies, ), accuracy_counts = m.accuracy_counts
+    (num_passes, ), num_passes_counts = m.num_passes_counts
+    (scatter_num_passes, scatter_accuracies), scatter_counts = \
+        m.passes_accuracy_counts
+
+    readlength_plot = create_readlength_plot(readlengths, output_dir,
+                                             weights=readlength_counts)
+    accuracy_plot = create_accuracy_plot(accuracies, output_dir,
+                                         weights=accuracy_counts)
+    npasses_plot = create_npasses_plot(num_passes, output_dir,
+                                       weights=num_passes_counts)
+    scatter_plot = create_scatter_plot(
+        (scatter_num_passes, scatter_accuracies), output_dir,
+        weights=scatter_counts)
 
     readlength_group = PlotGroup(Constants.PG_READLENGTH,
                                  title="Consensus Read Length",
@@ -438,10 +588,10 @@ def to_report(ccs_subread_set, output_dir):
                               thumbnail=scatter_plot.thumbnail,
                               title="Number of Passes vs. Predicted Accuracy")
 
-    table = _movie_results_to_table(movie_results)
+    table = _movie_summaries_to_table(movie_summaries)
     log.info(str(table))
 
-    attributes = _movie_results_to_attributes(movie_results)
+    attributes = _movie_summaries_to_attributes(movie_summaries)
 
     report = Report(Constants.R_ID, tables=[table], attributes=attributes,
                     plotgroups=[readlength_group, accuracy_group,
@@ -453,12 +603,13 @@ def to_report(ccs_subread_set, output_dir):
 def run_report(
         input_file,
         report_json,
-        output_dir):
+        output_dir,
+        nproc=1):
     log.info("Running {f} v{v}.".format(
         f=os.path.basename(__file__), v=__version__))
     report = None
     ds = ConsensusReadSet(input_file)
-    report = to_report(ds, output_dir)
+    report = to_report(ds, output_dir, nproc=nproc)
     log.info(pformat(report.to_dict()))
     report.write_json(report_json)
     return 0
@@ -468,14 +619,16 @@ def args_runner(args):
     return run_report(
         input_file=args.ccs_in,
         report_json=args.report_json,
-        output_dir=args.output_dir)
+        output_dir=args.output_dir,
+        nproc=args.nproc)
 
 
 def resolved_tool_contract_runner(rtc):
     return run_report(
         input_file=rtc.task.input_files[0],
         report_json=rtc.task.output_files[0],
-        output_dir=os.path.dirname(rtc.task.output_files[0]))
+        output_dir=os.path.dirname(rtc.task.output_files[0]),
+        nproc=rtc.task.nproc)
 
 
 def get_parser():
@@ -486,7 +639,8 @@ def get_parser():
         version=__version__,
         name=Constants.TOOL_NAME,
         description=__doc__,
-        driver_exe=Constants.DRIVER_EXE)
+        driver_exe=Constants.DRIVER_EXE,
+        nproc=SymbolTypes.MAX_NPROC)
     ap = p.arg_parser.parser
     p.add_input_file_type(FileTypes.DS_CCS, "ccs_in",
                           name="ConsensusReadSet",
@@ -498,6 +652,9 @@ def get_parser():
     ap.add_argument('-o', '--output-dir', dest='output_dir',
                     default=os.getcwd(),
                     help="Path to write histogram images to.")
+    # get_pbparser only declares nproc in the tool contract
+    ap.add_argument('--nproc', default=1, type=int,
+                    help="Number of processes used to read the BAM files.")
     # ap.add_argument('--debug', action='store_true',
     #               help='Flag to debug to stdout.')
     return p
@@ -2,6 +2,7 @@
 
 from collections import OrderedDict
 import functools
+import itertools
 import argparse
 import logging
 import os
@@ -16,39 +17,95 @@ from pbcommand.utils import setup_log
 from pbcore.io.FastqIO import FastqReader
 
 from pbreports.plot.helper import get_fig_axes_lpr
+from pbreports.util import pool_map
 
 log = logging.getLogger(__name__)
 __version__ = '1.2'
 
 
+# Largest Phred+33 encoded quality value
+MAX_QV = 93
+# Number of reads accumulated before the counts are updated
+CHUNK_SIZE = 10000
+
+
 class FastqStats(object):
 
-    def __init__(self, reads, qvs, file_name):
-        """Simple container class"""
-        self.qvs = qvs
-        # these are read lengths
-        self.reads = reads
+    def __init__(self, file_name, qv_counts, read_length_counts):
+        """Simple container class
+
+        :param qv_counts: number of bases for each quality value (0-93)
+        :param read_length_counts: number of reads for each read length
+        """
         self.file_name = file_name
+        self.qv_counts = qv_counts
+        self.read_length_counts = read_length_counts
 
     @staticmethod
     def from_file(file_name):
-        qvs, reads = _get_stats(file_name)
-        return FastqStats(reads, qvs, file_name)
+        return _get_stats(file_name)
+
+    @property
+    def nreads(self):
+        return int(self.read_length_counts.sum())
+
+    @property
+    def total_bases(self):
+        return int(np.dot(np.arange(len(self.read_length_counts)),
+                          self.read_length_counts))
+
+    @property
+    def mean_readlength(self):
+        n = self.nreads
+        return self.total_bases / float(n) if n != 0 else 0.0
+
+    @property
+    def mean_qv(self):
+        n = self.qv_counts.sum()
+        if n == 0:
+            return 0.0
+        return np.dot(np.arange(len(self.qv_counts)), self.qv_counts) / float(n)
 
     def __str__(self):
         outs = list()
-        outs.append("Reads           :{n}".format(n=self.reads.shape[0]))
-        outs.append("Mean readlength :{m}".format(int(np.sum(self.reads))))
-        outs.append("Total bases     :{m}".format(m=int(np.sum(self.reads))))
-        outs.append("Mean qv         :{m:.2f}".format(m=self.qvs.mean()))
+        outs.append("Reads           :{n}".format(n=self.nreads))
+        outs.append("Mean readlength :{m}".format(m=int(self.mean_readlength)))
+        outs.append("Total bases     :{m}".format(m=self.total_bases))
+        outs.append("Mean qv         :{m:.2f}".format(m=self.mean_qv))
         return "\n".join(outs)
 
 
-def _get_stats(fastq_file_name):
-    raw_qvs = np.array([r.quality for r in FastqReader(fastq_file_name)])
-    qvs = np.hstack(raw_qvs)
-    reads = np.array([len(r.sequence) for r in FastqReader(fastq_file_name)])
-    return qvs, reads
+def _add_counts(counts, values, minlength=0):
+    """Add the bincount of values to counts (which is grown if necessary)"""
+    c = np.bincount(values, minlength=minlength).astype(np.int64)
+    if len(c) > len(counts):
+        c[:len(counts)] += counts
+        return c
+    counts[:len(c)] += c
+    return counts
+
+
+def _get_stats(fastq_file_name, chunk_size=CHUNK_SIZE):
+    """
+    Compute the quality value and read length counts of a FASTQ file in a
+    single pass. Only chunk_size reads are held in memory at a time.
+
+    :rtype: FastqStats
+    """
+    qv_counts = np.zeros(MAX_QV + 1, dtype=np.int64)
+    read_length_counts = np.zeros(0, dtype=np.int64)
+
+    it = iter(FastqReader(fastq_file_name))
+    while True:
+        records = list(itertools.islice(it, chunk_size))
+        if not records:
+            break
+        read_length_counts = _add_counts(
+            read_length_counts, [len(r.sequence) for r in records])
+        qvs = np.concatenate([r.quality for r in records])
+        _add_counts(qv_counts, np.clip(qvs, 0, MAX_QV), minlength=MAX_QV + 1)
+
+    return FastqStats(fastq_file_name, qv_counts, read_length_counts)
 
 
 def _generate_histogram(datum, title, xlabel, ylabel=None):
@@ -69,7 +126,10 @@ def __generate_histogram_comparison(method_name, title, xlabel, list_fastq_stats
     hs = OrderedDict()
     for fastq_stat in list_fastq_stats:
         label = os.path.basename(fastq_stat.file_name)
-        h = ax.hist(getattr(fastq_stat, method_name),
+        # the counts are used as weights of the (distinct) values
+        counts = getattr(fastq_stat, method_name)
+        values = np.flatnonzero(counts)
+        h = ax.hist(values, weights=counts[values],
                     alpha=alpha, bins=85, label=label)
         hs[label] = h
 
@@ -78,9 +138,9 @@ def __generate_histogram_comparison(method_name, title, xlabel, list_fastq_stats
     return fig, ax
 
 to_qv_histogram = functools.partial(
-    __generate_histogram_comparison, 'qvs', "Quality Values", "Quality Values")
+    __generate_histogram_comparison, 'qv_counts', "Quality Values", "Quality Values")
 to_read_length_histogram = functools.partial(
-    __generate_histogram_comparison, 'reads', "Read Length", "Read Length")
+    __generate_histogram_comparison, 'read_length_counts', "Read Length", "Read Length")
 
 
 def _generate_table(list_fastq_stats):
@@ -95,26 +155,30 @@ def _generate_table(list_fastq_stats):
     for fastq_stat in list_fastq_stats:
         table.add_data_by_column_id(
             'file_name', os.path.basename(fastq_stat.file_name))
-        table.add_data_by_column_id('n_reads', fastq_stat.reads.shape[0])
-        table.add_data_by_column_id(
-            'total_bases', int(np.sum(fastq_stat.reads)))
+        table.add_data_by_column_id('n_reads', fastq_stat.nreads)
+        table.add_data_by_column_id('total_bases', fastq_stat.total_bases)
         table.add_data_by_column_id(
-            'mean_readlength', int(fastq_stat.reads.mean()))
+            'mean_readlength', int(fastq_stat.mean_readlength))
         table.add_data_by_column_id('mean_qv', np.round(
-            fastq_stat.qvs.mean(), decimals=2))
+            fastq_stat.mean_qv, decimals=2))
 
     return table
 
 
-def fastq_files_to_stats(fastq_files):
-    fastq_stats = {file_name: FastqStats.from_file(
-        file_name) for file_name in fastq_files}
-    return fastq_stats
+def fastq_files_to_stats(fastq_files, nproc=1):
+    """
+    Compute the FastqStats of each file. With nproc > 1, the files are
+    processed by a pool of worker processes.
+
+    :return: OrderedDict of file name -> FastqStats (in the input order)
+    """
+    results = pool_map(_get_stats, fastq_files, nproc)
+    return OrderedDict(zip(fastq_files, results))
 
 
-def to_report(fastq_files, qv_hist=None, readlength_hist=None):
+def to_report(fastq_files, qv_hist=None, readlength_hist=None, nproc=1):
     """Generate a histogram of read lengths and quality values"""
-    fastq_stats = fastq_files_to_stats(fastq_files)
+    fastq_stats = fastq_files_to_stats(fastq_files, nproc=nproc)
 
     table = _generate_table(fastq_stats.values())
     log.info(str(table))
@@ -151,7 +215,7 @@ def args_runner(args):
     # weak attempt to make the plots labels show up consistently
     fastq_files.sort()
     report = to_report(fastq_files, qv_hist=qv_hist,
-                       readlength_hist=readlength_hist)
+                       readlength_hist=readlength_hist, nproc=args.nproc)
 
     log.info("writing report to {j}".format(j=json_report))
     report.write_json(json_report)
@@ -169,6 +233,8 @@ def get_parser():
     p.add_argument('-r', '--report', type=str,
                    default="ccs_validator_report.json",
                    help="Name of Json report file.")
+    p.add_argument('--nproc', default=1, type=int,
+                   help="Number of processes used to parse the FASTQ files.")
     p.add_argument('--debug', action='store_true', help='Debug to stdout.')
     return p
 
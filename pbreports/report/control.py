@@ -3,7 +3,6 @@ import argparse
 import logging
 import os
 import math
-import array
 import sys
 
 import matplotlib.patches as mp
@@ -19,6 +18,7 @@ from pbcore.io import CmpH5Reader
 from pbreports.io.validators import validate_dir
 from pbreports.io.validators import validate_file
 from pbreports.io.filtered_summary_reader import FilteredSummaryReader
+from pbreports.io.cmph5 import AlignmentColumns
 from pbreports.plot.helper import (get_fig_axes_lpr,
                                    save_figure_with_thumbnail,
                                    set_tick_label_font_size,
@@ -37,17 +37,23 @@ CSV_COLUMN_MAP = {"ReadId": ("|S128", str),
                   "ReadScore": (float, float),
                   "PassedFilter": (int, int)}
 
+CONTROL_READ_DTYPE = [("MovieName", "|S128"),
+                      ("HoleNumber", np.int64),
+                      ("Accuracy", np.float64),
+                      ("ReadLength", np.int64)]
+
 
 def make_control_report(control_cmph5, filtered_subreads_csv, report,
-                        output_dir, dpi, dumpdata):
+                        output_dir, dpi, dumpdata, cache=False):
     """
     Entry to report.
     :param control_cmph5: (str) path to control_reads.cmp.h5
     :param filtered_subreads_csv: (str) path to filtered_subread_summary.csv
+    :param cache: (bool) use a .npy sidecar cache of the csv
     """
     _validate_inputs(control_cmph5, filtered_subreads_csv)
     name, control_reads = _get_control_reads(control_cmph5)
-    filtered_reads = _get_filtered_reads(filtered_subreads_csv)
+    filtered_reads = _get_filtered_reads(filtered_subreads_csv, cache=cache)
     control_data, sample_data = _process_reads(control_reads, filtered_reads)
     nr = _get_num_control_reads(control_data)
     if nr == 0:
@@ -140,34 +146,64 @@ def _validate_inputs(control_cmph5, filtered_subreads_csv):
 def _get_control_reads(control_cmph5):
     """
     Return a tuple of len == 2:
-    Position 0: (string) control name 
-    Position 1: (dict) dict of string to tuple (int,float) . The key is control readId,  
-    position 0 of the tuple is accuracy, position 1 is length.
+    Position 0: (string) control name
+    Position 1: (numpy array) control reads (CONTROL_READ_DTYPE): movie
+    name, hole number, accuracy and length of each control read.
     :param control_cmph5: (str) path to control_reads.cmp.h5
+
+    The columns are read in bulk (see pbreports.io.cmph5). If a read has
+    several alignments (subreads), the last one is used.
     """
-    control_reads = {}
-    c = CmpH5Reader(control_cmph5)
-    for ca in c:
-        read_id = '%s/%d' % (ca.movieInfo.Name, ca.HoleNumber)
-        if read_id in control_reads:
-            log.warn(
-                'read {i} is control read and has subreads?'.format(i=read_id))
-        control_reads[read_id] = (ca.accuracy, ca.readLength)
-    name = c.referenceInfo('ref000001').FullName
+    with CmpH5Reader(control_cmph5) as c:
+        columns = AlignmentColumns.from_reader(c)
+        name = c.referenceInfo('ref000001').FullName
+
+    movie_names, movie_indices = np.unique(columns.movie_names,
+                                           return_inverse=True)
+    hole_numbers = columns.index.HoleNumber.astype(np.int64)
+
+    # keep the last alignment of each (movie, hole number)
+    hole_range = int(hole_numbers.max()) + 1 if len(columns) else 1
+    keys = movie_indices * hole_range + hole_numbers
+    _, last = np.unique(keys[::-1], return_index=True)
+    last = np.sort(len(keys) - 1 - last)
+    if len(last) != len(keys):
+        log.warn('{n} control reads have subreads'.format(
+            n=len(keys) - len(last)))
+
+    control_reads = np.zeros(len(last), dtype=CONTROL_READ_DTYPE)
+    control_reads['MovieName'] = movie_names[movie_indices[last]]
+    control_reads['HoleNumber'] = hole_numbers[last]
+    control_reads['Accuracy'] = columns.accuracies[last]
+    control_reads['ReadLength'] = columns.read_lengths[last]
     return name, control_reads
 
 
-def _get_filtered_reads(filtered_subreads_csv):
+def _split_read_ids(read_ids):
+    """
+    Split 'movie/hole' read ids into an array of movie names and an array of
+    hole numbers.
+    """
+    parts = np.char.rpartition(read_ids, '/')
+    return parts[:, 0], parts[:, 2].astype(np.int64)
+
+
+def _passed_filter(data):
+    return data["PassedFilter"] > 0
+
+
+def _get_filtered_reads(filtered_subreads_csv, cache=False):
     """
     Return a numpy array of csv data filtered by
         PassedFilter > 0
 
     :param filtered_subreads_csv: path to filtered_summary.csv f
+    :param cache: (bool) use a .npy sidecar cache of the csv
     """
-    reader = FilteredSummaryReader(filtered_subreads_csv, CSV_COLUMN_MAP)
+    reader = FilteredSummaryReader(filtered_subreads_csv, CSV_COLUMN_MAP,
+                                   row_filter=_passed_filter, cache=cache)
     reader.load()
     data = reader.data_as_numpy_array()
-    data = data[data["PassedFilter"] > 0]
     log.info('Total # reads in {f}: {i}'.format(
         f=filtered_subreads_csv, i=reader.num_records))
     log.info('# reads that passed filter: {i}'.format(i=len(data)))
@@ -178,34 +214,48 @@ def _process_reads(control_reads, filtered_reads):
     """
     Return 2 numpy arrays, control_data and sample_data. Each array
     contains accuracy and read length metrics.
-    :param control_reads: (dict) key = readId, value = accuracy & length tuple
+    :param control_reads: (numpy array) see _get_control_reads
     :param filtered_reads: (numpy array) see _get_filtered_reads
+
+    The (movie, hole number) of the filtered reads and of the control reads
+    are encoded as integer keys, and the filtered reads are split into
+    control and sample reads with a sorted search of the control keys.
     """
-    control_scores = array.array('f')
-    sample_scores = array.array('f')
-    control_pred_lens = array.array('i')
-    control_obs_lens = array.array('i')
-    sample_lens = array.array('i')
-    control_acc = array.array('f')
-
-    for row in filtered_reads:
-        id, score, length = row['ReadId'],\
-            row['ReadScore'],\
-            row['Readlength']
-
-        if id in control_reads:
-
-            control_scores.append(score)
-            control_pred_lens.append(length)
-            control_acc.append(control_reads[id][0])
-            control_obs_lens.append(control_reads[id][1])
-        else:
-            sample_scores.append(score)
-            sample_lens.append(length)
-
-    control_data = np.array([control_scores, control_pred_lens,
-                             control_acc, control_obs_lens])
-    sample_data = np.array([sample_scores, sample_lens])
+    control_movies = np.unique(control_reads['MovieName'])
+
+    is_control = np.zeros(len(filtered_reads), dtype=bool)
+    control_index = np.zeros(len(filtered_reads), dtype=np.int64)
+    if len(control_movies) and len(filtered_reads):
+        movies, holes = _split_read_ids(filtered_reads['ReadId'])
+
+        # index of the movie of each read in control_movies
+        i = np.searchsorted(control_movies, movies)
+        i[i == len(control_movies)] = 0
+        known_movie = control_movies[i] == movies
+
+        max_hole = max(holes.max(), control_reads['HoleNumber'].max())
+        keys = i * (max_hole + 1) + holes
+        control_keys = np.searchsorted(
+            control_movies, control_reads['MovieName']) * (max_hole + 1) + \
+            control_reads['HoleNumber']
+        sorter = np.argsort(control_keys)
+        j = np.searchsorted(control_keys, keys, sorter=sorter)
+        j[j == len(control_keys)] = 0
+        control_index = sorter[j]
+        is_control = known_movie & (control_keys[control_index] == keys)
+
+    # the values are stored with the precision of the original float32
+    # and int32 buffers
+    scores = filtered_reads['ReadScore'].astype(np.float32)
+    lengths = filtered_reads['Readlength'].astype(np.int32)
+    matched = control_reads[control_index[is_control]]
+
+    control_data = np.array([scores[is_control], lengths[is_control],
+                             matched['Accuracy'].astype(np.float32),
+                             matched['ReadLength'].astype(np.int32)],
+                            dtype=np.float64)
+    sample_data = np.array([scores[~is_control], lengths[~is_control]],
+                           dtype=np.float64)
     return control_data, sample_data
 
 
@@ -374,7 +424,8 @@ def _get_pretty_value(raw_value):
 
 def args_runner(args):
     return make_control_report(args.cntrCmpH5, args.csv,
-                               args.report, args.output, args.dpi, args.dumpdata)
+                               args.report, args.output, args.dpi, args.dumpdata,
+                               cache=args.cache)
 
 
 def add_options_to_parser(p):
@@ -385,6 +436,8 @@ def add_options_to_parser(p):
     p.add_argument("cntrCmpH5", help="control_reads.cmp.h5",
                    type=validate_file)
     p.add_argument("csv", help="filtered_summary.csv", type=validate_file)
+    p.add_argument('--cache', action='store_true',
+                   help="Cache the parsed csv in a .npy file next to it")
 
     p.set_defaults(func=args_runner)
     return p
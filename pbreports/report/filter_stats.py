@@ -2,7 +2,6 @@ import os
 import logging
 import sys
 import functools
-import operator
 import argparse
 import warnings
 
@@ -14,12 +13,14 @@ from pbcommand.cli import pacbio_args_runner, \
 from pbcommand.utils import setup_log
 
 from pbreports.io.validators import validate_dir, validate_file
+from pbreports.io.csv_reader import (csv_lines_to_chunks, CHUNK_SIZE,
+                                     map_byte_ranges)
 from pbreports.plot.helper import get_green, get_blue
 from pbreports.util import compute_n50_from_bins
 from pbreports.model.aggregators import (CountAggregator, MeanAggregator,
                                          SumAggregator, HistogramAggregator,
                                          MinAggregator, MaxAggregator,
-                                         BaseAggregator)
+                                         BaseAggregator, merge_aggregators)
 
 
 from pbreports.report.streaming_utils import (PlotViewProperties,
@@ -48,8 +49,10 @@ VALID_COLUMNS = {"Movie": ("|S64", str),
                  "SNR": (float, float),
                  "ArtifactScore": ("|S64", str)}
 
-COLUMN_TYPES = {k: operator.getitem(v, 1)
-                for k, v in VALID_COLUMNS.iteritems()}
+# Only these columns are loaded by the chunked (numpy) parser
+_CHUNK_COLUMNS = {k: VALID_COLUMNS[k] for k in ('Readlength', 'ReadScore',
+                                                'PassedFilter',
+                                                'SequencingZMW')}
 
 
 class Constants(object):
@@ -114,6 +117,22 @@ class N50Aggregator(BaseAggregator):
         else:
             self.bins[int(value)] += 1
 
+    def apply_chunk(self, chunk):
+        values = chunk[self.record_field].astype(np.int64)
+        if values.size == 0:
+            return
+        self._add_counts(np.bincount(values))
+
+    def _add_counts(self, counts):
+        if counts.size > self.bins.size:
+            bins = np.zeros(counts.size, dtype=self.bins.dtype)
+            bins[:self.bins.size] = self.bins
+            self.bins = bins
+        self.bins[:counts.size] += counts
+
+    def merge(self, other):
+        self._add_counts(other.bins)
+
     def __repr__(self):
         _d = dict(k=self.__class__.__name__,
                   n=len(self.bins),
@@ -165,80 +184,115 @@ def _validate_header(headers):
     return all([field in headers for field in _REQUIRED_HEADER_FIELDS])
 
 
-class Record(object):
-
-    def __init__(self, **kwargs):
-        for k, v in kwargs.iteritems():
-            setattr(self, k, v)
-
-    def __repr__(self):
-        o = " ".join([''.join([x, '=', str(getattr(self, x))])
-                      for x in _REQUIRED_HEADER_FIELDS])
-        _d = dict(k=self.__class__.__name__, o=o)
-        return "<{k} {o}>".format(**_d)
-
-
-def _row_to_record(column_names, row):
-    if ',' not in row:
-        raise CsvParserError("Malformed row {r}".format(r=row))
-    d = {}
-    for name, value in zip(column_names, row.strip().split(',')):
-        t = COLUMN_TYPES[name]
-        # print row
-        # print name, t, value
-        v = t(value)
-        d[name] = v
-
-    r = Record(**d)
-    return r
-
-
-def _filter_record_by_attribute(attr_name, func, value, record):
-    v = getattr(record, attr_name)
-    return func(value, v)
+def _apply_chunk(mask_funcs, aggregators, chunk):
+    """Run the filters and apply the aggregators to the rows of the chunk
+    that pass all of them. The filters are funcs with the signature
+    f(chunk) -> np.array of Bool, and the aggregators are called (once)
+    with the filtered chunk.
+    """
+    mask = np.ones(chunk.shape[0], dtype=bool)
+    for mask_func in mask_funcs:
+        mask &= mask_func(chunk)
 
+    filtered_chunk = chunk[mask]
+    for aggregator in aggregators:
+        aggregator.apply_chunk(filtered_chunk)
 
-def _filter_record(filter_func, record):
-    """Returns Bool"""
-    return filter_func(record)
 
+def chunk_applyer(chunks, funcs):
+    for chunk in chunks:
+        for func in funcs:
+            func(chunk)
+
+
+def _to_chunks(column_names, lines, chunk_size=CHUNK_SIZE):
+    """Parse the csv lines into numpy blocks of the columns used by the
+    report"""
+    try:
+        for chunk in csv_lines_to_chunks(lines, column_names, _CHUNK_COLUMNS,
+                                         chunk_size=chunk_size):
+            yield chunk
+    except ValueError as e:
+        raise CsvParserError(str(e))
+
+
+def _seq_zmw_filter(chunk):
+    return chunk['SequencingZMW'] > 0
+
+
+def _hq_filter(chunk):
+    return chunk['PassedFilter'] > 0
+
+
+def _get_aggregators():
+    """Returns a dict of {name: aggregator} of the Pre and Post-Filter
+    aggregators (the Post-Filter names are prefixed with 'post_')"""
+    aggros = {}
+    for prefix in ('', 'post_'):
+        _d = dict(nbases=SumAggregator('Readlength'),
+                  nreads=CountAggregator('Readlength'),
+                  readlength=MeanAggregator('Readlength'),
+                  max_readlength=MaxAggregator('Readlength'),
+                  min_readlength=MinAggregator('Readlength'),
+                  # the histogram is adaptively computed. The min value and dx is the
+                  readlength_hist=HistogramAggregator('Readlength', 0, dx=100),
+                  read_score_hist=HistogramAggregator('ReadScore', 0, dx=0.002),
+                  n50=N50Aggregator('Readlength', max_bins=200000),
+                  readscore=SumAggregator('ReadScore', total=0),
+                  readscore_mean=MeanAggregator('ReadScore'))
+        for name, aggregator in _d.iteritems():
+            aggros[prefix + name] = aggregator
+    return aggros
+
+
+def _to_models(aggros):
+    """
+    Create/bind core Functions that can be based to the chunk_applyer method
+    Calling these 'Models'. A model is list of filters and an aggregator
+    Signature to _apply_chunk is ([filter1, filter2], aggregator, chunk)
+    calling functools.partial returns a function signature f(chunk)
+    """
+    P = functools.partial
+    pre_agros = [v for k, v in aggros.iteritems() if not k.startswith('post_')]
+    post_agros = [v for k, v in aggros.iteritems() if k.startswith('post_')]
 
-def null_filter(record):
-    return True
+    # General Filters
+    # General construct to create a func with signature
+    # f(chunk) -> np.array of Bool
+    pre_filters = [_seq_zmw_filter]
+    post_filters = [_seq_zmw_filter, _hq_filter]
 
+    return [P(_apply_chunk, pre_filters, pre_agros),
+            P(_apply_chunk, post_filters, post_agros)]
 
-def _multi_filter_record(filter_funcs, record):
-    """Returns Bool"""
-    for filter_func in filter_funcs:
-        if not filter_func(record):
-            # Bail out at the first chance
-            return False
 
-    return True
+def _compute_aggregators_from_lines(column_names, chunk_size, lines):
+    """Compute the aggregators of the rows of a (byte range of the) csv.
+    This is run in the worker processes when nproc > 1."""
+    aggros = _get_aggregators()
+    chunk_applyer(_to_chunks(column_names, lines, chunk_size),
+                  _to_models(aggros))
+    return aggros
 
 
-def _apply(filter_funcs, aggregators, record):
-    """Run the filters and call apply method on the aggregator if
-    the record passes filtering.
+def _compute_aggregators(filter_csv, column_names, chunk_size=CHUNK_SIZE,
+                         nproc=1):
     """
-    if not isinstance(filter_funcs, (list, tuple)):
-        filter_funcs = [filter_funcs]
-
-    if not isinstance(aggregators, (list, tuple)):
-        aggregators = [aggregators]
+    Compute the aggregators of all the rows of the csv.
 
-    if _multi_filter_record(filter_funcs, record):
-        for aggregator in aggregators:
-            aggregator.apply(record)
-
-
-def applyer(row_to_record_func, iterable, funcs):
-    for it in iterable:
-        record = row_to_record_func(it)
-        for func in funcs:
-            func(record)
+    With nproc > 1, the csv is split into nproc line aligned byte ranges
+    which are processed by a pool of worker processes. The partial
+    aggregators are merged (in file order), which gives the same results
+    as processing the file in a single process.
+    """
+    f = functools.partial(_compute_aggregators_from_lines, column_names,
+                          chunk_size)
+    results = map_byte_ranges(f, filter_csv, nproc=nproc)
 
-        del record
+    aggros = results[0]
+    for other in results[1:]:
+        merge_aggregators(aggros, other)
+    return aggros
 
 
 def to_table(pre_filter_data, post_filter_data):
@@ -363,7 +417,7 @@ def _log_aggros(id_to_ags):
         log.info((i, a))
 
 
-def to_report(filter_csv, output_dir, dpi=72):
+def to_report(filter_csv, output_dir, dpi=72, chunk_size=CHUNK_SIZE, nproc=1):
     """Main point of entry
 
     The filter stats report has two main modes.
@@ -387,6 +441,11 @@ def to_report(filter_csv, output_dir, dpi=72):
     - mean readscore
 
 
+    The CSV is processed in blocks of chunk_size rows which are parsed
+    into numpy arrays, filtered with boolean masks and passed to the
+    aggregators. With nproc > 1, byte ranges of the CSV are processed in
+    parallel.
+
     Generates:
     - Pre and Post filter ReadLength histograms with SDF (with thumbnails)
     - Pre and Post filter ReadScore Histogram with SDF (with thumbnails)
@@ -396,6 +455,8 @@ def to_report(filter_csv, output_dir, dpi=72):
     :type filter_csv: str
     :type output_dir: str
     :type dpi: int
+    :type chunk_size: int
+    :type nproc: int
 
     :rtype: Report
     """
@@ -407,114 +468,42 @@ def to_report(filter_csv, output_dir, dpi=72):
         raise CsvParserError("Unable to find required fields {r} in {f}.".format(
             r=_REQUIRED_HEADER_FIELDS, f=filter_csv))
 
-    P = functools.partial
-
-    row_to_rec_func = P(_row_to_record,
-                        _get_header_fields_from_csv(filter_csv))
-
-    # General Filters
-    # General construct to create a func with signature f(record) -> Bool
-    seq_zmw_filter_f = lambda record: record.SequencingZMW > 0
-    hq_filter_f = lambda record: record.PassedFilter > 0
-
-    # Pre-Filter Aggregator(s)
-    nbases_ag = SumAggregator('Readlength')
-    nreads_ag = CountAggregator('Readlength')
-    readlength_ag = MeanAggregator('Readlength')
-    max_readlength_ag = MaxAggregator('Readlength')
-    min_readlength_ag = MinAggregator('Readlength')
-    # the histogram is adaptively computed. The min value and dx is the
-    readlength_hist_ag = HistogramAggregator('Readlength', 0, dx=100)
-    read_score_hist_ag = HistogramAggregator('ReadScore', 0, dx=0.002)
-
-    # n50_ag = N50Aggregator('Readlength', max_bins=200000)
-    pre_n50_ag = N50Aggregator('Readlength', max_bins=200000)
-
-    readscore_ag = SumAggregator('ReadScore', total=0)
-    readscore_mean_ag = MeanAggregator('ReadScore')
-
-    # Create/bind core Functions that can be based to the applyer method
-    # Calling these 'Models'. A model is list of filters and an aggregator
-    # Signature to _apply is ([filter1, filter2], aggregator, record)
-    # calling functools.partial returns a function signature f(record)
-    pre_filters = [seq_zmw_filter_f]
-    pre_agros = [nbases_ag, nreads_ag,
-                 readscore_ag, readscore_mean_ag,
-                 min_readlength_ag, max_readlength_ag,
-                 readlength_ag,
-                 readlength_hist_ag,
-                 read_score_hist_ag,
-                 pre_n50_ag]
-
-    pre_models = [P(_apply, pre_filters, pre_agros)]
-
-    # Post-Filter Aggregator(s)
-    post_nbases_ag = SumAggregator('Readlength')
-    post_nreads_ag = CountAggregator('Readlength')
-    post_readlength_ag = MeanAggregator('Readlength')
-    post_min_readlength_ag = MinAggregator('Readlength')
-    post_max_readlength_ag = MaxAggregator('Readlength')
-    # the histogram is adaptively computed. The min value and dx is the
-    post_readlength_hist_ag = HistogramAggregator('Readlength', 0, dx=100)
-    post_readscore_hist_ag = HistogramAggregator('ReadScore', 0, dx=0.002)
-
-    post_readscore_ag = SumAggregator('ReadScore')
-    post_readscore_mean_ag = MeanAggregator('ReadScore')
-
-    post_n50_ag = N50Aggregator('Readlength', max_bins=200000)
-
-    # Post Filter Models
-    post_filters = [seq_zmw_filter_f, hq_filter_f]
-
-    post_agros = [post_nbases_ag, post_nreads_ag,
-                  post_readlength_ag, post_readscore_ag,
-                  post_min_readlength_ag, post_max_readlength_ag,
-                  post_readscore_mean_ag,
-                  post_n50_ag,
-                  post_readlength_hist_ag, post_readscore_hist_ag]
-
-    post_models = [P(_apply, post_filters, post_agros)]
-
-    models = pre_models + post_models
-
-    with open(filter_csv, 'r') as f:
-        # read in header
-        _ = f.readline()
-        applyer(row_to_rec_func, f, models)
+    aggros = _compute_aggregators(filter_csv, csv_header_fields,
+                                  chunk_size=chunk_size, nproc=nproc)
 
     # Sanity Checking of data
     # Look for csv files with only the csv header (i.e., empty with no data)
-    if nreads_ag.attribute < 1:
+    if aggros['nreads'].attribute < 1:
         msg = "No filtered reads found in {f}. Unable to generate FilterStats report".format(
             f=filter_csv)
         raise NoFilteredReadsError(msg)
 
     # Exit if all the reads were filtered out.
-    if post_nreads_ag.attribute < 1:
+    if aggros['post_nreads'].attribute < 1:
         msg = "No filtered reads found in {f}. Unable to generate report.".format(
             f=filter_csv)
         raise NoPassedFilteredReadsError(msg)
 
     # this is getting really messy
-    id_to_aggro = {Constants.A_BASE_N_POST_FILTER: post_nbases_ag,
-                   Constants.A_BASE_N_PRE_FILTER: nbases_ag,
-                   Constants.A_MEAN_READ_LENGTH_POST_FILTER: post_readlength_ag,
-                   Constants.A_MEAN_READ_LENGTH_PRE_FILTER: readlength_ag,
-                   Constants.A_MEAN_READ_SCORE_POST_FILTER: post_readscore_mean_ag,
-                   Constants.A_MEAN_READ_SCORE_PRE_FILTER: readscore_mean_ag,
-                   Constants.A_READS_N_POST_FILTER: post_nreads_ag,
-                   Constants.A_READS_N_PRE_FILTER: nreads_ag,
-                   Constants.A_N50_READ_LENGTH_PRE_FILTER: pre_n50_ag,
-                   Constants.A_N50_READ_LENGTH_POST_FILTER: post_n50_ag}
+    id_to_aggro = {Constants.A_BASE_N_POST_FILTER: aggros['post_nbases'],
+                   Constants.A_BASE_N_PRE_FILTER: aggros['nbases'],
+                   Constants.A_MEAN_READ_LENGTH_POST_FILTER: aggros['post_readlength'],
+                   Constants.A_MEAN_READ_LENGTH_PRE_FILTER: aggros['readlength'],
+                   Constants.A_MEAN_READ_SCORE_POST_FILTER: aggros['post_readscore_mean'],
+                   Constants.A_MEAN_READ_SCORE_PRE_FILTER: aggros['readscore_mean'],
+                   Constants.A_READS_N_POST_FILTER: aggros['post_nreads'],
+                   Constants.A_READS_N_PRE_FILTER: aggros['nreads'],
+                   Constants.A_N50_READ_LENGTH_PRE_FILTER: aggros['n50'],
+                   Constants.A_N50_READ_LENGTH_POST_FILTER: aggros['post_n50']}
 
     _log_aggros(id_to_aggro)
 
     attributes = to_attributes(**id_to_aggro)
 
-    plot_aggregators = {Constants.P_PRE_FILTER_READ_LENGTH_HIST: readlength_hist_ag,
-                        Constants.P_POST_FILTER_READ_LENGHT_HIST: post_readlength_hist_ag,
-                        Constants.P_PRE_FILTER_READ_SCORE_HIST: read_score_hist_ag,
-                        Constants.P_POST_FILTER_READ_SCORE_HIST: post_readscore_hist_ag}
+    plot_aggregators = {Constants.P_PRE_FILTER_READ_LENGTH_HIST: aggros['readlength_hist'],
+                        Constants.P_POST_FILTER_READ_LENGHT_HIST: aggros['post_readlength_hist'],
+                        Constants.P_PRE_FILTER_READ_SCORE_HIST: aggros['read_score_hist'],
+                        Constants.P_POST_FILTER_READ_SCORE_HIST: aggros['post_read_score_hist']}
 
     _log_aggros(plot_aggregators)
 
@@ -524,17 +513,14 @@ def to_report(filter_csv, output_dir, dpi=72):
 
     # Temp lists to Create Pbreports Table
     # Each list has [nbases, nreads, n50, mean readlength, mean readscore]
-    _pre_filter = [nbases_ag.attribute,
-                   nreads_ag.attribute,
-                   pre_n50_ag.attribute,
-                   readlength_ag.attribute,
-                   np.round(readscore_mean_ag.attribute, decimals=3)]
-
-    _post_filter = [post_nbases_ag.attribute,
-                    post_nreads_ag.attribute,
-                    post_n50_ag.attribute,
-                    post_readlength_ag.attribute,
-                    np.round(post_readscore_mean_ag.attribute, decimals=3)]
+    _to_table_data = lambda p: [aggros[p + 'nbases'].attribute,
+                                aggros[p + 'nreads'].attribute,
+                                aggros[p + 'n50'].attribute,
+                                aggros[p + 'readlength'].attribute,
+                                np.round(aggros[p + 'readscore_mean'].attribute,
+                                         decimals=3)]
+    _pre_filter = _to_table_data('')
+    _post_filter = _to_table_data('post_')
 
     table = to_table(_pre_filter, _post_filter)
 
@@ -552,7 +538,8 @@ def to_report(filter_csv, output_dir, dpi=72):
 def args_runner(args):
     log.info("Starting {f} v{v}".format(f=os.path.basename(__file__),
                                         v=__version__))
-    report = to_report(args.filter_summary_csv, args.output_dir, dpi=args.dpi)
+    report = to_report(args.filter_summary_csv, args.output_dir, dpi=args.dpi,
+                       nproc=args.nproc)
     report.write_json(args.json_report)
     return 0
 
@@ -570,6 +557,8 @@ def get_parser():
                         help='Path of JSON report.')
     parser.add_argument("--dpi", default=60, type=int,
                         help="dots/inch")
+    parser.add_argument("--nproc", default=1, type=int,
+                        help="Number of processes used to parse the CSV.")
     return parser
 
 
@@ -18,11 +18,13 @@ from pbcommand.models.report import (Report, Table, Column, Plot,
 from pbcommand.models import TaskTypes, FileTypes, get_pbparser
 from pbcommand.cli import pbparser_runner
 from pbcommand.common_options import add_debug_option
-from pbcore.io import DataSet
 
+from pbreports.io.summary_stats import load_dataset_stats
 from pbreports.plot.helper import (get_fig_axes_lpr,
                                    save_figure_with_thumbnail, get_green)
-from pbreports.util import compute_n50
+from pbreports.model.distribution import (BinnedDistribution,
+                                          merge_distributions,
+                                          compute_n50_from_distributions)
 
 __version__ = '0.1.0'
 
@@ -36,14 +38,6 @@ class Constants(object):
 log = logging.getLogger(__name__)
 
 
-def _total_from_bins(bins, min_val, bin_width):
-    _min = min_val
-    _wid = bin_width
-    bin_means = [_min + (_wid * i) + _wid / 2 for i in range(len(bins))]
-    bin_totals = [count * mean for count, mean in zip(bins, bin_means)]
-    return sum(bin_totals)
-
-
 def to_report(stats_xml, output_dir, dpi=72):
     """Main point of entry
 
@@ -54,52 +48,36 @@ def to_report(stats_xml, output_dir, dpi=72):
     :rtype: Report
     """
     log.info("Analyzing XML {f}".format(f=stats_xml))
-    # stats_xml should be a dataset:
-    dset = DataSet(stats_xml)
-    # but if it isn't, no problem:
-    if not dset.metadata.summaryStats:
-        dset.loadStats(stats_xml)
+    # stats_xml should be a dataset (or a sts.xml):
+    dset = load_dataset_stats(stats_xml)
+    return to_report_from_dataset(dset, output_dir, dpi=dpi)
+
+
+def to_report_from_dataset(dset, output_dir, dpi=72):
+    """
+    Generate the report from a DataSet with the summary stats already
+    loaded (see pbreports.report.stats_xml)
+
+    :rtype: Report
+    """
     if not dset.metadata.summaryStats.readLenDists:
         raise RuntimeError("No Pipeline Summary Stats (sts.xml) found")
 
-    # Build the stats table:
-    nbases = 0
-    nreads = 0
-    n50 = 0
-    readscoretotal = 0
-    readscorenumber = 0
-    approx_read_lens = []
-
-    # if a merge failed there may be more than one dist:
-    for rlendist in dset.metadata.summaryStats.readLenDists:
-        nbases += _total_from_bins(rlendist.bins,
-                                   rlendist.minBinValue,
-                                   rlendist.binWidth)
-        nreads += sum(rlendist.bins)
-
-        # N50:
-        for i, lbin in enumerate(rlendist.bins):
-            # use the average, except for the last bin
-            if i != len(rlendist.bins) - 1:
-                value = ((i * rlendist.binWidth) + rlendist.minBinValue +
-                         rlendist.binWidth / 2)
-            # for the last bin, just use the value
-            else:
-                value = (i * rlendist.binWidth) + rlendist.minBinValue
-            approx_read_lens.extend([value] * lbin)
-            # TODO(mdsmith)(2016-02-09) make sure maxOutlierValue is updated
-            # during a merge /todo
-            # but pop off that last value and replace it with the
-            # maxOutlierValue:
-            # approx_read_lens.pop()
-            # approx_read_lens.append(rlendist.maxBinValue)
-    n50 = np.round(compute_n50(approx_read_lens))
-
-    for rqualdist in dset.metadata.summaryStats.readQualDists:
-        readscoretotal += _total_from_bins(rqualdist.bins,
-                                           rqualdist.minBinValue,
-                                           rqualdist.binWidth)
-        readscorenumber += sum(rqualdist.bins)
+    len_dists = [BinnedDistribution.from_sts_dist(d)
+                 for d in dset.metadata.summaryStats.readLenDists]
+    qual_dists = [BinnedDistribution.from_sts_dist(d)
+                  for d in dset.metadata.summaryStats.readQualDists]
+
+    # Build the stats table (if a merge failed there may be more than one
+    # dist):
+    nbases = sum(d.total for d in len_dists)
+    nreads = sum(d.count for d in len_dists)
+    # TODO(mdsmith)(2016-02-09) make sure maxOutlierValue is updated
+    # during a merge /todo
+    n50 = np.round(compute_n50_from_distributions(len_dists))
+
+    readscoretotal = sum(d.total for d in qual_dists)
+    readscorenumber = sum(d.count for d in qual_dists)
 
     readlen = 0
     if nreads != 0:
@@ -120,21 +98,22 @@ def to_report(stats_xml, output_dir, dpi=72):
 
     plots = []
 
-    # ReadLen distribution to barplot:
-    for i, rlendist in enumerate(dset.metadata.summaryStats.readLenDists):
-        len_fig, len_axes = get_fig_axes_lpr()
-        len_axes.bar(rlendist.labels, rlendist.bins,
-                     color=get_green(0), edgecolor=get_green(0),
-                     width=(rlendist.binWidth * 0.75))
-        len_axes.set_xlabel('Read Length')
-        len_axes.set_ylabel('Reads')
-        png_fn = os.path.join(output_dir, "readLenDist{i}.png".format(i=i))
-        png_base, thumbnail_base = save_figure_with_thumbnail(len_fig, png_fn,
-                                                              dpi=dpi)
-
-        plots.append(Plot("filter_len_xml_plot_{i}".format(i=i),
-                          os.path.relpath(png_base, output_dir),
-                          thumbnail=os.path.relpath(thumbnail_base, output_dir)))
+    # ReadLen distribution to barplot (unmergeable distributions are
+    # re-binned on a common grid):
+    rlendist = merge_distributions(len_dists)
+    len_fig, len_axes = get_fig_axes_lpr()
+    len_axes.bar(rlendist.labels, rlendist.bins,
+                 color=get_green(0), edgecolor=get_green(0),
+                 width=(rlendist.bin_width * 0.75))
+    len_axes.set_xlabel('Read Length')
+    len_axes.set_ylabel('Reads')
+    png_fn = os.path.join(output_dir, "readLenDist0.png")
+    png_base, thumbnail_base = save_figure_with_thumbnail(len_fig, png_fn,
+                                                          dpi=dpi)
+
+    plots.append(Plot("filter_len_xml_plot_0",
+                      os.path.relpath(png_base, output_dir),
+                      thumbnail=os.path.relpath(thumbnail_base, output_dir)))
 
     plot_groups = [PlotGroup("filter_len_xml_plot_group",
                              title="Polymerase Read Length",
@@ -144,19 +123,20 @@ def to_report(stats_xml, output_dir, dpi=72):
     plots = []
 
     # ReadQual distribution to barplot:
-    for i, rqualdist in enumerate(dset.metadata.summaryStats.readQualDists):
+    if qual_dists:
+        rqualdist = merge_distributions(qual_dists)
         qual_fig, qual_axes = get_fig_axes_lpr()
         qual_axes.bar(rqualdist.labels, rqualdist.bins,
                       color=get_green(0), edgecolor=get_green(0),
-                      width=(rqualdist.binWidth * 0.75))
+                      width=(rqualdist.bin_width * 0.75))
         qual_axes.set_xlabel('Read Quality')
         qual_axes.set_ylabel('Reads')
 
-        png_fn = os.path.join(output_dir, "readQualDist{i}.png".format(i=i))
+        png_fn = os.path.join(output_dir, "readQualDist0.png")
         png_base, thumbnail_base = save_figure_with_thumbnail(qual_fig, png_fn,
                                                               dpi=dpi)
 
-        plots.append(Plot("filter_qual_xml_plot_{i}".format(i=i),
+        plots.append(Plot("filter_qual_xml_plot_0",
                           os.path.relpath(png_base, output_dir),
                           thumbnail=os.path.relpath(thumbnail_base, output_dir)))
 
@@ -49,19 +49,29 @@ from pbcommand.cli import pacbio_args_runner, \
 from pbcommand.utils import setup_log
 
 from pbreports.io.validators import validate_dir, validate_file
+from pbreports.io.csv_reader import (csv_lines_to_chunks, CHUNK_SIZE,
+                                     map_byte_ranges)
 from pbreports.plot.helper import get_green
-from pbreports.util import compute_n50
+from pbreports.util import compute_n50_from_bins
 from pbreports.report.streaming_utils import (PlotViewProperties,
                                               to_plot_groups,
                                               custom_subread_length_histogram)
 from pbreports.model.aggregators import (BaseAggregator, SumAggregator,
                                          HistogramAggregator,
                                          MaxAggregator, MeanAggregator,
-                                         CountAggregator)
+                                         CountAggregator, to_bin_indices,
+                                         merge_aggregators)
 
 log = logging.getLogger(__name__)
 __version__ = '1.2'
 
+# Columns of the subread CSV (see filter_subread_summary)
+CSV_COLUMN_NAMES = ('movie_name', 'hole_number', 'start', 'end', 'length',
+                    'passed_filter')
+# Format is { Name: ( dType, f(str->dType) ) }
+_CHUNK_COLUMNS = {"length": (int, int),
+                  "passed_filter": (int, int)}
+
 
 class Constants(object):
     """Ids used for Report, Table, PlotGroup, Plot, Attributes,
@@ -159,6 +169,22 @@ class SubreadLengthHistogram(_BaseHistogram):
             log.error(
                 "Max value {v} dx:{d} nbins{n} max value {x}".format(**_d))
 
+    def apply_chunk(self, chunk):
+        values = chunk['length']
+        indices = to_bin_indices(values, self.dx)
+        is_valid = indices < self.nbins
+        if not np.all(is_valid):
+            x = self.dx * self.nbins
+            _d = dict(v=values.max(), m=np.count_nonzero(~is_valid),
+                      d=self.dx, x=x, n=self.nbins)
+            log.error("Skipping {m} values. Max value {v} dx:{d} nbins{n} "
+                      "max value {x}".format(**_d))
+        self.bins += np.bincount(indices[is_valid],
+                                 minlength=self.nbins).astype(self.bins.dtype)
+
+    def merge(self, other):
+        self.bins += other.bins
+
 
 class MeanSubreadLengthAggregator(MeanAggregator):
     pass
@@ -168,21 +194,43 @@ class N50Aggregator(BaseAggregator):
 
     def __init__(self, record_field, values=()):
         self.record_field = record_field
-        # this is not constant memory
-        self.values = values if values else []
+        # histogram of the values with a bin width of 1
+        self.bins = np.zeros(0, dtype=np.int64)
+        if len(values) > 0:
+            self._add_values(np.asarray(values))
+
+    def _add_values(self, values):
+        if values.size == 0:
+            return
+        self._add_counts(np.bincount(values.astype(np.int64)))
+
+    def _add_counts(self, counts):
+        if counts.size > self.bins.size:
+            bins = np.zeros(counts.size, dtype=np.int64)
+            bins[:self.bins.size] = self.bins
+            self.bins = bins
+        self.bins[:counts.size] += counts
 
     def apply(self, record):
         v = getattr(record, self.record_field)
-        self.values.append(v)
+        self._add_values(np.array([v]))
+
+    def apply_chunk(self, chunk):
+        self._add_values(chunk[self.record_field])
+
+    def merge(self, other):
+        self._add_counts(other.bins)
 
     @property
     def n50(self):
-        return compute_n50(self.values)
+        if self.bins.sum() == 0:
+            return 0
+        return compute_n50_from_bins(self.bins)
 
     def __repr__(self):
 
         _d = dict(k=self.__class__.__name__,
-                  v=len(self.values),
+                  v=self.bins.sum(),
                   n=self.n50)
         return "<{k} n50:{n} nvalues:{v} >".format(**_d)
 
@@ -191,95 +239,41 @@ class N50Aggregator(BaseAggregator):
         return self.n50
 
 
-class Record(object):
-
-    def __init__(self, movie_name, hole_number, start, end, length, passed_filter):
-        self.movie_name = movie_name
-        self.hole_number = hole_number
-        self.start = start
-        self.end = end
-        self.length = length
-        self.passed_filter = passed_filter
-
-    def __repr__(self):
-        _d = dict(m=self.movie_name,
-                  h=self.hole_number,
-                  s=self.start,
-                  e=self.end,
-                  l=self.length,
-                  p=self.passed_filter)
-        return "<{k} {m} {h} {s} {e} {l} {p}>".format(**_d)
-
-
-def to_record(line):
-    to_b = lambda x: True if x == '1' else False
-    to_c = [str, int, int, int, int, to_b]
-
-    try:
-        a = [v(k) for k, v in zip(line.strip().split(','), to_c)]
-        r = Record(*a)
-        return r
-    except (ValueError, TypeError) as e:
-        msg = "Unable to process line '{l}'".format(l=line)
-        sys.stderr.write(msg + "\n")
-        raise
-
-
-def _filter_record(filter_func, record):
-    """Returns Bool"""
-    return filter_func(record)
-
-
-def null_filter(record):
-    return True
-
-
-def _multi_filter_record(filter_funcs, record):
-    """Returns Bool"""
-    for filter_func in filter_funcs:
-        if not filter_func(record):
-            # Bail out at the first chance
-            return False
-
-    return True
-
-
-def _apply(filter_funcs, aggregators, record):
+def _apply_chunk(mask_funcs, aggregators, chunk):
     """
-    Run the filters and call apply method on the aggregator if
-    the record passes filtering.
+    Run the filters and apply the aggregators to the rows of the chunk that
+    pass all of them. The filters have the signature
+    f(chunk) -> np.array of Bool, and the apply_chunk method of each
+    aggregator is called once with the filtered chunk.
 
-    The should be used with functools.partial
+    This should be used with functools.partial
 
+    my_func = functools.partial(_apply_chunk, [null_mask], [])
 
-    my_func = functools.partial(_apply, [lambda r: True], [])
-
-    This will be my_func(record)
-
+    This will be my_func(chunk)
     """
-    if not isinstance(filter_funcs, (list, tuple)):
-        filter_funcs = [filter_funcs]
-
-    if not isinstance(aggregators, (list, tuple)):
-        aggregators = [aggregators]
+    mask = np.ones(chunk.shape[0], dtype=bool)
+    for mask_func in mask_funcs:
+        mask &= mask_func(chunk)
 
-    if _multi_filter_record(filter_funcs, record):
-        for aggregator in aggregators:
-            aggregator.apply(record)
+    filtered_chunk = chunk[mask]
+    for aggregator in aggregators:
+        aggregator.apply_chunk(filtered_chunk)
 
 
-def applyer(row_to_record_func, iterable, funcs):
+def chunk_applyer(chunks, funcs):
     """
 
-    :params funcs: list of funcs that operate on Records
+    :params funcs: list of funcs that operate on numpy blocks of CSV rows
 
     """
-    for it in iterable:
-        record = row_to_record_func(it)
+    for chunk in chunks:
         for func in funcs:
-            func(record)
+            func(chunk)
 
-        del record
+
+def null_mask(chunk):
+    return np.ones(chunk.shape[0], dtype=bool)
 
 
 def _to_attributes(nreads, nbases, mean_readlength, n50):
@@ -306,13 +300,15 @@ def _to_attributes(nreads, nbases, mean_readlength, n50):
     return attributes
 
 
-def to_report(filtered_csv, output_dir, dpi=72, thumb_dpi=20):
+def _passed_filter(chunk):
+    return chunk['passed_filter'] == 1
+
+
+def _get_aggregators():
     """
-    Run Report
+    Returns a tuple of the {name: aggregator} dicts of the passed filter
+    subreads and of all the subreads
     """
-    validate_file(filtered_csv)
-    validate_dir(output_dir)
-
     aggregators = {'nbases': SumAggregator('length'),
                    'nreads': CountAggregator('length'),
                    'mean_subreadlength': MeanSubreadLengthAggregator('length'),
@@ -321,25 +317,63 @@ def to_report(filtered_csv, output_dir, dpi=72, thumb_dpi=20):
                    'readlength_histogram': HistogramAggregator('length', 0, 100, nbins=10000),
                    'subread': SubreadLengthHistogram(dx=100)}
 
-    passed_filter = lambda record: record.passed_filter is True
-
-    passed_filter_func = functools.partial(
-        _apply, [passed_filter], aggregators.values())
-
     all_subread_aggregators = {'raw_nreads': SumAggregator('length'),
                                'max_raw_readlength': MaxAggregator('length'),
                                'raw_readlength_histogram': HistogramAggregator('length', 0, 100, nbins=10000)}
 
+    return aggregators, all_subread_aggregators
+
+
+def _compute_aggregators_from_lines(chunk_size, lines):
+    """Compute the aggregators of the subreads of a (byte range of the)
+    csv. This is run in the worker processes when nproc > 1."""
+    aggregators, all_subread_aggregators = _get_aggregators()
+
+    passed_filter_func = functools.partial(
+        _apply_chunk, [_passed_filter], aggregators.values())
+
     all_filter_func = functools.partial(
-        _apply, [null_filter], all_subread_aggregators.values())
+        _apply_chunk, [null_mask], all_subread_aggregators.values())
 
     funcs = [passed_filter_func, all_filter_func]
 
-    with open(filtered_csv, 'r') as f:
-        # read in header
-        header = f.readline()
-        # validate_header(header)
-        applyer(to_record, f, funcs)
+    chunks = csv_lines_to_chunks(lines, CSV_COLUMN_NAMES, _CHUNK_COLUMNS,
+                                 chunk_size=chunk_size)
+    chunk_applyer(chunks, funcs)
+    return aggregators, all_subread_aggregators
+
+
+def _compute_aggregators(filtered_csv, chunk_size=CHUNK_SIZE, nproc=1):
+    """
+    Compute the aggregators of all the subreads in the csv.
+
+    With nproc > 1, line aligned byte ranges of the csv are processed by a
+    pool of worker processes and the partial aggregators are merged in file
+    order. The results are the same as with a single process.
+    """
+    f = functools.partial(_compute_aggregators_from_lines, chunk_size)
+    results = map_byte_ranges(f, filtered_csv, nproc=nproc)
+
+    aggregators, all_subread_aggregators = results[0]
+    for others, all_others in results[1:]:
+        merge_aggregators(aggregators, others)
+        merge_aggregators(all_subread_aggregators, all_others)
+    return aggregators, all_subread_aggregators
+
+
+def to_report(filtered_csv, output_dir, dpi=72, thumb_dpi=20,
+              chunk_size=CHUNK_SIZE, nproc=1):
+    """
+    Run Report
+
+    The CSV is processed in numpy blocks of chunk_size rows. With
+    nproc > 1, byte ranges of the CSV are processed in parallel.
+    """
+    validate_file(filtered_csv)
+    validate_dir(output_dir)
+
+    aggregators, all_subread_aggregators = _compute_aggregators(
+        filtered_csv, chunk_size=chunk_size, nproc=nproc)
 
     for aggregator in itertools.chain(aggregators.values(), all_subread_aggregators.values()):
         log.info(aggregator)
@@ -391,7 +425,8 @@ def to_report(filtered_csv, output_dir, dpi=72, thumb_dpi=20):
 def args_runner(args):
     log.info("Starting {f} version {v} report generation".format(
         f=__file__, v=__version__))
-    report = to_report(args.filter_summary_csv, args.output, dpi=args.dpi)
+    report = to_report(args.filter_summary_csv, args.output, dpi=args.dpi,
+                       nproc=args.nproc)
     report.write_json(args.report)
     return 0
 
@@ -416,6 +451,8 @@ def get_parser():
                         help="dpi (dots/inch) for plots that were generated.")
     parser.add_argument('-r', '--report', dest='report', default=None,
                         help="Write the Json report to disk.")
+    parser.add_argument('--nproc', type=int, dest='nproc', default=1,
+                        help="Number of processes used to parse the CSV.")
     return parser
 
 
@@ -25,6 +25,7 @@ from pbcommand.cli import pacbio_args_runner, \
 from pbcommand.utils import setup_log
 
 from pbreports.io.validators import validate_fofn, bas_fofn_to_bas_files
+from pbreports.util import pool_map
 
 
 def to_version(major_version, perforce_str):
@@ -41,17 +42,42 @@ __version__ = to_version(MAJOR_VERSION, __revision__)
 log = logging.getLogger(__name__)
 
 
-def run(region_files, output_csv):
+CSV_HEADER = 'MovieName HoleNumber Start End Length PassedFilter'.split()
+# Number of CSV rows formatted and written at a time
+WRITE_BLOCK_SIZE = 100000
+
+
+def _read_rgn_file(fileName):
+    """
+    Return (movie name, subreads array) of a rgn.h5 file (see
+    _get_data_from_rgn_file). This is run in the worker processes when
+    nproc > 1.
+    """
+    started_at = time.time()
+    name, data = _get_data_from_rgn_file(fileName)
+    run_time = time.time() - started_at
+    log.info("Found {n} different Subreads in {s:.2f} sec ({m:.2f} min)".format(
+        n=len(data), s=run_time, m=run_time / 60.0))
+    return name, data
+
+
+def _write_subreads(f, name, data, block_size=WRITE_BLOCK_SIZE):
+    """Write the subreads of a movie as CSV rows, one block at a time"""
+    fmt = name.replace('%', '%%') + ',%d,%d,%d,%d,%d\n'
+    for i in xrange(0, len(data), block_size):
+        f.write(''.join([fmt % tuple(row)
+                         for row in data[i:i + block_size].tolist()]))
+
+
+def run(region_files, output_csv, nproc=1):
     """
     Return (bool): based on success of analyzing the rgn files
+
+    The rgn.h5 files are processed by a pool of nproc processes.
     """
     log.info("{n} version {v} is running".format(
         n=os.path.basename(__file__), v=__version__))
 
-    # core container of list of lists that have 6 items.
-    # FileName, ZMW, start, end, length, PassedFilter as 0/1 (False/True)
-    datum = []
-
     t0 = time.time()
 
     state = True
@@ -59,48 +85,48 @@ def run(region_files, output_csv):
     log.info("Found {n} rgn.h5 files to analyze.".format(n=len(region_files)))
     log.info(pformat(region_files))
 
+    file_names = []
     for fileName in region_files:
         log.info("Looking for {f}".format(f=fileName))
 
         if os.path.exists(fileName):
-            started_at = time.time()
-            data = _get_data_from_rgn_file(fileName)
-            datum.extend(data)
-            run_time = time.time() - started_at
-
-            log.info("Found {n} different Subreads in {s:.2f} sec ({m:.2f} min)".format(
-                n=len(data), s=run_time, m=run_time / 60.0))
-
+            file_names.append(fileName)
         else:
             state = False
             log.error("Unable to find {f}".format(f=fileName))
 
-    # ToDo convert this to use the python stdlib
+    # list of (movie name, array of ZMW, start, end, length, PassedFilter as
+    # 0/1 (False/True))
+    datum = pool_map(_read_rgn_file, file_names, nproc)
+
     with open(output_csv, 'w+') as f:
         log.info("{c} writing {f}".format(
             c=os.path.basename(__file__), f=output_csv))
-        header = 'MovieName HoleNumber Start End Length PassedFilter'.split()
 
-        f.write(",".join(header) + "\n")
-        for data in datum:
-            f.write(",".join([str(i) for i in data]) + "\n")
+        f.write(",".join(CSV_HEADER) + "\n")
+        for name, data in datum:
+            _write_subreads(f, name, data)
 
     run_time = time.time() - t0
     log.info("Completed writing {f} with {n} Subreads in {s:.2f} seconds ({m:.2f} minutes)".format(
-        f=output_csv, n=len(datum), s=run_time, m=run_time / 60.0))
+        f=output_csv, n=sum(len(data) for _, data in datum), s=run_time,
+        m=run_time / 60.0))
 
     return state
 
 
-def _get_subreads(name, regions, r_index, hq_index):
+def _get_subreads(regions, r_index, hq_index):
     """
     Get the data from '/PulseData/Regions'
 
-    :param name: (str) name of movie
-    :param regions: (H5py.Group) Region H5 group
+    :param regions: (numpy array or H5py.Dataset) Region table (ZMW, region
+    type, start, end, score)
     :param r_index: (int) Region type index
     :param hq_index: (int) HQ Region index/flag
 
+    Returns a numpy array with a row (ZMW, start, end, length, 0/1 passed
+    filter) for every region of type r_index, grouped by ZMW.
+
     Format #1
     RegionTypes = [GlobalAccuracy, HQRegion, Insert, Adapter]
 
@@ -108,56 +134,34 @@ def _get_subreads(name, regions, r_index, hq_index):
     RegionTypes = [Adapter Insert HQRegion]
 
     """
-
-    # dict of zmw_id -> regions (array of regions)
-    zmws = {}
-
-    # zmw_id -> True/False (if passed filter)
-    zmw_passed = set([])
-
-    for region in regions:
-        zmw_id, rtype, start, end, passed_filter = region
-        # log.info((name, region))
-
-        if rtype == r_index:
-            rg = [name, zmw_id, start, end, end - start]
-
-            if zmw_id in zmws:
-                zmws[zmw_id].append(rg)
-            else:
-                zmws[zmw_id] = [rg]
-
-        if rtype == hq_index:
-            if zmw_id in zmw_passed:
-                log.debug(
-                    "Found duplicate ZMW {i}. Please check the rgn file version!".format(i=zmw_id))
-                continue
-            else:
-                # "Zero'ed" out regions have start == end == 0
-                if start == end and start == 0:
-                    # zmw_passed[zmw_id] = False
-                    #zmw_passed[zmw_id] = 0
-                    pass
-                else:
-                    # zmw_passed[zmw_id] = True
-                    #zmw_passed[zmw_id] = 1
-                    zmw_passed.add(zmw_id)
-        else:
-            continue
-
-    # Store a list of (movie_name, ZMW_ID, start, end, length, 0/1)
-    datum = []
-    for z_id, rgs in zmws.iteritems():
-        for r in rgs:
-            line = [x for x in r]
-            # 1/0 True/False if passed filter
-            passed = 1 if z_id in zmw_passed else 0
-            line.append(passed)
-            # log.debug(line)
-            datum.append(line)
+    regions = np.asarray(regions, dtype=np.int64)
+    if regions.size == 0:
+        regions = regions.reshape(0, 5)
+    rtypes = regions[:, 1]
+
+    # A ZMW passed filter if it has an HQ region that isn't "Zero'ed" out
+    # (start == end == 0)
+    hq_regions = regions[rtypes == hq_index]
+    n_hq_zmws = len(np.unique(hq_regions[:, 0]))
+    if n_hq_zmws != len(hq_regions):
+        log.debug("Found {n} duplicate ZMWs. Please check the rgn file "
+                  "version!".format(n=len(hq_regions) - n_hq_zmws))
+    zeroed = (hq_regions[:, 2] == 0) & (hq_regions[:, 3] == 0)
+    zmw_passed = np.unique(hq_regions[~zeroed, 0])
+
+    inserts = regions[rtypes == r_index]
+    inserts = inserts[np.argsort(inserts[:, 0], kind='mergesort')]
+
+    # (ZMW_ID, start, end, length, 0/1)
+    datum = np.empty((len(inserts), 5), dtype=np.int64)
+    datum[:, 0] = inserts[:, 0]
+    datum[:, 1] = inserts[:, 2]
+    datum[:, 2] = inserts[:, 3]
+    datum[:, 3] = inserts[:, 3] - inserts[:, 2]
+    datum[:, 4] = np.in1d(inserts[:, 0], zmw_passed)
 
     log.info("Found {n} ZMWs. {p} Passed filtering.".format(
-        n=len(zmws), p=len(zmw_passed)))
+        n=len(np.unique(inserts[:, 0])), p=len(zmw_passed)))
     return datum
 
 
@@ -165,8 +169,8 @@ def _get_data_from_rgn_file(fileName):
     """
     Extracts the SubRead length from the rgn.cmp.h5 file
 
-    Returns an Array of arrays of the form:
-    [movie name, ZMD id, Start id, End id, length]
+    Returns a tuple of the movie name and an array of the form:
+    [ZMD id, Start id, End id, length, passed filter]
 
     The rgn.h5 File has two supported formats (see below).
 
@@ -209,13 +213,13 @@ def _get_data_from_rgn_file(fileName):
     insert_region_index = version_dict['Insert']
     hq_region_index = version_dict['HQRegion']
 
-    data = [x for x in _get_subreads(
-        name, f[group_name], insert_region_index, hq_region_index)]
+    data = _get_subreads(f[group_name][()], insert_region_index,
+                         hq_region_index)
     log.info("Found {n} Subreads in {f}".format(n=len(data), f=fileName))
 
     f.close()
 
-    return data
+    return name, data
 
 
 def _get_movie_name_from_pls_h5(plsH5FileName):
@@ -267,7 +271,7 @@ def args_runner(args):
     log.info("Starting {f} v{v}".format(
         f=os.path.basename(__file__), v=__version__))
     region_files = bas_fofn_to_bas_files(args.region_fofn)
-    state = run(region_files, args.output_csv)
+    state = run(region_files, args.output_csv, nproc=args.nproc)
     rcode = 0 if state else -1
     return rcode
 
@@ -286,6 +290,9 @@ def get_parser():
                         help='Input Region FOFN path')
     parser.add_argument('-o', '--output-csv', default=None, dest='output_csv',
                         help='Output File to write summary to')
+    parser.add_argument('--nproc', type=int, default=1,
+                        help='Number of processes used to read the rgn.h5 '
+                             'files')
     return parser
 
 
@@ -18,11 +18,11 @@ from pbcommand.models import FileTypes, get_pbparser
 from pbcommand.pb_io.report import load_report_from_json
 from pbcommand.cli import pbparser_runner
 from pbcommand.utils import setup_log
-from pbcore.io import ContigSet
 
+from pbreports.io.sequence_lengths import get_sequence_lengths
 from pbreports.plot.helper import (get_fig_axes_lpr, apply_histogram_data,
                                    get_blue)
-from pbreports.util import validate_file
+from pbreports.util import validate_file, add_cache_options
 
 log = logging.getLogger(__name__)
 
@@ -178,7 +178,8 @@ create_readlength_plot = functools.partial(
     "fulllength_nonchimeric_readlength_hist.png", get_blue(3))
 
 
-def make_report(fasta_file, summary_txt, output_dir):
+def make_report(fasta_file, summary_txt, output_dir, cache=False,
+                cache_dir=None):
     """
     Generate a report with ID, tables, attributes and plot groups.
 
@@ -200,6 +201,10 @@ def make_report(fasta_file, summary_txt, output_dir):
 
     Attributes of the report are extracted from this file.
 
+    :param cache: use a .npy sidecar cache of the read lengths (see
+    pbreports.io.sequence_lengths)
+    :param cache_dir: directory of the cache (default: FASTA directory)
+
     :type fasta_file: str
     :type summary_txt: str
     :type output_dir: str
@@ -210,12 +215,8 @@ def make_report(fasta_file, summary_txt, output_dir):
              format(f=fasta_file))
 
     # Collect read lengths of
-    def _get_reads():
-        with ContigSet(fasta_file) as f:
-            for record in f:
-                yield len(record.sequence)
-
-    readlengths = np.fromiter(_get_reads(), dtype=np.int64, count=-1)
+    readlengths = get_sequence_lengths(fasta_file, cache=cache,
+                                       cache_dir=cache_dir)
 
     # Plot read length histogram
     readlength_plot = create_readlength_plot(readlengths, output_dir)
@@ -244,10 +245,12 @@ def make_report(fasta_file, summary_txt, output_dir):
     return report
 
 
-def _run(fasta_file, summary_txt, output_dir, json_report):
+def _run(fasta_file, summary_txt, output_dir, json_report, cache=False,
+         cache_dir=None):
     if output_dir in ["", None]:
         output_dir = os.getcwd()
-    report = make_report(fasta_file, summary_txt, output_dir)
+    report = make_report(fasta_file, summary_txt, output_dir, cache=cache,
+                         cache_dir=cache_dir)
     log.info(pformat(report.to_dict()))
     report.write_json(json_report)
     return 0
@@ -258,7 +261,9 @@ def args_runner(args):
         fasta_file=args.inReadsFN,
         summary_txt=args.inSummaryFN,
         json_report=args.outJson,
-        output_dir=os.path.dirname(args.outJson))
+        output_dir=os.path.dirname(args.outJson),
+        cache=args.cache,
+        cache_dir=args.cache_dir)
 
 
 def resolved_tool_contract_runner(resolved_tool_contract):
@@ -290,6 +295,7 @@ def get_contract_parser():
     p.add_output_file_type(FileTypes.REPORT, "outJson", "JSON file",
                            description="Path to write report JSON output",
                            default_name="isoseq_classify_report.json")
+    add_cache_options(p.arg_parser.parser)
 
     return p
 
@@ -19,8 +19,9 @@ from pbcommand.pb_io.report import load_report_from_json
 from pbcommand.cli import pbparser_runner
 from pbcommand.common_options import add_debug_option
 from pbcommand.utils import setup_log
-from pbcore.io import ContigSet
 
+from pbreports.io.sequence_lengths import get_sequence_lengths
+from pbreports.util import add_cache_options
 from pbreports.plot.helper import (get_fig_axes_lpr, apply_histogram_data,
                                    get_blue)
 from pprint import pformat
@@ -178,7 +179,7 @@ create_readlength_plot = functools.partial(
     "consensus_isoforms_readlength_hist.png", get_blue(3))
 
 
-def makeReport(inReadsFN, inSummaryFN, outDir):
+def makeReport(inReadsFN, inSummaryFN, outDir, cache=False, cache_dir=None):
     """
     Generate a report with ID, tables, attributes and plot groups.
 
@@ -194,15 +195,16 @@ def makeReport(inReadsFN, inSummaryFN, outDir):
          average length of consensus isoforms
     Attributes of the report are extracted from this file.
 
+    cache --- use a .npy sidecar cache of the read lengths (see
+    pbreports.io.sequence_lengths), written in cache_dir if specified.
+
     """
     log.info("Plotting read length histogram from file: {f}".
              format(f=inReadsFN))
 
     # Collect read lengths of
-    reader = ContigSet(inReadsFN)
-    rs = [len(r.sequence) for r in reader]
-    reader.close()
-    readlengths = np.array(rs)
+    readlengths = get_sequence_lengths(inReadsFN, cache=cache,
+                                       cache_dir=cache_dir)
 
     # Plot read length histogram
     readlength_plot = create_readlength_plot(readlengths, outDir)
@@ -231,13 +233,16 @@ def makeReport(inReadsFN, inSummaryFN, outDir):
     return report
 
 
-def _run(fasta_file, summary_txt, json_report, outDir):
+def _run(fasta_file, summary_txt, json_report, outDir, cache=False,
+         cache_dir=None):
     if outDir in ["", None]:
         outDir = os.getcwd()
     report = makeReport(
         inReadsFN=fasta_file,
         inSummaryFN=summary_txt,
-        outDir=outDir)
+        outDir=outDir,
+        cache=cache,
+        cache_dir=cache_dir)
     log.info(pformat(report.to_dict()))
     report.write_json(json_report)
     return 0
@@ -248,7 +253,9 @@ def args_runner(args):
         fasta_file=args.inReadsFN,
         summary_txt=args.inSummaryFN,
         json_report=args.outJson,
-        outDir=os.path.dirname(args.outJson))
+        outDir=os.path.dirname(args.outJson),
+        cache=args.cache,
+        cache_dir=args.cache_dir)
 
 
 def resolved_tool_contract_runner(resolved_tool_contract):
@@ -278,6 +285,7 @@ def get_contract_parser():
     p.add_output_file_type(FileTypes.REPORT, "outJson", "Output JSON",
                            description="Path to write Report json output.",
                            default_name="isoseq_cluster_report.json")
+    add_cache_options(p.arg_parser.parser)
     return p
 
 
@@ -13,7 +13,8 @@ from pbcommand.models import TaskTypes, FileTypes, get_pbparser
 from pbcommand.cli import pbparser_runner
 from pbcommand.common_options import add_debug_option
 from pbcommand.utils import setup_log
-from pbcore.io import DataSet
+
+from pbreports.io.summary_stats import load_dataset_stats
 
 __version__ = '0.1.0'
 
@@ -37,9 +38,17 @@ def to_report(stats_xml):
     :rtype: Report
     """
     log.info("Analyzing XML {f}".format(f=stats_xml))
-    dset = DataSet(stats_xml)
-    if not dset.metadata.summaryStats:
-        dset.loadStats(stats_xml)
+    dset = load_dataset_stats(stats_xml)
+    return to_report_from_dataset(dset)
+
+
+def to_report_from_dataset(dset):
+    """
+    Generate the report from a DataSet with the summary stats already
+    loaded (see pbreports.report.stats_xml)
+
+    :rtype: Report
+    """
     if not dset.metadata.summaryStats.prodDist:
         raise RuntimeError("No Pipeline Summary Stats (sts.xml) found")
 
@@ -61,7 +70,7 @@ def to_report(stats_xml):
             try:
                 collection = list(dset.metadata.collections)[0]
                 movie_name = collection.context
-            except AttributeError:
+            except (AttributeError, IndexError):
                 movie_name = "NA"
 
         productive_zmws = int(dset.metadata.summaryStats.numSequencingZmws)
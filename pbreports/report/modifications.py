@@ -99,32 +99,37 @@ def readModificationCsvGz(fn):
 
 def plot_kinetics_scatter(kinArr, ax):
 
-    handles = []
     colors = ['red', 'green', 'blue', 'magenta']
     bases = ['A', 'C', 'G', 'T']
 
-    for base, color in zip(bases, colors):
-        baseHits = kinArr[kinArr['base'] == base]
-
-        if baseHits.shape[0] > 0:
-            # Add a bit of scatter to avoid ugly aliasing in plot due to
-            # integer quantization
-            cov = baseHits['coverage'] + 0.25 * \
-                np.random.randn(baseHits.shape[0])
-            score = baseHits['score'] + 0.25 * \
-                np.random.randn(baseHits.shape[0])
+    base_idx = np.empty(kinArr.shape[0], dtype=int)
+    base_idx.fill(-1)
+    for i, base in enumerate(bases):
+        base_idx[kinArr['base'] == base] = i
 
-            pl = ax.scatter(cov, score, c=color, label=base,
-                            lw=0, alpha=0.3, s=12)
-            handles.append(pl)
+    extent = None
+    if kinArr.shape[0] > 0:
+        extent = (0, np.percentile(kinArr['coverage'], 95.0) * 1.4,
+                  0, np.percentile(kinArr['score'], 99.9) * 1.3)
+
+    # Add a bit of scatter to avoid ugly aliasing in plot due to
+    # integer quantization
+    base_handles = PH.apply_density_scatter(ax, kinArr['coverage'],
+                                            kinArr['score'],
+                                            categories=base_idx,
+                                            colors=colors, jitter=0.25,
+                                            extent=extent,
+                                            alpha=0.3, marker_size=12)
+    handles = [h for h in base_handles if h is not None]
+    bases = [b for b, h in zip(bases, base_handles) if h is not None]
 
     ax.set_xlabel('Per-Strand Coverage')
     ax.set_ylabel('Modification QV')
     legend(handles, bases, loc='upper left')
 
-    if kinArr.shape[0] > 0:
-        ax.set_xlim(0, np.percentile(kinArr['coverage'], 95.0) * 1.4)
-        ax.set_ylim(0, np.percentile(kinArr['score'], 99.9) * 1.3)
+    if extent is not None:
+        ax.set_xlim(extent[0], extent[1])
+        ax.set_ylim(extent[2], extent[3])
 
 
 def plot_kinetics_hist(kinArr, ax):
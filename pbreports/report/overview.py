@@ -7,6 +7,7 @@ Counts the number of movies and cells in the input dataset.
 import sys
 import argparse
 import logging
+from multiprocessing.pool import ThreadPool
 
 from pbcommand.models.report import Report, Attribute
 from pbcommand.models import FileTypes, get_pbparser
@@ -14,7 +15,7 @@ from pbcommand.cli import pbparser_runner
 from pbcommand.utils import setup_log
 from pbcore.io import openDataSet, BamReader
 
-from pbreports.util import movie_to_cell, path_to_movie
+from pbreports.util import movie_to_cell, path_to_movie, pool_map
 
 log = logging.getLogger(__name__)
 
@@ -27,19 +28,55 @@ class Constants(object):
     DRIVER_EXE = "python -m pbreports.report.overview --resolved-tool-contract "
 
 
+# Number of threads used to read the BAM headers
+MAX_THREADS = 8
+
+
+def _get_metadata_movies(ds):
+    """
+    Return the movie names (Context) of the collections recorded in the
+    DataSet metadata, or an empty set if there aren't any.
+    """
+    try:
+        collections = ds.metadata.collections
+    except (AttributeError, KeyError):
+        return set()
+    return set([c.context for c in collections if c.context])
+
+
+def _get_bam_movies(file_name):
+    """Return the movie names (PU) of the read groups of a BAM header"""
+    with BamReader(file_name) as bam:
+        return [rg["PU"] for rg in bam.peer.header["RG"]]
+
+
+def _get_header_movies(file_names, nthreads=MAX_THREADS):
+    """
+    Read the movie names from the BAM headers. The files are opened
+    concurrently by a thread pool (opening them is latency bound, e.g. on
+    NFS).
+    """
+    results = pool_map(_get_bam_movies, file_names, nthreads,
+                       pool_class=ThreadPool)
+    return set([movie for movies in results for movie in movies])
+
+
 def run(dataset_file):
-    """Reads in the input.fofn and counts movies and cells. Outputs in XML."""
+    """Reads in the input.fofn and counts movies and cells. Outputs in XML.
+
+    The movie names are read from the DataSet collection metadata. The BAM
+    headers are only read if the metadata has no collections.
+    """
 
     with openDataSet(dataset_file) as ds:
-        movies = None
-        movies = set([])
-        for file_name in ds.toExternalFiles():
-            if type(ds).__name__ == "HdfSubreadSet":
-                movies.add(path_to_movie(file_name))
-            else:
-                with BamReader(file_name) as bam:
-                    for rg in bam.peer.header["RG"]:
-                        movies.add(rg["PU"])
+        if type(ds).__name__ == "HdfSubreadSet":
+            movies = set([path_to_movie(file_name)
+                          for file_name in ds.toExternalFiles()])
+        else:
+            movies = _get_metadata_movies(ds)
+            if not movies:
+                log.info("No collection metadata. Reading the BAM headers")
+                movies = _get_header_movies(ds.toExternalFiles())
         cells = set([movie_to_cell(movie) for movie in movies])
         ncells_attr = Attribute('ncells', len(cells), name="SMRT Cells")
         nmovies_attr = Attribute('nmovies', len(movies), name="Movies")
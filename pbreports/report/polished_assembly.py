@@ -16,9 +16,9 @@ from pbcommand.common_options import add_debug_option
 from pbcommand.models import FileTypes, get_pbparser
 from pbcommand.cli import pbparser_runner
 from pbcommand.utils import setup_log
-from pbcore.io import FastqReader, GffReader
+from pbcore.io import GffReader
 
-from pbreports.report.coverage import ContigCoverage
+from pbreports.io.sequence_lengths import iter_fastq_qv_sums
 from pbreports.util import compute_n50
 import pbreports.plot.helper as PH
 
@@ -96,16 +96,16 @@ def make_polished_assembly_report(report, gff, fastq, output_dir):
 
 def _get_contigs(fastq):
     """
-    Digests the polished contigs into a dict of ContigInfo objects
+    Digests the polished contigs into a dict of ContigInfo objects. The
+    FASTQ records are streamed (see iter_fastq_qv_sums)
     :param fastq: (str) path to polished fastq file
     :return: (dict) contig id -> ContigInfo object
     """
     contigs = {}
-    fqr = FastqReader(fastq)
-    for rec in fqr:
+    for name, length, qv_sum in iter_fastq_qv_sums(fastq):
         # remove quiver/arrow appended string, otherwise we can't cross
         # reference the name in the gff
-        cinf = ContigInfo(rec)
+        cinf = ContigInfo(name, length, qv_sum)
         contigs[cinf.name] = cinf
 
     return contigs
@@ -142,13 +142,14 @@ def _coverage_vs_quality_plot(contigs, output_dir):
     PH.set_tick_label_font_size(axes, 12, 12)
     PH.set_axis_label_font_size(axes, 16)
 
-    x_vals = [x.mean_coverage for x in contigs.values()]
-    y_vals = [x.mean_qv for x in contigs.values()]
+    x_vals = np.array([x.mean_coverage for x in contigs.values()])
+    y_vals = np.array([x.mean_qv for x in contigs.values()])
 
-    axes.set_xlim(0, max(x_vals) * 1.2)
-    axes.set_ylim(0, max(y_vals) * 1.2)
-
-    axes.scatter(x_vals, y_vals, s=12)
+    extent = (0, x_vals.max() * 1.2, 0, y_vals.max() * 1.2)
+    PH.apply_density_scatter(axes, x_vals, y_vals, colors=('b',),
+                             extent=extent, alpha=1.0, marker_size=12)
+    axes.set_xlim(extent[0], extent[1])
+    axes.set_ylim(extent[2], extent[3])
 
     png_path = os.path.join(output_dir, "polished_coverage_vs_quality.png")
     png, thumbpng = PH.save_figure_with_thumbnail(fig, png_path)
@@ -218,21 +219,28 @@ def _get_contig_coverage(alignment_summ_gff, contigs):
     reader.close()
 
 
+def _strip_contig_name(name):
+    """Strip the quiver/arrow appendage from a contig name"""
+    if name.endswith("|quiver"):
+        return name[:name.index('|quiver')]
+    return name[:name.index('|arrow')]
+
+
 class ContigInfo(object):
     """Contains relevant contig information needed for plotting.  Contig id,
     length and averaged QV and average coverage depth.
+
+    Only running sums are kept: the sum of the QVs and the sum of the mean
+    coverage of the alignment summary regions weighted by the region size.
     """
 
-    def __init__(self, rec):
-        """Constructs a new object with the given fastq record"""
-        # strip quiver appendage from name
-        if rec.name.endswith("|quiver"):
-            self._name = rec.name[:rec.name.index('|quiver')]
-        else:
-            self._name = rec.name[:rec.name.index('|arrow')]
-        self._qv = np.average(rec.quality)
-        self._len = len(rec.sequence)
-        self._cov = ContigCoverage(self._name)
+    def __init__(self, name, length, qv_sum):
+        self._name = _strip_contig_name(name)
+        self._len = length
+        self._qv_sum = qv_sum
+        self._coverage_sum = 0.0
+        self._start = None
+        self._end = 0
 
     def __repr__(self):
         _d = dict(k=self.__class__.__name__, n=self.name, l=self.length)
@@ -240,7 +248,11 @@ class ContigInfo(object):
 
     def add_coverage_data(self, gffrec):
         """Adds coverage information from a gff record"""
-        self._cov.add_data(gffrec)
+        if self._start is None:
+            self._start = gffrec.start
+        self._end = gffrec.end
+        mean = float(gffrec.attributes['cov2'].split(",")[0])
+        self._coverage_sum += mean * (gffrec.end - gffrec.start + 1)
 
     @property
     def name(self):
@@ -250,7 +262,9 @@ class ContigInfo(object):
     @property
     def mean_qv(self):
         """Average QV value"""
-        return self._qv
+        if self._len == 0:
+            return 0.0
+        return self._qv_sum / float(self._len)
 
     @property
     def length(self):
@@ -259,8 +273,11 @@ class ContigInfo(object):
 
     @property
     def mean_coverage(self):
-        """Average coverage"""
-        return self._cov.meanCoveragePerBase()
+        """Average coverage (per base of the covered region)"""
+        if self._start is None:
+            # contig wasn't found in gff
+            return 0.0
+        return self._coverage_sum / float(self._end - self._start + 1)
 
 
 def args_runner(args):
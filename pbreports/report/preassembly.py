@@ -33,8 +33,8 @@ from pbcommand.cli import pbparser_runner
 from pbcommand.utils import setup_log
 from pbcommand.common_options import add_debug_option
 
-from pbreports.util import get_fasta_readlengths, \
-    compute_n50_from_file
+from pbreports.util import (get_fasta_readlengths, compute_n50,
+                            add_cache_options)
 
 log = logging.getLogger(__name__)
 
@@ -51,18 +51,21 @@ class Constants(object):
 
 class FastaContainer(object):
 
-    def __init__(self, nreads, total, file_name):
+    def __init__(self, nreads, total, file_name, n50=None):
         self.nreads = nreads
         self.total = total
         self.file_name = file_name
+        self.n50 = n50
 
     @staticmethod
-    def from_file(file_name):
+    def from_file(file_name, cache=False, cache_dir=None):
         #        nreads, total = _compute_values(file_name)
-        read_lens = get_fasta_readlengths(file_name)
+        read_lens = get_fasta_readlengths(file_name, cache=cache,
+                                          cache_dir=cache_dir)
         nreads = len(read_lens)
-        total = sum(read_lens)
-        return FastaContainer(nreads, total, file_name)
+        total = int(read_lens.sum())
+        n50 = int(compute_n50(read_lens))
+        return FastaContainer(nreads, total, file_name, n50=n50)
 
     def __str__(self):
         return "N {n} Total {t} File: {f}".format(n=self.nreads, t=self.total, f=self.file_name)
@@ -77,13 +80,22 @@ def _validate_file(file_name):
         raise IOError(msg)
 
 
-def to_report(filtered_subreads, filtered_longreads, corrected_reads, length_cutoff=None):
+def to_report(filtered_subreads, filtered_longreads, corrected_reads,
+              length_cutoff=None, cache=False, cache_dir=None):
     """
     All inputs are paths to fasta files.
+
+    Each file is scanned once. With cache=True, the read lengths are
+    stored in (and loaded from) a .npy sidecar of each file, see
+    pbreports.io.sequence_lengths
     """
-    subreads = FastaContainer.from_file(filtered_subreads)
-    longreads = FastaContainer.from_file(filtered_longreads)
-    creads = FastaContainer.from_file(corrected_reads)
+    def _from_file(file_name):
+        return FastaContainer.from_file(file_name, cache=cache,
+                                        cache_dir=cache_dir)
+
+    subreads = _from_file(filtered_subreads)
+    longreads = _from_file(filtered_longreads)
+    creads = _from_file(corrected_reads)
 
     fastas = [subreads, longreads, creads]
     for f in fastas:
@@ -91,8 +103,7 @@ def to_report(filtered_subreads, filtered_longreads, corrected_reads, length_cut
 
     yield_ = creads.total / longreads.total
     rlength = int(creads.total / creads.nreads)
-#    n50 = _compute_n50(corrected_reads, creads.total)
-    n50 = compute_n50_from_file(corrected_reads)
+    n50 = creads.n50
 
     # Report Attributes
     attrs = []
@@ -117,11 +128,13 @@ def to_report(filtered_subreads, filtered_longreads, corrected_reads, length_cut
 
 
 def make_preassembly_report(filtered_subreads, filtered_longreads,
-                            corrected_reads, length_cutoff, output_json):
+                            corrected_reads, length_cutoff, output_json,
+                            cache=False, cache_dir=None):
     if length_cutoff == -1:
         length_cutoff = None
     report = to_report(filtered_subreads, filtered_longreads, corrected_reads,
-                       length_cutoff=length_cutoff)
+                       length_cutoff=length_cutoff, cache=cache,
+                       cache_dir=cache_dir)
     with open(output_json, 'w') as fh:
         log.info("Writing report to {r}.".format(r=output_json))
         fh.write(report.to_json())
@@ -135,7 +148,8 @@ def args_runner(args):
     length_cutoff = args.length_cutoff
     output_json = args.output_json
     make_preassembly_report(filtered_subreads, filtered_longreads,
-                            corrected_reads, length_cutoff, output_json)
+                            corrected_reads, length_cutoff, output_json,
+                            cache=args.cache, cache_dir=args.cache_dir)
     return 0
 
 
@@ -178,6 +192,7 @@ def _add_options_to_parser(p):
         name="Preassembly Report",
         description="Preassembly Report",
         default_name="preassembly_report.json")
+    add_cache_options(p.arg_parser.parser)
 
 
 def add_options_to_parser(p):
@@ -4,12 +4,15 @@
 Generates the SAT metric performance attributes
 """
 
-from collections import defaultdict, OrderedDict
+from collections import OrderedDict
 import logging
+import array
 import json
 import os
 import sys
 
+import numpy as np
+
 from pbcommand.models.report import Attribute, Report, PbReportError
 from pbcommand.models import TaskTypes, FileTypes, get_pbparser
 from pbcommand.pb_io.report import load_report_from_json, dict_to_report
@@ -19,6 +22,7 @@ from pbcommand.utils import setup_log
 from pbcore.io import AlignmentSet
 
 from pbreports.util import movie_to_cell, add_base_options_pbcommand
+from pbreports.io.group_by import group_by
 
 log = logging.getLogger(__name__)
 
@@ -126,56 +130,91 @@ def _get_mapping_stats_data(mapping_stats_rpt_file):
 def _get_read_hole_data(reads_by_cell, instrument):
     """
     Process the dictionary of hole data.
-    :param reads_by_cell_then_set: (dict) _get_reads_info
+    :param reads_by_cell: (dict) _get_reads_info
     """
     if len(reads_by_cell) == 0:
         raise ValueError("NO CELLS found!")
-    yield_, yield_1 = None, None
 
     cell = reads_by_cell.keys()[0]
     reads = reads_by_cell[cell]
 
-    if '1' in reads:
-        yield_1 = len(reads['1'])
-
-    yield_ = len(reads)
     d = {}
     d['instrument'] = instrument
-    d['reads_set_1'] = yield_1
-    d['reads_in_cell'] = yield_
+    # the holes aren't grouped by set
+    d['reads_set_1'] = None
+    d['reads_in_cell'] = len(reads)
     return d
 
 
+def _to_smallest_int_dtype(values):
+    """Cast an integer array to the smallest int dtype that fits its values"""
+    if len(values) == 0:
+        return values.astype(np.uint8)
+    dtype = np.result_type(np.min_scalar_type(values.min()),
+                           np.min_scalar_type(values.max()))
+    return values.astype(dtype, copy=False)
+
+
+def _group_holes_by_cell(holes, movie_indices, movie_names, holes_by_cell):
+    """
+    Merge the (unique) hole numbers of every movie into the sorted, unique
+    hole numbers of its cell in holes_by_cell (dict of cell to a numpy
+    array of the smallest int dtype that fits). Each movie name is resolved
+    to a cell once.
+
+    :param holes: (numpy array) hole number of every alignment
+    :param movie_indices: (numpy array) index of the movie (in movie_names)
+    of every alignment
+    """
+    indices, order, bounds = group_by(movie_indices)
+    for i, movie_index in enumerate(indices):
+        cell = movie_to_cell(movie_names[movie_index])
+        movie_holes = np.unique(holes[order[bounds[i]:bounds[i + 1]]])
+        if cell in holes_by_cell:
+            movie_holes = np.union1d(holes_by_cell[cell], movie_holes)
+        holes_by_cell[cell] = _to_smallest_int_dtype(movie_holes)
+
+
 def _get_reads_info(aligned_reads_file):
     """
     Extract information from the BAM files. Returns a tuple of length 2.
-    First item is a dictionary of dictionaries, such that holes are mapped by cell, then set.
-    Second item is the instrument name. 
+    First item is a dictionary of the (sorted, unique) hole numbers of each
+    cell. Second item is the instrument name.
     :param aligned_reads_file: (str) path to aligned_reads[.xml,.bam]
-    :return tuple (reads_by_cell_then_set, instrument) (dict, string): A dictionary of dictionaries,
-    instrument name
+    :return tuple (reads_by_cell, instrument) (dict, string): A dictionary of
+    numpy arrays, instrument name
+
+    The hole numbers of each cell are stored as a numpy array (a few bytes
+    per ZMW) instead of a set.
     """
     inst = None
-    reads_by_cell = defaultdict(set)
+    holes_by_cell = OrderedDict()
     with AlignmentSet(aligned_reads_file) as ds:
         for bamfile in ds.resourceReaders():
             if ds.isIndexed:
                 logging.info("Indexed file - will use fast loop.")
-                for (hole, rgId) in zip(bamfile.holeNumber, bamfile.qId):
-                    movie_name = bamfile.readGroupInfo(rgId).MovieName
-                    cell = movie_to_cell(movie_name)
-                    if inst is None:
-                        inst = _cell_2_inst(cell)
-                    reads_by_cell[cell].add(hole)
+                holes = np.asarray(bamfile.holeNumber)
+                rg_ids, movie_indices = np.unique(np.asarray(bamfile.qId),
+                                                  return_inverse=True)
+                movie_names = [bamfile.readGroupInfo(rg_id).MovieName
+                               for rg_id in rg_ids]
             else:
+                movie_codes = {}
+                holes = array.array('l')
+                movie_indices = array.array('l')
                 for aln in bamfile:
-                    hole = aln.HoleNumber
-                    movie_name = aln.movieName
-                    cell = movie_to_cell(movie_name)
-                    if inst is None:
-                        inst = _cell_2_inst(cell)
-                    reads_by_cell[cell].add(hole)
-    return reads_by_cell, inst
+                    holes.append(aln.HoleNumber)
+                    movie_indices.append(movie_codes.setdefault(
+                        aln.movieName, len(movie_codes)))
+                holes = np.frombuffer(holes, dtype='l')
+                movie_indices = np.frombuffer(movie_indices, dtype='l')
+                movie_names = sorted(movie_codes, key=movie_codes.get)
+            if inst is None and len(holes):
+                inst = _cell_2_inst(movie_to_cell(
+                    movie_names[movie_indices[0]]))
+            _group_holes_by_cell(holes, movie_indices, movie_names,
+                                 holes_by_cell)
+    return holes_by_cell, inst
 
 
 def summarize_report(report_file, out=sys.stdout):
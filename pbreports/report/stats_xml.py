@@ -0,0 +1,155 @@
+
+"""
+Generate the loading, adapter and filtering stats XML reports from a single
+load of the DataSet summary stats (sts.xml).
+"""
+
+import os
+import logging
+import sys
+import multiprocessing
+
+from pbcommand.models import FileTypes, get_pbparser
+from pbcommand.cli import pbparser_runner
+from pbcommand.common_options import add_debug_option
+from pbcommand.utils import setup_log
+
+from pbreports.io.summary_stats import load_dataset_stats
+from pbreports.report import loading_xml, adapter_xml, filter_stats_xml
+
+__version__ = '0.1.0'
+
+
+class Constants(object):
+    TOOL_ID = "pbreports.tasks.stats_xml_reports"
+    DRIVER_EXE = ("python -m pbreports.report.stats_xml "
+                  "--resolved-tool-contract ")
+
+
+log = logging.getLogger(__name__)
+
+
+def _write_report(func, args, report_json):
+    report = func(*args)
+    report.write_json(report_json)
+    log.info("Wrote report {r}".format(r=report_json))
+
+
+def to_reports(stats_xml, loading_json, adapter_json, filter_json, dpi=72):
+    """Main point of entry
+
+    The DataSet and sts.xml are parsed once. The three reports (and their
+    plots) are then generated concurrently, each in a forked process that
+    shares the parsed DataSet. The plots are written in the directory of
+    the corresponding report.
+
+    :type stats_xml: str
+    :param loading_json: (str) path of the loading JSON report
+    :param adapter_json: (str) path of the adapter JSON report
+    :param filter_json: (str) path of the filtering stats JSON report
+    :type dpi: int
+    """
+    log.info("Analyzing XML {f}".format(f=stats_xml))
+    dset = load_dataset_stats(stats_xml)
+
+    tasks = [(loading_xml.to_report_from_dataset, (dset,), loading_json),
+             (adapter_xml.to_report_from_dataset,
+              (dset, os.path.dirname(adapter_json), dpi), adapter_json),
+             (filter_stats_xml.to_report_from_dataset,
+              (dset, os.path.dirname(filter_json), dpi), filter_json)]
+
+    processes = [multiprocessing.Process(target=_write_report, args=task)
+                 for task in tasks]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+    failed = [task[2] for p, task in zip(processes, tasks) if p.exitcode != 0]
+    if failed:
+        raise RuntimeError("Unable to generate reports {r}".format(
+            r=", ".join(failed)))
+    return [task[2] for task in tasks]
+
+
+def args_runner(args):
+    log.info("Starting {f} v{v}".format(f=os.path.basename(__file__),
+                                        v=__version__))
+    to_reports(args.subread_set, args.loading_report, args.adapter_report,
+               args.filter_report)
+    return 0
+
+
+def resolved_tool_contract_runner(resolved_tool_contract):
+    rtc = resolved_tool_contract
+    log.info("Starting {f} v{v}".format(f=os.path.basename(__file__),
+                                        v=__version__))
+    to_reports(rtc.task.input_files[0], *rtc.task.output_files[:3])
+    return 0
+
+
+def _add_options_to_parser(p):
+    p.add_input_file_type(
+        FileTypes.DS_SUBREADS,
+        file_id="subread_set",
+        name="SubreadSet",
+        description="SubreadSet")
+    p.add_output_file_type(FileTypes.REPORT, "loading_report",
+                           "Loading JSON report",
+                           description="Filename of the loading JSON report",
+                           default_name="loading_report.json")
+    p.add_output_file_type(FileTypes.REPORT, "adapter_report",
+                           "Adapter JSON report",
+                           description="Filename of the adapter JSON report",
+                           default_name="adapter_report.json")
+    p.add_output_file_type(FileTypes.REPORT, "filter_report",
+                           "Filtering stats JSON report",
+                           description=("Filename of the filtering stats "
+                                        "JSON report"),
+                           default_name="filter_stats_report.json")
+
+
+def add_options_to_parser(p):
+    """
+    API function for extending main pbreport arg parser (independently of
+    tool contract interface).
+    """
+    p_wrap = _get_parser_core()
+    p_wrap.arg_parser.parser = p
+    p.description = __doc__
+    add_debug_option(p)
+    _add_options_to_parser(p_wrap)
+    p.set_defaults(func=args_runner)
+    return p
+
+
+def _get_parser_core():
+    p = get_pbparser(
+        Constants.TOOL_ID,
+        __version__,
+        "Loading, Adapter and Filtering Statistics XML Reports",
+        __doc__,
+        Constants.DRIVER_EXE,
+        is_distributed=True)
+    return p
+
+
+def get_parser():
+    p = _get_parser_core()
+    _add_options_to_parser(p)
+    return p
+
+
+def main(argv=sys.argv):
+    mp = get_parser()
+    return pbparser_runner(argv[1:],
+                           mp,
+                           args_runner,
+                           resolved_tool_contract_runner,
+                           log,
+                           setup_log)
+
+
+# for 'python -m pbreports.report.stats_xml ...'
+if __name__ == "__main__":
+    sys.exit(main())
@@ -39,7 +39,10 @@ from pprint import pformat
 import numpy as np
 
 from pbcore.util.Process import backticks
-from pbcore.io import CmpH5Reader, CmpH5Alignment
+from pbcore.io import openDataFile
+
+from pbreports.io.cmph5 import read_alignment_columns
+from pbreports.io.group_by import group_by
 
 __version__ = '2.0'
 
@@ -120,20 +123,6 @@ def setup_log(alog, file_name=None, level=logging.DEBUG, str_formatter=None):
     alog.setLevel(level)
 
 
-def _log_warn_once_per_movie():
-    """If the zScore isn't found, only emit a single message per Movie"""
-    movies = set()
-
-    def _log_once(movie, message):
-        if movie not in movies:
-            log.warn(message)
-            movies.add(movie)
-
-    return _log_once
-
-log_warn_once_per_movie = _log_warn_once_per_movie()
-
-
 def _validate_resource(func, resource):
     """Validate the existence of a file/dir"""
     if func(resource):
@@ -206,10 +195,11 @@ def validate_file_or_none(path):
 
 
 def get_parser():
-    desc = "Compare cmp.h5 to original bas/bax files."
+    desc = "Compare cmp.h5 (or AlignmentSet/BAM) to original bas/bax files."
     p = argparse.ArgumentParser(version=__version__, description=desc)
     p.add_argument('cmp_h5', type=validate_file,
-                   help="Path to compare file CMP.H5 alignment file.")
+                   help=("Path to compare file CMP.H5 alignment file, "
+                         "AlignmentSet XML or indexed BAM file."))
     p.add_argument('output_csv', type=str, help="Output CSV file path.")
     p.add_argument('--fofn', help="FOFN of bas|bax files.",
                    required=True, type=validate_fofn)
@@ -225,14 +215,66 @@ class MovieParseException(Exception):
     pass
 
 
+class _ArrayBuffer(object):
+
+    """Growable typed numpy buffer"""
+
+    def __init__(self, dtype, capacity=16):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def _reserve(self, n):
+        if self._n + n > len(self._data):
+            data = np.empty(max(2 * len(self._data), self._n + n),
+                            dtype=self._data.dtype)
+            data[:self._n] = self._data[:self._n]
+            self._data = data
+
+    def append(self, value):
+        self._reserve(1)
+        self._data[self._n] = value
+        self._n += 1
+
+    def extend(self, values):
+        self._reserve(len(values))
+        self._data[self._n:self._n + len(values)] = values
+        self._n += len(values)
+
+    @property
+    def values(self):
+        return self._data[:self._n]
+
+
+def _median_and_quantile(v, quantile):
+    """
+    Return the median and the quantile (see ReadStats._quantile) of an array
+    with a single partial sort (the array isn't modified).
+    """
+    n = len(v)
+    nq = min(int(round(quantile * float(n))), n - 1)
+    lo, hi = (n - 1) // 2, n // 2
+    p = np.partition(v, sorted(set([lo, hi, nq])))
+    return (p[lo] + p[hi]) / 2.0, p[nq]
+
+
 class ReadStats(object):
 
+    """
+    Per-read lengths, Z-scores and accuracies (stored in typed numpy
+    buffers). The summary statistics are computed once, when first needed
+    after reads have been added.
+    """
+
     def __init__(self):
-        self.lengths = []
-        self.zs = []
-        self.accs = []
+        self.lengths = _ArrayBuffer(np.int64)
+        self.zs = _ArrayBuffer(np.float64)
+        self.accs = _ArrayBuffer(np.float64)
         self.n = 0
         self.reportAccuracy = False
+        self._summary = None
 
     def __repr__(self):
         _d = dict(k=self.__class__.__name__,
@@ -242,57 +284,53 @@ class ReadStats(object):
                   l=self.length)
         return "<{k} n:{n} zscore:{z} accuracy:{a} length:{l} >".format(**_d)
 
+    def _get_summary(self):
+        """
+        Return a dict of the median and 95th percentile of the Z-scores, the
+        median and mean of the accuracies and of the lengths
+        """
+        if self._summary is None:
+            s = dict(z50=0.0, z95=0.0, acc50=0.0, meanAcc=0.0, length50=0.0,
+                     meanLength=0.0)
+            if self.n > 0:
+                s['z50'], s['z95'] = _median_and_quantile(self.zs.values,
+                                                          0.95)
+                accs = self.accs.values
+                s['acc50'], _ = _median_and_quantile(accs, 0.5)
+                s['meanAcc'] = np.mean(accs)
+                lengths = self.lengths.values
+                s['length50'], _ = _median_and_quantile(lengths, 0.5)
+                s['meanLength'] = np.mean(lengths)
+            self._summary = s
+        return self._summary
+
     @property
     def zscore(self):
-        if self.zs:
-            return np.median(np.array(self.zs))
-        else:
-            return 0.0
+        return self._get_summary()['z50']
 
     @property
     def length(self):
-        if self.lengths:
-            return np.median(np.array(self.lengths))
-        else:
-            return 0.0
+        return self._get_summary()['length50']
 
     @property
     def accuracy(self):
-        if self.accs:
-            return np.median(np.array(self.accs))
-        else:
-            return 0.0
+        return self._get_summary()['acc50']
 
-    def add(self, hit):
-        l = abs(int(hit.attrib['end']) - int(hit.attrib['start']))
-        self.lengths.append(l)
-        z = float(hit.find('zScore').attrib['value'])
-        self.zs.append(z)
-        acc = float(hit.find('nCorrect').attrib['percent'])
-        self.accs.append(acc)
-        self.n += 1
-
-    def addCmpAlnHit(self, hit):
-        l = abs(hit.query_end - hit.query_start)
-        self.lengths.append(l)
-        z = hit.zScore
-        if z is None:
-            z = -1.0
-        self.zs.append(z)
-        nCorrect = l - hit.nMismatch - hit.nIns - hit.nDel
-        acc = nCorrect / float(l) * 100.0
-        self.accs.append(acc)
-        self.n += 1
+    def addColumns(self, lengths, zs, accs):
+        """
+        Add the (numpy arrays) lengths, Z-scores and accuracies (percent) of
+        several alignments
+        """
+        self.lengths.extend(lengths)
+        self.zs.extend(zs)
+        self.accs.extend(accs)
+        self.n += len(lengths)
+        self._summary = None
 
     def _quantile(self, v, quantile):
         if len(v) == 0:
             return 0.0
-        n = len(v)
-        nq = int(round(quantile * float(n)))
-        if nq > n - 1:
-            nq = n - 1
-        v.sort()
-        return v[nq]
+        return _median_and_quantile(np.asarray(v), quantile)[1]
 
     def _accFromZ(self, z):
         """derive accuracy from Z"""
@@ -302,24 +340,21 @@ class ReadStats(object):
         return acc
 
     def tostring(self, external=False):
+        s = self._get_summary()
         if not external:
             if not self.reportAccuracy:
                 if self.n == 0:
                     return '0,0.0,0.0,0'
-                return '%d,%.2f,%.2f,%.0f' % (self.n, self.zscore, self.accuray, self.length)
+                return '%d,%.2f,%.2f,%.0f' % (self.n, s['z50'], s['acc50'], s['length50'])
 
             if self.n == 0:
                 return '0,0.0,0.0,0.0,0.0,0.0,0'
-            zs = np.array(self.zs)
-            z50 = np.median(zs)
-            z95 = self._quantile(zs, 0.95)
-            return '%d,%.2f,%.2f,%.2f,%.2f,%.2f,%.0f' % (self.n, z50, 100.0 * self._accFromZ(z50), z95, 100.0 * self._accFromZ(z95), self.accuracy, self.length)
+            z50, z95 = s['z50'], s['z95']
+            return '%d,%.2f,%.2f,%.2f,%.2f,%.2f,%.0f' % (self.n, z50, 100.0 * self._accFromZ(z50), z95, 100.0 * self._accFromZ(z95), s['acc50'], s['length50'])
         else:
             if self.n == 0:
                 return '0,0.00,0.0'
-            meanAcc = np.mean(np.array(self.accs))
-            meanRl = np.mean(np.array(self.lengths))
-            return '%d,%.2f,%.1f' % (self.n, meanAcc, meanRl)
+            return '%d,%.2f,%.1f' % (self.n, s['meanAcc'], s['meanLength'])
 
 
 class MovieStats(object):
@@ -373,43 +408,37 @@ class MovieStats(object):
                   t=self.movieType)
         return "<{k} {n} chip:{c} instrument:{i} set:{s} part:{p} type:{t} date:{d} >".format(**_d)
 
-    def add(self, hit):
-        if isinstance(hit, CmpH5Alignment):
-            self._addCmpAlnHit(hit)
-            return
+    def addCmpAlnColumns(self, columns):
+        """
+        Add the alignments of a movie read in bulk from a cmp.h5 file
 
-        # should never get here.
-        z = float(hit.find('zScore').attrib['value'])
-        self.allStats.add(hit)
-        if z > Z_THRESHOLD:
-            self.highZStats.add(hit)
+        :type columns: AlignmentColumns
+        """
+        l = np.abs(columns.read_lengths)
+        nCorrect = l - columns.n_errors
+        accs = nCorrect / l.astype(float) * 100.0
+        self.addColumns(l, columns.z_scores, accs,
+                        qv_counts=columns.qv_counts.sum(axis=0))
 
-    def _addCmpAlnHit(self, hit):
+    def addColumns(self, lengths, zs, accs, qv_counts=None):
         """
+        Add the lengths, Z-scores and accuracies (percent) of the alignments
+        of the movie.
 
-        :type hit: CmpH5Alignment
+        :param zs: (numpy array) or None if the Z-scores aren't known (they
+        are then reported as -1.0)
+        :param qv_counts: number of QVs >= each of the QV_THRESHOLDS
         """
-        # pbcore supports zScore?
-        try:
-            z = hit.zScore
-            self.allStats.addCmpAlnHit(hit)
-            if z > Z_THRESHOLD:
-                self.highZStats.addCmpAlnHit(hit)
-        except ValueError:
-            # probably want to disable this
-            movie = hit.movieInfo[1]
-            msg = "unable to get zScore from alignment ID {a} from movie".format(
-                a=hit.AlnID, m=movie)
-            log_warn_once_per_movie(movie, msg)
-
-        # if not hit.hasPulseInfo:
-        #    return
-
-        for qv in hit.QualityValue():
-            qv = qv / 10.0
-            for i, qvThreshold in enumerate(QV_THRESHOLDS):
-                if qv >= qvThreshold:
-                    self.nHighQVs[i] += 1
+        if zs is None:
+            zs = np.empty(len(lengths))
+            zs.fill(-1.0)
+        self.allStats.addColumns(lengths, zs, accs)
+        highZ = zs > Z_THRESHOLD
+        self.highZStats.addColumns(lengths[highZ], zs[highZ], accs[highZ])
+
+        if qv_counts is not None:
+            for i, n in enumerate(qv_counts):
+                self.nHighQVs[i] += int(n)
 
     def tostring(self, external=False):
         """date,movie,runCode,expt,chip,inst,movieType,nReads,medianZ,
@@ -484,36 +513,81 @@ def _get_run_code_from_path(path):
     return search.group(1), search.group(2)
 
 
+def _to_post_mapping_movie_stats(allMovies, movie):
+    stats = allMovies[movie]
+    return MovieStats(stats.expt, stats.chip, stats.movie, stats.inst,
+                      movieType=stats.movieType, setId=stats.setId,
+                      partId=stats.partId, cellId=stats.cellId,
+                      date=stats.date)
+
+
 def _get_post_mapping_from_movies(allMovies, cmp_h5):
     """
-    Go through all movies post alignment.
+    Go through all movies post alignment. The alignment columns of the
+    cmp.h5 file are read in bulk and grouped by movie.
 
 
     returns dict of {movie:MovieStats}
     """
     postMappingMovies = {}
 
-    reader = CmpH5Reader(cmp_h5)
+    columns = read_alignment_columns(cmp_h5, qv_thresholds=QV_THRESHOLDS)
 
-    for alignment in reader:
-        # returns a tuple of
-        # (2, 'm101210_151341_Jan_p1_b15', 100.0, 0.009999999776482582)
-        movie_info = alignment.movieInfo
+    for movie, movie_columns in columns.iter_movies():
+        postMappingMovies[movie] = _to_post_mapping_movie_stats(allMovies,
+                                                                movie)
+        postMappingMovies[movie].addCmpAlnColumns(movie_columns)
 
-        movie = movie_info[1]
-        if movie not in postMappingMovies:
-            stats = allMovies[movie]
-            postMappingMovies[movie] = MovieStats(stats.expt,
-                                                  stats.chip, stats.movie,
-                                                  stats.inst,
-                                                  movieType=stats.movieType,
-                                                  setId=stats.setId,
-                                                  partId=stats.partId,
-                                                  cellId=stats.cellId,
-                                                  date=stats.date)
-        postMappingMovies[movie].add(alignment)
+    return postMappingMovies
 
-    reader.close()
+
+def _get_bam_columns(alignment_file):
+    """
+    Read the movie name, aligned length and accuracy (percent) of every
+    alignment of an AlignmentSet XML or indexed BAM file from the .pbi
+    (the BAM records aren't read).
+
+    :return: tuple of numpy arrays (movie names, lengths, accuracies)
+    """
+    movies, lengths, accs = [], [], []
+    with openDataFile(alignment_file) as ds:
+        for bam in ds.resourceReaders():
+            q_ids = np.asarray(bam.qId)
+            rg_ids = np.unique(q_ids)
+            rg_movies = np.array([bam.readGroupInfo(rg_id).MovieName
+                                  for rg_id in rg_ids])
+            movies.append(rg_movies[np.searchsorted(rg_ids, q_ids)])
+            lengths.append(np.abs(np.asarray(bam.aEnd, dtype=np.int64) -
+                                  np.asarray(bam.aStart, dtype=np.int64)))
+            accs.append(np.asarray(bam.identity, dtype=np.float64) * 100.0)
+    if not movies:
+        return np.array([], dtype=str), np.zeros(0, dtype=np.int64), \
+            np.zeros(0)
+    return np.concatenate(movies), np.concatenate(lengths), \
+        np.concatenate(accs)
+
+
+def _get_post_mapping_from_bam(allMovies, alignment_file):
+    """
+    Go through all movies of an AlignmentSet or indexed BAM file, using the
+    .pbi columns.
+
+    The .pbi doesn't have Z-scores or per-base QVs, so the Z-scores are
+    reported as -1.0 (no alignment is above the Z threshold) and the QV
+    counts as 0.
+
+    returns dict of {movie:MovieStats}
+    """
+    postMappingMovies = {}
+
+    movies, lengths, accs = _get_bam_columns(alignment_file)
+    names, order, bounds = group_by(movies)
+
+    for i, movie in enumerate(names):
+        rows = order[bounds[i]:bounds[i + 1]]
+        postMappingMovies[movie] = _to_post_mapping_movie_stats(allMovies,
+                                                                movie)
+        postMappingMovies[movie].addColumns(lengths[rows], None, accs[rows])
 
     return postMappingMovies
 
@@ -698,7 +772,8 @@ def run(cmp_h5, movie_files, output_csv, external_mode=False):
     """
     Run the analysis and create the output summary as a CSV
 
-    :param cmp_h5: Path to .cmp.h5 alignment file
+    :param cmp_h5: Path to .cmp.h5, AlignmentSet XML or indexed BAM
+    alignment file
     :param movie_files: List of bax/bas files
     :param output_csv: Path to output CSV file
     :param external_mode: Used for internal or external metric display
@@ -714,7 +789,10 @@ def run(cmp_h5, movie_files, output_csv, external_mode=False):
     allMovies = _get_movie_stats_from_movie_files(movie_files)
     log.info(pformat(allMovies, indent=4))
 
-    postMappingMovies = _get_post_mapping_from_movies(allMovies, cmp_h5)
+    if _is_cmp_h5(cmp_h5):
+        postMappingMovies = _get_post_mapping_from_movies(allMovies, cmp_h5)
+    else:
+        postMappingMovies = _get_post_mapping_from_bam(allMovies, cmp_h5)
 
     _log_summary(postMappingMovies.values())
 
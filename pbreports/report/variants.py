@@ -20,8 +20,8 @@ from pbcommand.models import TaskTypes, FileTypes, get_pbparser
 from pbcommand.cli import pbparser_runner
 from pbcommand.common_options import add_debug_option
 from pbcommand.utils import setup_log
-from pbcore.io.GffIO import GffReader
-
+from pbreports.io.gff_columns import read_gff_columns, to_numeric
+from pbreports.io.group_by import group_by
 from pbreports.util import (openReference,
                             add_base_options_pbcommand,
                             get_top_contigs_from_ref_entry)
@@ -116,43 +116,47 @@ def _extract_alignment_summ_data(aln_summ_gff, contigs):
     :returns: 2 dictionaries containing data extracted from alignment_summary.gff
     """
 
-    def _get_name(id_):
-        for c in contigs:
-            if c.id == id_:
-                return c.name
-
-    contig_ids = [c.id for c in contigs]
-
-    ref_data = {}
-    var_map = {}
+    contig_names = {}
+    for c in contigs:
+        contig_names.setdefault(c.id, c.name)
 
     log.info("Reading GFF data from {f}".format(f=aln_summ_gff))
 
-    reader = GffReader(aln_summ_gff)
-    for rec in reader:
-        seqid = rec.seqid.split()[0]
-        if seqid not in contig_ids:
-            continue
-
-        # first data set
-        ref_data.setdefault(seqid, [0, 0, 0, 0])
-        ref_data[seqid][LENGTH] = max(rec.end, ref_data[seqid][LENGTH])
-        numGaps, lenGaps = rec.attributes["gaps"].split(",")
-        ref_data[seqid][GAPS] += int(lenGaps)
-        ref_data[seqid][COV] += float( rec.attributes["cov2"].split(",")[0] ) * \
-            (rec.end - rec.start + 1)
-
-        # second data set
-        contig_var = None
-        try:
-            contig_var = var_map[seqid]
-        except KeyError:
-            contig_var = ContigVariants(seqid, _get_name(seqid))
-            var_map[seqid] = contig_var
+    columns = read_gff_columns(aln_summ_gff,
+                               ("gaps", "cov2", "ins", "del", "sub"),
+                               seqids=set(contig_names))
+    seqids, order, bounds = group_by(columns["seqid"])
+
+    # every column is sorted by seqid (file order within a seqid), so the
+    # per-contig values are reductions over the [bounds[i], bounds[i + 1])
+    # slices
+    starts = columns["start"][order]
+    ends = columns["end"][order]
+    gap_lengths = to_numeric(columns["gaps"][order], 2, np.int64)[:, 1]
+    mean_covs = to_numeric(columns["cov2"][order], 2)[:, 0]
+    n_ins = to_numeric(columns["ins"][order], 1, np.int64)[:, 0]
+    n_dels = to_numeric(columns["del"][order], 1, np.int64)[:, 0]
+    n_subs = to_numeric(columns["sub"][order], 1, np.int64)[:, 0]
 
-        contig_var.add_data(rec)
-
-    reader.close()
+    ref_data = {}
+    var_map = {}
+    if len(seqids) == 0:
+        return ref_data, var_map
+
+    first_rows = bounds[:-1]
+    lengths = np.maximum.reduceat(ends, first_rows)
+    gaps = np.add.reduceat(gap_lengths, first_rows)
+    covs = np.add.reduceat(mean_covs * (ends - starts + 1), first_rows)
+
+    for i, seqid in enumerate(seqids.tolist()):
+        ref_data[seqid] = [max(int(lengths[i]), 0), int(gaps[i]), 0,
+                           float(covs[i])]
+        rows = slice(bounds[i], bounds[i + 1])
+        var_map[seqid] = ContigVariants(seqid, contig_names[seqid],
+                                        starts=starts[rows],
+                                        insertions=n_ins[rows],
+                                        deletions=n_dels[rows],
+                                        substitutions=n_subs[rows])
 
     return ref_data, var_map
 
@@ -199,7 +203,7 @@ def _create_variants_plot_grp(top_contigs, var_map, output_dir):
 
 
 def _get_x_labels(ctg_var):
-    return np.array([l[0] for l in ctg_var.variants])
+    return ctg_var.starts
 
 
 def _get_legend_file(bars, output_dir):
@@ -220,14 +224,12 @@ def _create_bars(contig_variants):
     :param contig_variants: (ContigVariants)
     :returns: tuple of pbreports.plot.helper.Bar objects
     """
-
-    dataIns = np.array([l[1] for l in contig_variants.variants])
-    dataDels = np.array([l[2] for l in contig_variants.variants])
-    dataSnv = np.array([l[3] for l in contig_variants.variants])
-
-    insBarModel = PH.Bar(dataIns, 'Insertions', color=PH.get_blue(3))
-    delBarModel = PH.Bar(dataDels, 'Deletions', color=PH.get_green(3))
-    snvBarModel = PH.Bar(dataSnv, 'Substitutions', color=PH.get_orange())
+    insBarModel = PH.Bar(contig_variants.insertions, 'Insertions',
+                         color=PH.get_blue(3))
+    delBarModel = PH.Bar(contig_variants.deletions, 'Deletions',
+                         color=PH.get_green(3))
+    snvBarModel = PH.Bar(contig_variants.substitutions, 'Substitutions',
+                         color=PH.get_orange())
 
     return (insBarModel, delBarModel, snvBarModel)
 
@@ -251,21 +253,22 @@ def _append_variants_gff_data(ref_data, variants_gff):
 
     :type variants_gff: str
     """
-    reader = GffReader(variants_gff)
-    for record in reader:
-        err_len = record.end - record.start + 1
-        seqid = record.seqid.split()[0]
+    columns = read_gff_columns(variants_gff)
+    seqids, order, bounds = group_by(columns["seqid"])
+    if len(seqids) == 0:
+        return
+    err_lens = (columns["end"] - columns["start"] + 1)[order]
+    errors = np.add.reduceat(err_lens, bounds[:-1])
+    for i, seqid in enumerate(seqids.tolist()):
         if seqid in ref_data:
-            ref_data[seqid][ERR] += err_len
+            ref_data[seqid][ERR] += int(errors[i])
         else:
             # the variants might not be present in the top 25 contigs,
             # so we can just raise a warning in the log.
-            msg = "Unable to find {r} in {f}".format(
-                r=seqid, f=variants_gff)
+            msg = "Unable to find {r} in {f} ({n} variants)".format(
+                r=seqid, f=variants_gff, n=bounds[i + 1] - bounds[i])
             log.warn(msg)
 
-    reader.close()
-
 
 def _get_consensus_table_and_attributes(ref_data, reference_entry):
     """
@@ -356,13 +359,20 @@ def _ref_ids_ordered_by_len(ref_data):
 
 class ContigVariants(object):
 
-    def __init__(self, seqId, name=None):
-        """Encapsulates variant info relevant to one chart"""
+    def __init__(self, seqId, name=None, starts=(), insertions=(),
+                 deletions=(), substitutions=()):
+        """
+        Encapsulates variant info relevant to one chart. The variant counts
+        are numpy arrays with one value per alignment summary region
+        """
         self.seqid = seqId
 
         self.name = seqId if name is None else name
 
-        self.variants = []
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.insertions = np.asarray(insertions, dtype=np.int64)
+        self.deletions = np.asarray(deletions, dtype=np.int64)
+        self.substitutions = np.asarray(substitutions, dtype=np.int64)
 
         # seqId is the fasta header, which could be long and have spaces and/or symbols that are
         # not good to use in filename.
@@ -371,16 +381,11 @@ class ContigVariants(object):
 
         self.file_name = "variants_plot_%s%s" % (m.hexdigest(), ".png")
 
-    def add_data(self, gff3Record):
-        """Append x,y data from this record to the contig graph"""
-
-        atts = gff3Record.attributes
-        startPos = int(gff3Record.start)
-        inse = int(atts['ins'])
-        de1e = int(atts['del'])
-        snv = int(atts['sub'])
-
-        self.variants.append((startPos, inse, de1e, snv))
+    @property
+    def variants(self):
+        """(start, ins, del, sub) of every region"""
+        return zip(self.starts.tolist(), self.insertions.tolist(),
+                   self.deletions.tolist(), self.substitutions.tolist())
 
 
 def args_runner(args):
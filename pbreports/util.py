@@ -8,14 +8,17 @@ import time
 import math
 import os
 import sys
+import multiprocessing
 
 import numpy as np
 
 from pbcore.util.Process import backticks
-from pbcore.io import FastaReader, ReferenceSet
+from pbcore.io import ReferenceSet
 from pbcommand.models import FileTypes
 from pbcommand import common_options
 
+from pbreports.io.sequence_lengths import get_sequence_lengths
+
 
 log = logging.getLogger(__name__)
 
@@ -68,6 +71,28 @@ def log_timing(func):
     return wrapper
 
 
+def pool_map(func, items, nproc=1, pool_class=multiprocessing.Pool):
+    """
+    Return [func(item) for item in items]. With nproc > 1 (and more than
+    one item), the items are processed by a pool of (at most) nproc
+    workers, so func and the items must be picklable.
+
+    :param pool_class: multiprocessing.Pool, or
+    multiprocessing.pool.ThreadPool for I/O bound funcs
+    """
+    items = list(items)
+    if nproc > 1 and len(items) > 1:
+        log.info("Processing {n} items with {p} workers".format(
+            n=len(items), p=min(nproc, len(items))))
+        pool = pool_class(min(nproc, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+    return [func(item) for item in items]
+
+
 def _nfs_exists_check(ff):
     """
     Central place for all NFS hackery
@@ -198,17 +223,15 @@ def path_to_movie(path):
     return path.split(os.path.sep)[-1].split(".")[0]
 
 
-def get_fasta_readlengths(fasta_file):
+def get_fasta_readlengths(fasta_file, cache=False, cache_dir=None):
     """
-    Get a sorted list of contig lengths
-    :return: (tuple) 
+    Get a sorted array of contig lengths. The records are not parsed (see
+    pbreports.io.sequence_lengths)
+    :param cache: (bool) use a .npy sidecar cache of the lengths
+    :return: (np.ndarray)
     """
-    lens = []
-    with FastaReader(fasta_file) as f:
-        for record in f:
-            lens.append(len(record.sequence))
-    lens.sort()
-    return lens
+    return np.sort(get_sequence_lengths(fasta_file, cache=cache,
+                                        cache_dir=cache_dir))
 
 
 def accuracy_as_phred_qv(accuracy, max_qv=70):
@@ -232,11 +255,11 @@ def accuracy_as_phred_qv(accuracy, max_qv=70):
         return -10 * np.log(error_rate) / Constants.LOG_10
 
 
-def compute_n50_from_file(fasta_file):
+def compute_n50_from_file(fasta_file, cache=False, cache_dir=None):
     """
     Convenience method to get N50 from a fasta file.
     """
-    lens = get_fasta_readlengths(fasta_file)
+    lens = get_fasta_readlengths(fasta_file, cache=cache, cache_dir=cache_dir)
     return compute_n50(lens)
 
 
@@ -273,18 +296,13 @@ def compute_n50(readlengths):
         return 0
 
     sorted_readlengths = np.sort(readlengths)
-    n50 = sorted_readlengths[0]
     half_length = np.sum(readlengths) / 2.0
 
-    total = 0
-    for readlength in sorted_readlengths:
-        if total < half_length:
-            n50 = readlength
-            total += n50
-        else:
-            break
-
-    return n50
+    # the N50 is the longest read such that the reads shorter than it
+    # (in sorted order) have less than half of the total length
+    shorter = np.cumsum(sorted_readlengths) - sorted_readlengths
+    i = np.searchsorted(shorter, half_length, side='left') - 1
+    return sorted_readlengths[max(i, 0)]
 
 
 def add_plot_options(parser):
@@ -295,6 +313,17 @@ def add_plot_options(parser):
     return parser
 
 
+def add_cache_options(parser):
+    """Options of the .npy read length caches (see pbreports.io.npy_cache)"""
+    parser.add_argument("--cache", action="store_true",
+                        help="Cache the read lengths of each FASTA in a .npy "
+                             "sidecar file.")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=None,
+                        help="Directory of the read length caches (default: "
+                             "directory of each FASTA).")
+    return parser
+
+
 def add_base_options(parser):
     parser.add_argument("--debug", action="store_true",
                         help="Enable debug output.")
@@ -385,29 +414,16 @@ def compute_n50_from_bins(bins):
     :note: Bin width is assumed to be 1
 
     """
-    total = 0
-    for i, j in enumerate(bins):
-        for _ in xrange(int(j)):
-            total += i
-    half_total = total / 2.0
-    n50 = 0
-    # initialize n50 by finding the first bin that != 0
-    for i, bin_value in enumerate(bins):
-        if bin_value != 0:
-            n50 = i
-            break
-    rtotal = 0
-    for i, bin_value in enumerate(bins):
-        if bin_value != 0:
-            for _ in xrange(int(bin_value)):
-                if rtotal < half_total:
-                    n50 = i
-                    rtotal += i
-                    #log.debug(("N50", n50, rtotal, half_total, total))
-                else:
-                    return n50
-    msg = "Unable to compute n50 from {n} bins with sum {x}".format(
-        n=len(bins), x=total)
-    warnings.warn(msg)
-    log.warn(msg)
-    return 0
+    bins = np.asarray(bins, dtype=np.int64)
+    if bins.sum() == 0:
+        msg = "Unable to compute n50 from {n} bins with sum {x}".format(
+            n=len(bins), x=0)
+        warnings.warn(msg)
+        log.warn(msg)
+        return 0
+    # total length of all items up to (and including) each bin
+    cumulative = np.cumsum(bins * np.arange(len(bins), dtype=np.int64))
+    half_total = cumulative[-1] / 2.0
+    # the n50 is the bin of the item that makes the running total reach half
+    # of the total
+    return int(np.argmax(cumulative >= half_total))
@@ -9,12 +9,46 @@ from base_test_case import ROOT_DATA_DIR, run_backticks, \
     skip_if_data_dir_not_present
 
 from pbreports.util import bas_fofn_to_bas_files
-from pbreports.report.filter_subread_summary import run
+from pbreports.report.filter_subread_summary import run, _get_subreads
 
 _DATA_DIR_NAME = 'filter_subread_summary'
 
 log = logging.getLogger(__name__)
 
+
+class TestGetSubreads(unittest.TestCase):
+
+    def test_get_subreads(self):
+        # RegionTypes = [Adapter Insert HQRegion]
+        regions = np.array([[5, 1, 0, 100, 0],
+                            [5, 0, 100, 140, 0],
+                            [5, 1, 140, 300, 0],
+                            [5, 2, 50, 250, 0],
+                            # "Zero'ed" out HQ region
+                            [3, 1, 0, 80, 0],
+                            [3, 2, 0, 0, 0],
+                            # duplicate HQ regions, only one is zero'ed out
+                            [7, 2, 0, 0, 0],
+                            [7, 1, 10, 60, 0],
+                            [7, 2, 10, 60, 0],
+                            # duplicate zero'ed out HQ regions
+                            [9, 2, 0, 0, 0],
+                            [9, 2, 0, 0, 0],
+                            [9, 1, 0, 20, 0],
+                            # HQ region but no insert
+                            [11, 2, 0, 500, 0]])
+        data = _get_subreads(regions, 1, 2)
+        self.assertEqual(data.tolist(), [[3, 0, 80, 80, 0],
+                                         [5, 0, 100, 100, 1],
+                                         [5, 140, 300, 160, 1],
+                                         [7, 10, 60, 50, 1],
+                                         [9, 0, 20, 20, 0]])
+
+    def test_get_subreads_empty(self):
+        data = _get_subreads(np.zeros((0, 5), dtype=np.int32), 1, 2)
+        self.assertEqual(data.shape, (0, 5))
+
+
 @skip_if_data_dir_not_present
 class TestFilterSubreadSummaryReport(unittest.TestCase):
 
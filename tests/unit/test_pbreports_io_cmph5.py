@@ -0,0 +1,72 @@
+import unittest
+import logging
+
+import numpy as np
+
+from pbreports.io.cmph5 import (AlignmentColumns, _get_qv_counts,
+                                _to_raw_qv_threshold)
+
+log = logging.getLogger(__name__)
+
+
+def _to_columns():
+    index = np.rec.fromrecords([(10, 0, 100, 1, 2, 3),
+                                (11, 50, 100, 0, 0, 0),
+                                (10, 0, 80, 4, 0, 4),
+                                (12, 10, 30, 0, 1, 0)],
+                               names="HoleNumber,rStart,rEnd,nMM,nIns,nDel")
+    movie_names = np.array(["mB", "mA", "mA", "mB"])
+    reference_names = np.array(["ref1", "ref1", "ref2", "ref1"])
+    z_scores = np.array([1.0, 2.0, 3.0, 4.0])
+    return AlignmentColumns(index, movie_names, reference_names,
+                            z_scores=z_scores)
+
+
+class TestAlignmentColumns(unittest.TestCase):
+
+    def test_accuracies(self):
+        columns = _to_columns()
+        self.assertEqual(len(columns), 4)
+        self.assertEqual(columns.read_lengths.tolist(), [100, 50, 80, 20])
+        self.assertEqual(columns.n_errors.tolist(), [6, 0, 8, 1])
+        np.testing.assert_allclose(columns.accuracies,
+                                   [0.94, 1.0, 0.9, 0.95])
+
+    def test_take(self):
+        columns = _to_columns().take(np.array([False, True, True, False]))
+        self.assertEqual(columns.index.HoleNumber.tolist(), [11, 10])
+        self.assertEqual(columns.reference_names.tolist(), ["ref1", "ref2"])
+        self.assertEqual(columns.z_scores.tolist(), [2.0, 3.0])
+        self.assertIsNone(columns.qv_counts)
+
+    def test_iter_movies(self):
+        movies = [(name, c.index.HoleNumber.tolist())
+                  for name, c in _to_columns().iter_movies()]
+        self.assertEqual(movies, [("mA", [11, 10]), ("mB", [10, 12])])
+
+
+class TestQvCounts(unittest.TestCase):
+
+    def test_raw_qv_threshold(self):
+        # 0.3 * 10 == 3.0000000000000004, but 3 / 10.0 >= 0.3
+        self.assertEqual(_to_raw_qv_threshold(0.3), 3)
+        self.assertEqual(_to_raw_qv_threshold(0.35), 4)
+        self.assertEqual(_to_raw_qv_threshold(0), 0)
+        self.assertEqual(_to_raw_qv_threshold(2.0), 20)
+
+    def test_qv_counts(self):
+        # the alignment groups behave like the h5 file here
+        h5 = {"/AlnGroup/ID": np.array([2, 1]),
+              "/AlnGroup/Path": np.array(["/ref2/m", "/ref1/m"]),
+              "/ref1/m/QualityValue": np.array([0, 3, 20, 25, 2, 3, 40],
+                                               dtype=np.uint8)}
+        index = np.rec.fromrecords([(1, 4, 7),
+                                    (2, 0, 3),
+                                    (1, 0, 4),
+                                    (1, 2, 2)],
+                                   names="AlnGroupID,Offset_begin,Offset_end")
+        expected = [[2, 1], [0, 0], [3, 2], [0, 0]]
+        for chunk_size in (1, 2, 10):
+            counts = _get_qv_counts(h5, index, [0.3, 2.0],
+                                    chunk_size=chunk_size)
+            self.assertEqual(counts.tolist(), expected)
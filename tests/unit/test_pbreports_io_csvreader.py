@@ -4,7 +4,11 @@ import logging
 import traceback
 
 from base_test_case import BaseTestCase
-from pbreports.io.csv_reader import CsvReader
+from pbreports.io.csv_reader import (CsvReader, csv_lines_to_chunks,
+                                     get_cache_path,
+                                     get_byte_ranges,
+                                     iter_lines_in_byte_range,
+                                     map_byte_ranges)
 
 log = logging.getLogger(__name__)
 
@@ -68,3 +72,112 @@ class TestCsvReader(BaseTestCase):
         column_dtypes = {"foo": ("|S64", str),
                          "bar": ("|S64", str)}
         r = CsvReader(b,column_dtypes, True)
+
+    def test_csv_lines_to_chunks(self):
+        """Parse csv lines into typed numpy blocks"""
+        column_dtypes = {"foo": (int, int),
+                         "baz": (float, float)}
+        lines = ["{i},x,{f}\n".format(i=i, f=i / 2.0) for i in xrange(10)]
+        chunks = list(csv_lines_to_chunks(lines, ["foo", "bar", "baz"],
+                                          column_dtypes, chunk_size=4))
+        self.assertEqual([len(c) for c in chunks], [4, 4, 2])
+        self.assertEqual(chunks[0].dtype.names, ("foo", "baz"))
+        self.assertEqual(chunks[2]["foo"].tolist(), [8, 9])
+        self.assertEqual(chunks[1]["baz"].tolist(), [2.0, 2.5, 3.0, 3.5])
+
+        def _test_valerror():
+            list(csv_lines_to_chunks(["1,2\n"], ["foo", "bar", "baz"],
+                                     column_dtypes))
+
+        self.assertRaises(ValueError, _test_valerror)
+
+    def test_byte_ranges(self):
+        """Byte ranges are line aligned and cover the whole file"""
+        b = os.path.join(self.get_output_dir(), 'ranges.csv')
+        header = "foo,bar\n"
+        lines = ["{i},{j}\n".format(i=i, j="x" * (i % 7)) for i in xrange(100)]
+        with open(b, 'w') as f:
+            f.write(header)
+            f.writelines(lines)
+
+        for nranges in (1, 2, 3, 10, 1000):
+            ranges = get_byte_ranges(b, nranges, offset=len(header))
+            self.assertTrue(len(ranges) <= nranges)
+            range_lines = [line for start, end in ranges
+                           for line in iter_lines_in_byte_range(b, start, end)]
+            self.assertEqual(range_lines, lines)
+
+        # the results are returned in file order, with or without a pool
+        for nproc in (1, 3):
+            results = map_byte_ranges(list, b, nproc=nproc)
+            self.assertEqual(len(results), nproc)
+            self.assertEqual(sum(results, []), lines)
+
+    def test_load_streaming(self):
+        """Load a subset of the columns in blocks, with a row filter"""
+        b = os.path.join(self.get_output_dir(), 'streaming.csv')
+        with open(b, 'w') as f:
+            f.write("foo,bar,baz\n")
+            for i in xrange(25):
+                f.write("{i},x,{f}\n".format(i=i, f=i / 2.0))
+
+        column_dtypes = {"foo": (int, int),
+                         "baz": (float, float),
+                         "bah": (int, int)}
+        r = CsvReader(b, column_dtypes, False, chunk_size=4)
+        r.load()
+        data = r.data_as_numpy_array()
+        self.assertEqual(r.num_records, 25)
+        self.assertEqual(data.dtype.names, ("foo", "baz"))
+        self.assertEqual(data["foo"].tolist(), range(25))
+
+        r = CsvReader(b, column_dtypes, False,
+                      row_filter=lambda d: d["foo"] % 3 == 0, chunk_size=4)
+        r.load()
+        data = r.data_as_numpy_array()
+        self.assertEqual(r.num_records, 25)
+        self.assertEqual(data["foo"].tolist(), range(0, 25, 3))
+        self.assertEqual(data["baz"].tolist(), [i / 2.0 for i in xrange(0, 25, 3)])
+
+        # the last line doesn't need to be terminated
+        with open(b, 'w') as f:
+            f.write("foo,bar,baz\n1,x,0.5\n2,y,1.0")
+        r = CsvReader(b, column_dtypes, False, chunk_size=4)
+        r.load()
+        self.assertEqual(r.data_as_numpy_array()["foo"].tolist(), [1, 2])
+
+    def test_load_cache(self):
+        """Cache the parsed csv in a .npy sidecar"""
+        b = os.path.join(self.get_output_dir(), 'cached.csv')
+        with open(b, 'w') as f:
+            f.write("foo,bar\n")
+            for i in xrange(10):
+                f.write("{i},x{i}\n".format(i=i))
+
+        column_dtypes = {"foo": (int, int),
+                         "bar": ("|S8", str)}
+        cache_path = get_cache_path(b, column_dtypes)
+        self.assertFalse(os.path.exists(cache_path))
+
+        r = CsvReader(b, column_dtypes, True, cache=True)
+        r.load()
+        self.assertTrue(os.path.exists(cache_path))
+        expected = r.data_as_numpy_array()
+
+        r = CsvReader(b, column_dtypes, True, cache=True,
+                      row_filter=lambda d: d["foo"] > 4)
+        r.load()
+        self.assertEqual(r.num_records, 10)
+        self.assertEqual(r.data_as_numpy_array().tolist(),
+                         expected[5:].tolist())
+
+        # a different column map doesn't hit the cache
+        self.assertNotEqual(get_cache_path(b, {"foo": (int, int)}),
+                            cache_path)
+
+        # a corrupt cache falls back to the csv
+        with open(cache_path, 'w') as f:
+            f.write("not a npy file")
+        r = CsvReader(b, column_dtypes, True, cache=True)
+        r.load()
+        self.assertEqual(r.data_as_numpy_array().tolist(), expected.tolist())
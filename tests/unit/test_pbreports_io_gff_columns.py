@@ -0,0 +1,49 @@
+import os
+import gzip
+import unittest
+import logging
+import tempfile
+import shutil
+
+from pbreports.io.gff_columns import read_gff_columns, to_numeric
+
+log = logging.getLogger(__name__)
+
+_GFF = ("##gff-version 3\n"
+        "ctg1 description\t.\tregion\t1\t100\t0.00\t+\t.\tcov2=10.5,1.0;gaps=1,20\n"
+        "ctg2\t.\tregion\t1\t50\t0.00\t+\t.\tcov2=3.0,0.5;gaps=0,0\n"
+        "ctg1\t.\tregion\t101\t180\t0.00\t+\t.\tgaps=2,5;cov2=8.0,2.0\n")
+
+
+class TestGffColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(suffix="_gff_columns")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_gff_columns(self):
+        gff = os.path.join(self.tmp_dir, "regions.gff")
+        with open(gff, 'w') as f:
+            f.write(_GFF)
+        columns = read_gff_columns(gff, ("gaps", "cov2"))
+        self.assertEqual(columns["seqid"].tolist(), ["ctg1", "ctg2", "ctg1"])
+        self.assertEqual(columns["start"].tolist(), [1, 1, 101])
+        self.assertEqual(columns["end"].tolist(), [100, 50, 180])
+        self.assertEqual(columns["gaps"].tolist(), ["1,20", "0,0", "2,5"])
+        self.assertEqual(to_numeric(columns["cov2"], 2)[:, 0].tolist(),
+                         [10.5, 3.0, 8.0])
+
+        columns = read_gff_columns(gff, seqids=set(["ctg2"]))
+        self.assertEqual(columns["seqid"].tolist(), ["ctg2"])
+        self.assertEqual(columns["end"].tolist(), [50])
+        columns = read_gff_columns(gff, seqids=set())
+        self.assertEqual(len(columns["start"]), 0)
+
+    def test_gff_gz(self):
+        gff = os.path.join(self.tmp_dir, "regions.gff.gz")
+        f = gzip.open(gff, 'wb')
+        f.write(_GFF)
+        f.close()
+        self.assertEqual(read_gff_columns(gff)["start"].tolist(), [1, 1, 101])
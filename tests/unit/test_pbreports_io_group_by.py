@@ -0,0 +1,26 @@
+import unittest
+import logging
+
+import numpy as np
+
+from pbreports.io.group_by import group_by
+
+log = logging.getLogger(__name__)
+
+
+class TestGroupBy(unittest.TestCase):
+
+    def test_group_by(self):
+        keys = np.array([3, 1, 3, 2, 1, 3])
+        names, order, bounds = group_by(keys)
+        self.assertEqual(names.tolist(), [1, 2, 3])
+        groups = [order[bounds[i]:bounds[i + 1]].tolist()
+                  for i in xrange(len(names))]
+        # the rows of each key are in their original order
+        self.assertEqual(groups, [[1, 4], [3], [0, 2, 5]])
+
+    def test_group_by_empty(self):
+        names, order, bounds = group_by(np.array([], dtype=str))
+        self.assertEqual(len(names), 0)
+        self.assertEqual(len(order), 0)
+        self.assertEqual(bounds.tolist(), [0])
@@ -0,0 +1,126 @@
+import os
+import stat
+import gzip
+import unittest
+import logging
+import tempfile
+import shutil
+import time
+
+from pbreports.io.sequence_lengths import (scan_fasta_lengths,
+                                           get_fastq_lengths,
+                                           get_sequence_lengths,
+                                           iter_fastq_qv_sums)
+from pbreports.io.npy_cache import get_cache_path
+
+log = logging.getLogger(__name__)
+
+_FASTA = (">seq0 description\nACGTACGTAC\nGTA\n"
+          ">seq1\r\nAC\r\nGT\r\n\n"
+          ">seq2\n"
+          ">seq3 long header >>> with > characters\n" + "ACGT" * 25 + "\n"
+          ">seq4\nNNNN")
+_FASTA_LENGTHS = [13, 4, 0, 100, 4]
+
+_FASTQ = ("@read0\nACGT\n+\n@@@@\n"
+          "@read1\nACG\nTA\n+read1\n@+\n@@@\n"
+          "@read2\nA\n+\n+\n")
+_FASTQ_LENGTHS = [4, 5, 1]
+
+
+class TestSequenceLengths(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(suffix="_sequence_lengths")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, file_name, contents):
+        path = os.path.join(self.tmp_dir, file_name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_scan_fasta(self):
+        fasta = self._write("reads.fasta", _FASTA)
+        for block_size in [1, 2, 3, 5, 64, 1 << 20]:
+            lengths = scan_fasta_lengths(fasta, block_size=block_size)
+            self.assertEqual(lengths.tolist(), _FASTA_LENGTHS)
+        empty = self._write("empty.fasta", "")
+        self.assertEqual(len(get_sequence_lengths(empty)), 0)
+
+    def test_fasta_gz(self):
+        fasta = os.path.join(self.tmp_dir, "reads.fasta.gz")
+        f = gzip.open(fasta, 'wb')
+        f.write(_FASTA)
+        f.close()
+        self.assertEqual(get_sequence_lengths(fasta).tolist(),
+                         _FASTA_LENGTHS)
+
+    def test_fai(self):
+        fasta = self._write("reads.fasta", _FASTA)
+        # an index that is older than the FASTA file is ignored
+        fai = self._write("reads.fasta.fai", "seq0\t7\t6\t60\t61\n")
+        t = time.time()
+        os.utime(fai, (t - 10, t - 10))
+        self.assertEqual(get_sequence_lengths(fasta).tolist(),
+                         _FASTA_LENGTHS)
+        os.utime(fai, (t + 10, t + 10))
+        self.assertEqual(get_sequence_lengths(fasta).tolist(), [7])
+
+    def test_fastq(self):
+        fastq = self._write("reads.fastq", _FASTQ)
+        self.assertEqual(get_fastq_lengths(fastq).tolist(), _FASTQ_LENGTHS)
+        self.assertEqual(get_sequence_lengths(fastq).tolist(),
+                         _FASTQ_LENGTHS)
+        # '@' is QV 31 and '+' is QV 10
+        self.assertEqual(list(iter_fastq_qv_sums(fastq)),
+                         [("read0", 4, 124), ("read1", 5, 134),
+                          ("read2", 1, 10)])
+
+    def test_missing_file(self):
+        with self.assertRaises(IOError):
+            get_sequence_lengths(os.path.join(self.tmp_dir, "what.ever"))
+
+    def test_cache(self):
+        fasta = self._write("reads.fasta", _FASTA)
+        t = int(time.time())
+        os.utime(fasta, (t, t))
+        cache_path = get_cache_path(fasta, "sequence_lengths")
+        self.assertFalse(os.path.exists(cache_path))
+        lengths = get_sequence_lengths(fasta, cache=True)
+        self.assertEqual(lengths.tolist(), _FASTA_LENGTHS)
+        self.assertTrue(os.path.exists(cache_path))
+
+        # the lengths are loaded from the cache (same size and mtime)
+        with open(fasta, 'r+') as f:
+            f.write("<")
+        os.utime(fasta, (t, t))
+        lengths = get_sequence_lengths(fasta, cache=True)
+        self.assertEqual(lengths.tolist(), _FASTA_LENGTHS)
+
+        # a modified file doesn't map to the same cache
+        fasta = self._write("reads.fasta", ">seq0\nACGT\n")
+        os.utime(fasta, (t + 10, t + 10))
+        self.assertNotEqual(get_cache_path(fasta, "sequence_lengths"),
+                            cache_path)
+        self.assertEqual(get_sequence_lengths(fasta, cache=True).tolist(), [4])
+        # the cache of the previous version of the file is removed
+        self.assertFalse(os.path.exists(cache_path))
+        new_cache_path = get_cache_path(fasta, "sequence_lengths")
+        self.assertTrue(os.path.exists(new_cache_path))
+
+        # the cache isn't private to the user that wrote it
+        umask = os.umask(0o022)
+        try:
+            os.remove(new_cache_path)
+            get_sequence_lengths(fasta, cache=True)
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(new_cache_path).st_mode), 0o644)
+
+        cache_dir = os.path.join(self.tmp_dir, "cache")
+        os.mkdir(cache_dir)
+        get_sequence_lengths(fasta, cache=True, cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
@@ -0,0 +1,78 @@
+import os
+import unittest
+import logging
+import tempfile
+import shutil
+
+from pbreports.io.summary_stats import load_summary_stats
+
+log = logging.getLogger(__name__)
+
+_DIST = ("<pbbase:BinCounts>{c}</pbbase:BinCounts>"
+         "<pbbase:BinWidth>{w}</pbbase:BinWidth>"
+         "<pbbase:MinBinValue>{m}</pbbase:MinBinValue>")
+
+
+def _dist(tag, counts, width=1, min_value=0):
+    bins = "".join("<pbbase:BinCount>{c}</pbbase:BinCount>".format(c=c)
+                   for c in counts)
+    return "<pbds:{t}>{d}</pbds:{t}>".format(
+        t=tag, d=_DIST.format(c=bins, w=width, m=min_value))
+
+
+def _metadata(context, nzmws, prod, readlens):
+    return ("<pbds:DataSetMetadata><pbmeta:Collections>"
+            "<pbmeta:CollectionMetadata Context=\"{c}\"/></pbmeta:Collections>"
+            "<pbds:SummaryStats>"
+            "<pbds:AdapterDimerFraction>0.5</pbds:AdapterDimerFraction>"
+            "<pbds:NumSequencingZmws>{n}</pbds:NumSequencingZmws>"
+            "{p}{r}<pbds:InsertReadLenDist>{x}</pbds:InsertReadLenDist>"
+            "</pbds:SummaryStats></pbds:DataSetMetadata>").format(
+                c=context, n=nzmws, p=_dist("ProdDist", prod),
+                r=_dist("ReadLenDist", readlens, 100, 50),
+                x=_DIST.format(c="", w=7, m=7))
+
+
+_XML = ("<pbds:SubreadSet "
+        "xmlns:pbds=\"http://pacificbiosciences.com/PacBioDatasets.xsd\" "
+        "xmlns:pbmeta=\"http://pacificbiosciences.com/PacBioCollectionMetadata.xsd\" "
+        "xmlns:pbbase=\"http://pacificbiosciences.com/PacBioBaseDataModel.xsd\">"
+        "<pbds:DataSets>"
+        "<pbds:SubreadSet>{s1}</pbds:SubreadSet>"
+        "<pbds:SubreadSet>{s2}</pbds:SubreadSet>"
+        "</pbds:DataSets>{m}</pbds:SubreadSet>")
+
+
+class TestSummaryStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_summary_stats(self):
+        xml = _XML.format(s1=_metadata("m1", 10, [5, 3, 2, 0], [1, 2]),
+                          s2=_metadata("m2", 20, [10, 6, 4, 0], [3]),
+                          m=_metadata("m1", 30, [15, 9, 6, 0], [4, 2]))
+        path = os.path.join(self.tmpdir, "merged.subreadset.xml")
+        with open(path, 'w') as f:
+            f.write(xml)
+
+        dset = load_summary_stats(path)
+        stats = dset.metadata.summaryStats
+        self.assertEqual(stats.numSequencingZmws, 30)
+        self.assertEqual(stats.adapterDimerFraction, 0.5)
+        self.assertEqual(stats.shortInsertFraction, None)
+        self.assertEqual(stats.prodDist.bins.tolist(), [15, 9, 6, 0])
+        self.assertEqual(len(stats.readLenDists), 1)
+        self.assertEqual(stats.readLenDists[0].bins.tolist(), [4, 2])
+        self.assertEqual(stats.readLenDists[0].labels, [50.0, 150.0])
+
+        self.assertEqual(len(dset.subdatasets), 2)
+        contexts = [d.metadata.collections[0].context
+                    for d in dset.subdatasets]
+        self.assertEqual(contexts, ["m1", "m2"])
+        self.assertEqual(
+            [d.metadata.summaryStats.numSequencingZmws
+             for d in dset.subdatasets], [10, 20])
@@ -3,9 +3,12 @@ import unittest
 import logging
 import random
 
+import numpy as np
+
 from pbreports.model.aggregators import (MaxAggregator, MinAggregator,
                                          MeanAggregator, CountAggregator,
-                                         SumAggregator, HistogramAggregator)
+                                         SumAggregator, HistogramAggregator,
+                                         exact_sum, merge_aggregators)
 
 log = logging.getLogger(__name__)
 
@@ -67,3 +70,81 @@ class TestAggregators(unittest.TestCase):
         nbins = 26
         self.assertEqual(a.nbins, nbins)
         self.assertEqual(a.max_value, max(self.values) + 3)
+
+
+class TestChunkAggregators(unittest.TestCase):
+
+    """apply_chunk must give the same results as apply on each record"""
+
+    def setUp(self):
+        self.record_name = 'my_record'
+        self.values = [23.0, 1.0, 22.0, 20.0, 19.5, 150.25, 3.0]
+        self.records = [Record(self.record_name, v) for v in self.values]
+        self.chunk = np.array(self.values,
+                              dtype=[(self.record_name, np.float64)])
+
+    def _compare(self, a, b, attr_name):
+        for record in self.records:
+            a.apply(record)
+        b.apply_chunk(self.chunk[:3])
+        b.apply_chunk(self.chunk[3:3])
+        b.apply_chunk(self.chunk[3:])
+        self.assertEqual(getattr(a, attr_name), getattr(b, attr_name))
+
+    def test_max_aggregator(self):
+        self._compare(MaxAggregator(self.record_name),
+                      MaxAggregator(self.record_name), 'attribute')
+
+    def test_min_aggregator(self):
+        self._compare(MinAggregator(self.record_name),
+                      MinAggregator(self.record_name), 'attribute')
+
+    def test_mean_aggregator(self):
+        self._compare(MeanAggregator(self.record_name),
+                      MeanAggregator(self.record_name), 'attribute')
+
+    def test_count_aggregator(self):
+        self._compare(CountAggregator(self.record_name),
+                      CountAggregator(self.record_name), 'attribute')
+
+    def test_sum_aggregator(self):
+        self._compare(SumAggregator(self.record_name),
+                      SumAggregator(self.record_name), 'attribute')
+
+    def test_histogram_aggregator(self):
+        self._compare(HistogramAggregator(self.record_name, 0.0, dx=1),
+                      HistogramAggregator(self.record_name, 0.0, dx=1),
+                      'bins')
+
+    def test_exact_sum(self):
+        values = np.array([0.1] * 10 + [1e16, -1e16])
+        self.assertEqual(float(exact_sum(values)), 1.0)
+        self.assertEqual(exact_sum(values[:4]) + exact_sum(values[4:]),
+                         exact_sum(values))
+        self.assertEqual(exact_sum(np.arange(10)), 45)
+
+    def test_merge_aggregators(self):
+        """Merging partial aggregators gives the same result as a single
+        aggregator"""
+        def _to_aggregators():
+            return {'max': MaxAggregator(self.record_name),
+                    'min': MinAggregator(self.record_name),
+                    'mean': MeanAggregator(self.record_name),
+                    'count': CountAggregator(self.record_name),
+                    'sum': SumAggregator(self.record_name),
+                    'hist': HistogramAggregator(self.record_name, 0.0, dx=1)}
+
+        single = _to_aggregators()
+        for a in single.values():
+            a.apply_chunk(self.chunk)
+
+        merged = _to_aggregators()
+        for i, j in [(0, 2), (2, 2), (2, 6), (6, 7)]:
+            partial = _to_aggregators()
+            for a in partial.values():
+                a.apply_chunk(self.chunk[i:j])
+            merge_aggregators(merged, partial)
+
+        for name, a in single.iteritems():
+            self.assertEqual(a.attribute if name != 'hist' else a.bins,
+                             merged[name].attribute if name != 'hist' else merged[name].bins)
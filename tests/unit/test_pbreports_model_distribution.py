@@ -0,0 +1,68 @@
+import unittest
+import logging
+import random
+
+import numpy as np
+
+from pbreports.model.distribution import (BinnedDistribution,
+                                          merge_distributions,
+                                          compute_n50_from_distributions)
+from pbreports.util import compute_n50
+
+log = logging.getLogger(__name__)
+
+
+def _expand(d):
+    """Approximate values used by compute_n50_from_distributions"""
+    values = d.bin_means
+    values[-1] = d.labels[-1]
+    return [v for v, n in zip(values, d.bins) for _ in xrange(n)]
+
+
+class TestBinnedDistribution(unittest.TestCase):
+
+    def setUp(self):
+        r = random.Random(7)
+        self.d1 = BinnedDistribution([r.randint(0, 20) for _ in xrange(30)],
+                                     0, 100)
+        self.d2 = BinnedDistribution([r.randint(0, 20) for _ in xrange(12)],
+                                     250, 50)
+
+    def test_stats(self):
+        values = _expand(self.d1)
+        means = [v for v, n in zip(self.d1.bin_means, self.d1.bins)
+                 for _ in xrange(n)]
+        self.assertEqual(self.d1.count, len(values))
+        self.assertAlmostEqual(self.d1.total, sum(means))
+        self.assertAlmostEqual(self.d1.mean, np.mean(means))
+        self.assertEqual(self.d1.n50, compute_n50(values))
+        self.assertEqual(self.d1.percentile(50),
+                         np.percentile(means, 50, interpolation='lower'))
+        self.assertEqual(self.d1.percentile(100), max(means))
+
+        empty = BinnedDistribution([0, 0], 0, 10)
+        self.assertEqual(empty.mean, 0.0)
+        self.assertEqual(empty.n50, 0)
+        self.assertEqual(empty.percentile(95), 0.0)
+
+    def test_n50_of_distributions(self):
+        values = _expand(self.d1) + _expand(self.d2)
+        self.assertEqual(
+            compute_n50_from_distributions([self.d1, self.d2]),
+            compute_n50(values))
+
+    def test_merge_same_grid(self):
+        d = BinnedDistribution([1, 2], 0, 100)
+        merged = merge_distributions([self.d1, d])
+        self.assertEqual(merged.nbins, self.d1.nbins)
+        self.assertEqual(merged.bins[:2].tolist(),
+                         (self.d1.bins[:2] + [1, 2]).tolist())
+
+    def test_merge_rebin(self):
+        merged = merge_distributions([self.d1, self.d2])
+        self.assertEqual(merged.min_value, 0)
+        self.assertEqual(merged.bin_width, 100)
+        self.assertEqual(merged.count, self.d1.count + self.d2.count)
+        # bin [300, 400) gets the d2 bins centered at 325 and 375
+        self.assertEqual(merged.bins[3],
+                         self.d1.bins[3] + self.d2.bins[1] + self.d2.bins[2])
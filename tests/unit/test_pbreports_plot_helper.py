@@ -3,7 +3,11 @@ import logging
 import unittest
 import tempfile
 
-from pbreports.plot.helper import get_fig_axes_lpr, apply_histogram_data, save_figure_with_thumbnail
+import numpy as np
+
+from pbreports.plot.helper import (get_fig_axes_lpr, apply_histogram_data,
+                                   save_figure_with_thumbnail, bin_points,
+                                   apply_density_scatter)
 
 log = logging.getLogger(__name__)
 
@@ -31,3 +35,37 @@ class TestPlotHelper(unittest.TestCase):
         save_figure_with_thumbnail(fig, os.path.join(tmpdir, 'foo.png'))
         self.assertTrue(os.path.exists(os.path.join(tmpdir, 'foo.png')))
         self.assertTrue(os.path.exists(os.path.join(tmpdir, 'foo_thumb.png')))
+
+    def test_bin_points(self):
+        """Binned counts match np.histogram2d"""
+        x = np.random.uniform(0, 100, 10000)
+        y = np.random.uniform(0, 1, 10000)
+        categories = (x // 50).astype(int)
+        counts, extent = bin_points(x, y, nbins=(20, 10),
+                                    extent=(0, 100, 0, 1),
+                                    categories=categories, ncategories=2)
+        self.assertEqual(counts.shape, (2, 10, 20))
+        self.assertEqual(counts.sum(), 10000)
+        h, _, _ = np.histogram2d(y, x, bins=(10, 20),
+                                 range=[[0, 1], [0, 100]])
+        self.assertTrue(np.array_equal(h, counts.sum(axis=0)))
+        # points outside the extent are dropped
+        counts, extent = bin_points(x, y, nbins=(20, 10),
+                                    extent=(0, 50, 0, 1))
+        self.assertEqual(counts.sum(), np.count_nonzero(x <= 50))
+
+    def test_density_scatter(self):
+        """Large inputs are drawn as a density image."""
+        tmpdir = tempfile.mkdtemp(prefix='pbreport_output')
+        fig, ax = get_fig_axes_lpr()
+        x = np.random.uniform(0, 100, 2000)
+        y = np.random.uniform(0, 1, 2000)
+        handles = apply_density_scatter(ax, x, y, categories=(x > 50),
+                                        colors=('#ff0000', '#00ff00', 'b'),
+                                        max_points=1000)
+        self.assertEqual(len(handles), 3)
+        self.assertIsNone(handles[2])
+        self.assertEqual(len(ax.images), 2)
+        ax.legend(handles[:2], ['low', 'high'])
+        save_figure_with_thumbnail(fig, os.path.join(tmpdir, 'density.png'))
+        self.assertTrue(os.path.exists(os.path.join(tmpdir, 'density.png')))
@@ -3,11 +3,13 @@ import logging
 import tempfile
 import unittest
 import json
+import random
 from pprint import pformat
 
 from pbcommand.models.report import Report
 
-from pbreports.report.amplicon_analysis_input import run_to_report
+from pbreports.report.amplicon_analysis_input import (run_to_report,
+                                                       parse_mappings)
 from base_test_case import LOCAL_DATA, run_backticks
 
 log = logging.getLogger(__name__)
@@ -16,6 +18,40 @@ _NAME = 'amplicon_analysis_input'
 DATA_DIR = os.path.join(LOCAL_DATA, _NAME)
 
 
+class TestParseMappings(unittest.TestCase):
+
+    def _write_mappings(self, consensus_names, rows):
+        t = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
+        t.write(",".join(["ZMW"] + consensus_names) + "\n")
+        for i, row in enumerate(rows):
+            t.write(",".join(["m1/{i}".format(i=i)] +
+                             [repr(w) for w in row]) + "\n")
+        t.close()
+        self.addCleanup(os.remove, t.name)
+        return t.name
+
+    def test_parse_mappings(self):
+        r = random.Random(42)
+        for names in (["c0"], ["c0", "c1", "c2"]):
+            rows = [[r.random() for _ in names] for _ in xrange(1000)]
+            rows[10] = [0.0 for _ in names]
+            mappings_file = self._write_mappings(names, rows)
+            # sequential sum of the weights, in file order
+            expected = {}
+            for row in rows:
+                for name, w in zip(names, row):
+                    expected[name] = expected.get(name, 0.0) + w
+            for chunk_size in (1, 7, 10000):
+                sums = parse_mappings(mappings_file, chunk_size)
+                self.assertEqual(sorted(sums.keys()), names)
+                for name in names:
+                    self.assertAlmostEqual(sums[name], expected[name])
+
+    def test_parse_mappings_empty(self):
+        mappings_file = self._write_mappings(["c0", "c1"], [])
+        self.assertEqual(parse_mappings(mappings_file), {})
+
+
 class TestLongAmpliconAnalysisPcrReport(unittest.TestCase):
 
     @classmethod
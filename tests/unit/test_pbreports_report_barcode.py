@@ -6,7 +6,12 @@ import unittest
 from pprint import pformat
 from pbcore.util.Process import backticks
 
-from pbreports.report.barcode import run_to_report, _to_tuple_list
+import numpy as np
+
+from pbreports.report.barcode import (run_to_report, _to_tuple_list,
+                                      _subread_counts_from_region_table,
+                                      _barcode_pair_counts, _merge_counts,
+                                      _to_label_counts)
 from pbreports.util import bas_fofn_to_bas_files
 
 from base_test_case import _get_root_data_dir, skip_if_data_dir_not_present
@@ -17,6 +22,64 @@ log = logging.getLogger(__name__)
 _DATA_DIR = os.path.join(ROOT_DATA_DIR, 'barcode')
 
 
+class TestRegionTableCounts(unittest.TestCase):
+
+    def test_subread_counts(self):
+        dtype = [('holeNumber', 'i4'), ('regionType', 'i4'),
+                 ('regionStart', 'i4'), ('regionEnd', 'i4'),
+                 ('regionScore', 'i4')]
+        # region types: 0 adapter, 1 insert, 2 HQ
+        region_table = np.array([(1, 1, 0, 100, 0),
+                                 (1, 0, 100, 140, 0),
+                                 (1, 1, 140, 300, 0),
+                                 (1, 2, 50, 250, 0),
+                                 (2, 1, 0, 500, 0),
+                                 (2, 2, 0, 400, 0),
+                                 # no HQ region
+                                 (3, 1, 0, 500, 0),
+                                 # insert outside of the HQ region
+                                 (4, 1, 0, 100, 0),
+                                 (4, 2, 200, 300, 0),
+                                 # not labeled
+                                 (5, 1, 0, 100, 0),
+                                 (5, 2, 0, 100, 0)], dtype=dtype)
+        hole_numbers = np.array([1, 2, 3, 4])
+        label_indices = np.array([0, 1, 1, 2])
+        reads, bases = _subread_counts_from_region_table(
+            region_table, hole_numbers, label_indices, 3)
+        self.assertEqual(reads.tolist(), [2, 1, 0])
+        self.assertEqual(bases.tolist(), [50 + 110, 400, 0])
+
+
+class TestPbiBarcodeCounts(unittest.TestCase):
+
+    def test_barcode_pair_counts(self):
+        # .pbi columns of the reads of two BAM files. -1 is no barcode call
+        bc_forward = np.array([0, 0, 1, -1, 2, 0])
+        bc_reverse = np.array([0, 0, 1, -1, 0, -1])
+        q_start = np.array([0, 100, 10, 0, 5, 0])
+        q_end = np.array([100, 300, 60, 50, 25, 40])
+        counts = _barcode_pair_counts(bc_forward, bc_reverse, q_end - q_start)
+        self.assertEqual(counts, {(0, 0): (2, 300), (1, 1): (1, 50),
+                                  (2, 0): (1, 20)})
+
+        other = _barcode_pair_counts(np.array([1]), np.array([1]),
+                                     np.array([7]))
+        counts = _merge_counts([counts, other])
+        self.assertEqual(counts[(1, 1)], (2, 57))
+
+        none = _barcode_pair_counts(np.array([-1]), np.array([-1]),
+                                    np.array([10]))
+        self.assertEqual(none, {})
+
+    def test_label_counts(self):
+        pair_counts = {(0, 0): (2, 300), (2, 1): (1, 20)}
+        self.assertEqual(_to_label_counts(pair_counts),
+                         {"0--0": (2, 300), "2--1": (1, 20)})
+        self.assertEqual(_to_label_counts(pair_counts, ["bc1", "bc2", "bc3"]),
+                         {"bc1--bc1": (2, 300), "bc3--bc2": (1, 20)})
+
+
 @skip_if_data_dir_not_present
 class TestBarcodeFunctions(unittest.TestCase):
 
@@ -9,13 +9,17 @@ import unittest
 import pprint
 import functools
 
+import numpy as np
+
 from pbcommand.models.report import Report
 import pbcommand.testkit
 from pbcommand.pb_io.report import load_report_from_json
 from pbcore.io import ConsensusReadSet
 import pbcore.data
 
-from pbreports.report.ccs import to_report, Constants
+from pbreports.report.ccs import (to_report, Constants,
+                                  _bam_file_to_movie_results,
+                                  MovieResult, MovieSummary)
 from base_test_case import run_backticks, LOCAL_DATA
 
 log = logging.getLogger(__name__)
@@ -194,6 +198,39 @@ class TestToolContract(pbcommand.testkit.PbTestApp):
                          EXPECTED_VALUES[Constants.A_NREADS])
 
 
+class TestMovieSummary(unittest.TestCase):
+
+    def _movie_result(self, seed, n):
+        r = np.random.RandomState(seed)
+        return MovieResult("f{s}.bam".format(s=seed), "movie", r.randint(100, 200, n),
+                           r.uniform(0.8, 1.0, n), r.randint(1, 10, n))
+
+    def test_merge(self):
+        """Merged summaries have the same counts as the concatenated reads"""
+        results = [self._movie_result(i, 100 * i) for i in xrange(4)]
+        m = MovieSummary.merge("movie", [MovieSummary.from_movie_result(r)
+                                         for r in results])
+        read_lengths = np.concatenate([r.read_lengths for r in results])
+        num_passes = np.concatenate([r.num_passes for r in results])
+        accuracies = np.concatenate([r.accuracies for r in results])
+        self.assertEqual(m.nreads, len(read_lengths))
+        self.assertEqual(m.total_bases, read_lengths.sum())
+        self.assertEqual(m.num_passes_sum, num_passes.sum())
+        self.assertAlmostEqual(m.mean_accuracy, accuracies.mean())
+
+        (values, ), counts = m.read_length_counts
+        self.assertEqual(np.repeat(values, counts).tolist(),
+                         sorted(read_lengths))
+        (values, ), counts = m.num_passes_counts
+        self.assertEqual(np.repeat(values, counts).tolist(),
+                         sorted(num_passes))
+        self.assertEqual(m.accuracy_counts[1].sum(), len(accuracies))
+
+        empty = MovieSummary.merge("movie", [])
+        self.assertEqual(empty.nreads, 0)
+        self.assertEqual(empty.mean_accuracy, 0.0)
+
+
 class TestCCSMultipleMovies(unittest.TestCase):
     CCS_BAM = op.join(LOCAL_DATA, "ccs", "ccs_mixed.bam")
 
@@ -204,3 +241,16 @@ class TestCCSMultipleMovies(unittest.TestCase):
         """
         ds = ConsensusReadSet(self.CCS_BAM)
         r = to_report(ds, tempfile.mkdtemp())
+
+    def test_bam_file_to_movie_results(self):
+        """
+        Reads of a multi-movie BAM file are split by movie
+        """
+        results = _bam_file_to_movie_results(self.CCS_BAM)
+        movie_names = [m.movie_name for m in results]
+        self.assertEqual(movie_names, sorted(set(movie_names)))
+        self.assertTrue(len(results) > 1)
+        for m in results:
+            self.assertEqual(len(m.read_lengths), len(m.accuracies))
+            self.assertEqual(len(m.read_lengths), len(m.num_passes))
+        self.assertEqual(sum(len(m.read_lengths) for m in results), 2)
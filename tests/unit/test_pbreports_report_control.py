@@ -107,7 +107,7 @@ class TestControlRpt(unittest.TestCase):
 
     def test_get_control_reads(self):
         """
-        Test that a correct control name is returned. Also, test the control reads dict.
+        Test that a correct control name is returned. Also, test the control reads array.
         """
         name, control_reads = self._data[CONTROL_READS]
         self.assertEqual('4kb_Control_c2', name)
@@ -116,7 +116,8 @@ class TestControlRpt(unittest.TestCase):
         # sanity test - every control read should be in filtered_summary
         not_in = []
         ids = self._get_all_filtered_read_ids()
-        for cid in control_reads.keys():
+        for row in control_reads:
+            cid = '%s/%d' % (row['MovieName'], row['HoleNumber'])
             if cid not in ids:
                 not_in.append(cid)
 #                self.fail('control read {c} is not in filtered_summary.csv'.format(c=cid))
@@ -1,9 +1,11 @@
 import os
 import os.path as op
 from pprint import pformat
+from multiprocessing.pool import ThreadPool
 import tempfile
 import unittest
 import logging
+import shutil
 
 import pbcommand.testkit
 
@@ -16,6 +18,121 @@ log = logging.getLogger(__name__)
 
 ROOT_DATA_DIR = "/pbi/dept/secondary/siv/testdata/SA3-DS"
 
+_MOVIES = ["m140905_042212_sidney_c100564852550000001823085912221377_s1_p0",
+           "m140905_042212_sidney_c100564852550000001823085912221377_s2_p0",
+           "m140906_231018_42161_c100676332550000001823129611271486_s1_p0"]
+
+_SUBREADSET_XML = """<?xml version="1.0" encoding="utf-8"?>
+<pbds:SubreadSet xmlns:pbds="http://pacificbiosciences.com/PacBioDatasets.xsd"
+    xmlns:pbbase="http://pacificbiosciences.com/PacBioBaseDataModel.xsd"
+    xmlns:pbmeta="http://pacificbiosciences.com/PacBioCollectionMetadata.xsd"
+    CreatedAt="2015-10-21T00:00:00" MetaType="PacBio.DataSet.SubreadSet"
+    Name="overview" Tags="" Version="3.0.1"
+    UniqueId="b095d0a3-94b8-4918-b3af-a3f81bbe519c">
+  <pbbase:ExternalResources>
+{resources}
+  </pbbase:ExternalResources>
+  <pbds:DataSetMetadata>
+    <pbds:TotalLength>1000</pbds:TotalLength>
+    <pbds:NumRecords>10</pbds:NumRecords>
+{collections}
+  </pbds:DataSetMetadata>
+</pbds:SubreadSet>
+"""
+
+
+class _FakeBamReader(object):
+    """BamReader of the fake BAM files, with a read group of each movie"""
+    headers = {}
+    opened = []
+
+    def __init__(self, file_name):
+        self.opened.append(file_name)
+        self.peer = self
+        self.header = {"RG": [{"PU": movie}
+                              for movie in self.headers[file_name]]}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class TestOverviewMovies(unittest.TestCase):
+
+    """Count the movies of a SubreadSet without any external data"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pool_classes = []
+        self._bam_reader = overview.BamReader
+        self._pool_map = overview.pool_map
+        _FakeBamReader.headers = {}
+        _FakeBamReader.opened = []
+
+        def _pool_map(func, items, nproc=1, pool_class=None):
+            self.pool_classes.append(pool_class)
+            return self._pool_map(func, items, nproc, pool_class=pool_class)
+
+        overview.BamReader = _FakeBamReader
+        overview.pool_map = _pool_map
+
+    def tearDown(self):
+        overview.BamReader = self._bam_reader
+        overview.pool_map = self._pool_map
+        shutil.rmtree(self.tmp_dir)
+
+    def _to_subreadset(self, bam_movies, contexts):
+        """
+        Write a SubreadSet of (empty) BAM files with the read groups of
+        bam_movies, and a collection for each of the contexts.
+        """
+        resources = []
+        for i, movies in enumerate(bam_movies):
+            bam = op.join(self.tmp_dir, "{i}.subreads.bam".format(i=i))
+            open(bam, 'w').close()
+            _FakeBamReader.headers[bam] = movies
+            resources.append(
+                '    <pbbase:ExternalResource '
+                'MetaType="PacBio.SubreadFile.SubreadBamFile" '
+                'ResourceId="{f}"/>'.format(f=bam))
+        collections = ""
+        if contexts:
+            collections = "\n".join(
+                ['    <pbmeta:Collections>'] +
+                ['      <pbmeta:CollectionMetadata Context="{c}" '
+                 'InstrumentName="sidney" InstrumentId="1"/>'.format(c=c)
+                 for c in contexts] +
+                ['    </pbmeta:Collections>'])
+        file_name = op.join(self.tmp_dir, "movies.subreadset.xml")
+        with open(file_name, 'w') as f:
+            f.write(_SUBREADSET_XML.format(resources="\n".join(resources),
+                                           collections=collections))
+        return file_name
+
+    def _get_counts(self, report):
+        return (report.get_attribute_by_id('nmovies').value,
+                report.get_attribute_by_id('ncells').value)
+
+    def test_metadata_movies(self):
+        subreadset = self._to_subreadset([_MOVIES[:2], _MOVIES[2:]],
+                                         _MOVIES)
+        report = overview.run(subreadset)
+        self.assertEqual(self._get_counts(report), (3, 2))
+        # the BAM files aren't opened
+        self.assertEqual(_FakeBamReader.opened, [])
+        self.assertEqual(self.pool_classes, [])
+
+    def test_header_movies(self):
+        subreadset = self._to_subreadset([_MOVIES[:2], _MOVIES[2:],
+                                          _MOVIES[:1]], [])
+        report = overview.run(subreadset)
+        self.assertEqual(self._get_counts(report), (3, 2))
+        self.assertEqual(sorted(_FakeBamReader.opened),
+                         sorted(_FakeBamReader.headers.keys()))
+        self.assertEqual(self.pool_classes, [ThreadPool])
+
 @skip_if_data_dir_not_present
 class TestOverViewReport(unittest.TestCase):
 
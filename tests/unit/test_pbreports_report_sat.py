@@ -8,6 +8,9 @@ import json
 import tempfile
 import unittest
 import shutil
+from collections import OrderedDict
+
+import numpy as np
 
 from pbcommand.models.report import PbReportError
 import pbcommand.testkit
@@ -20,7 +23,8 @@ from pbreports.util import get_top_contigs_from_ref_entry, movie_to_cell
 from pbreports.report.sat import (_validate_inputs, _get_read_hole_data,
                                   _cell_2_inst, _get_variants_data,
                                   _get_mapping_stats_data,
-                                  _get_reads_info, summarize_report)
+                                  _get_reads_info, summarize_report,
+                                  _group_holes_by_cell)
 
 from base_test_case import LOCAL_DATA
 
@@ -34,6 +38,25 @@ class TestCoreFunctions(unittest.TestCase):
         self.assertEqual('42129', _cell_2_inst(
             'm130306_023456_42129_c100422252550000001523053002121396'))
 
+    def test_group_holes_by_cell(self):
+        cell_1 = "m130306_023456_42129_c100422252550000001523053002121396"
+        cell_2 = "m130306_023456_42129_c100422252550000001523053002121397"
+        holes_by_cell = OrderedDict()
+        # two movies (sets) of cell_1 in one BAM file, with duplicate holes
+        _group_holes_by_cell(np.array([7, 3, 7, 300, 3]),
+                             np.array([1, 0, 1, 0, 0]),
+                             [cell_1 + "_s1_p0", cell_1 + "_s2_p0"],
+                             holes_by_cell)
+        self.assertEqual(holes_by_cell[cell_1].tolist(), [3, 7, 300])
+        self.assertEqual(holes_by_cell[cell_1].dtype, np.uint16)
+        _group_holes_by_cell(np.array([5, 70000, 2]), np.array([0, 1, 1]),
+                             [cell_1 + "_s1_p0", cell_2 + "_s1_p0"],
+                             holes_by_cell)
+        self.assertEqual(holes_by_cell.keys(), [cell_1, cell_2])
+        self.assertEqual(holes_by_cell[cell_1].tolist(), [3, 5, 7, 300])
+        self.assertEqual(holes_by_cell[cell_2].tolist(), [2, 70000])
+        self.assertEqual(holes_by_cell[cell_2].dtype, np.uint32)
+
     def test_timestamped_moviename(self):
         moviename = "m54004_151002_00100"
         cellname = movie_to_cell(moviename)
@@ -17,6 +17,7 @@ from pbreports.io.filtered_summary_reader import FilteredSummaryReader
 from pbreports.report.loading_xml import to_report as make_loading_report
 from pbreports.report.filter_stats_xml import to_report as make_filter_report
 from pbreports.report.adapter_xml import to_report as make_adapter_report
+from pbreports.report.stats_xml import to_reports as make_stats_xml_reports
 
 log = logging.getLogger(__name__)
 
@@ -281,12 +282,17 @@ class TestXMLstatsRpts(unittest.TestCase):
             self.assertEqual('Short Inserts (11-100bp)', c0['values'][1])
             self.assertEqual(0.0, c1['values'][0])
             self.assertEqual(0.0, c1['values'][1])
+            # the distributions are merged into a single plot
             self.assertTrue(os.path.exists(os.path.join(
                 self.get_output_dir(),
                 'interAdapterDist0.png')))
-            self.assertTrue(os.path.exists(os.path.join(
+            self.assertFalse(os.path.exists(os.path.join(
                 self.get_output_dir(),
                 'interAdapterDist1.png')))
+            plots = d['plotGroups'][0]['plots']
+            self.assertEqual(1, len(plots))
+            self.assertEqual('adapter_xml_report.adapter_xml_plot_group.'
+                             'adapter_xml_plot_0', plots[0]['id'])
 
         except:
             log.error(traceback.format_exc())
@@ -369,19 +375,48 @@ class TestXMLstatsRpts(unittest.TestCase):
             self.assertEqual(21884, c1['values'][2])
             self.assertEqual(15649.69, c1['values'][3])
             self.assertEqual(0.86, c1['values'][4])
+            # the distributions are merged into a single plot of each kind
             self.assertTrue(os.path.exists(os.path.join(
                 self.get_output_dir(),
                 'readLenDist0.png')))
             self.assertTrue(os.path.exists(os.path.join(
                 self.get_output_dir(),
                 'readQualDist0.png')))
-            self.assertTrue(os.path.exists(os.path.join(
+            self.assertFalse(os.path.exists(os.path.join(
                 self.get_output_dir(),
                 'readLenDist1.png')))
-            self.assertTrue(os.path.exists(os.path.join(
+            self.assertFalse(os.path.exists(os.path.join(
                 self.get_output_dir(),
                 'readQualDist1.png')))
+            len_plots, qual_plots = [pg['plots'] for pg in d['plotGroups']]
+            self.assertEqual(1, len(len_plots))
+            self.assertEqual('filtering_stats_xml_report.'
+                             'filter_len_xml_plot_group.'
+                             'filter_len_xml_plot_0', len_plots[0]['id'])
+            self.assertEqual(1, len(qual_plots))
+            self.assertEqual('filtering_stats_xml_report.'
+                             'filter_qual_xml_plot_group.'
+                             'filter_qual_xml_plot_0', qual_plots[0]['id'])
 
         except:
             log.error(traceback.format_exc())
             raise
+
+    def test_make_stats_xml_reports(self):
+        """
+        Test generating the loading, adapter and filter reports together
+        """
+        sts_xml = data.getXmlWithStats()
+        out = self.get_output_dir()
+        reports = [os.path.join(out, name) for name in
+                   ('loading.json', 'adapter.json', 'filter.json')]
+        make_stats_xml_reports(sts_xml, *reports)
+        for report in reports:
+            self.assertTrue(os.path.exists(report))
+        self.assertTrue(os.path.exists(os.path.join(out,
+                                                    'interAdapterDist0.png')))
+        self.assertTrue(os.path.exists(os.path.join(out, 'readLenDist0.png')))
+
+        d = json.loads(open(reports[0]).read())
+        loading = json.loads(make_loading_report(sts_xml).to_json())
+        self.assertEqual(d['tables'], loading['tables'])
@@ -7,7 +7,7 @@ import shlex
 from base_test_case import ROOT_DATA_DIR, run_backticks, \
     skip_if_data_dir_not_present
 
-from pbreports.report.summarize_compare_by_movie import main
+from pbreports.report.summarize_compare_by_movie import main, ReadStats
 
 log = logging.getLogger()
 
@@ -33,6 +33,24 @@ class TestHelp(unittest.TestCase):
         self.assertEqual(rcode, 0)
 
 
+class TestReadStats(unittest.TestCase):
+
+    def test_stats(self):
+        self.assertEqual(ReadStats().tostring(), '0,0.0,0.0,0')
+        stats = ReadStats()
+        for i in xrange(40):
+            stats.lengths.append(100 + i)
+            stats.zs.append(float(i))
+            stats.accs.append(80.0 + i / 4.0)
+            stats.n += 1
+        self.assertEqual(stats.zscore, 19.5)
+        self.assertEqual(stats.length, 119.5)
+        self.assertEqual(stats.accuracy, 84.875)
+        self.assertEqual(stats._quantile(stats.zs.values, 0.95), 38.0)
+        self.assertEqual(stats.tostring(), '40,19.50,84.88,120')
+        self.assertEqual(stats.tostring(external=True), '40,84.88,119.5')
+
+
 @skip_if_data_dir_not_present
 class TestSummarizeCompareByMovie(unittest.TestCase):
     def test_basic(self):
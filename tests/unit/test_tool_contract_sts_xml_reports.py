@@ -47,5 +47,17 @@ class TestFilterStatsReport(pbcommand.testkit.PbTestApp):
     TASK_OPTIONS = {}
 
 
+class TestStatsXmlReports(pbcommand.testkit.PbTestApp):
+    MAX_NPROC = 12
+    RESOLVED_NPROC = 1
+    DATA = data.getXmlWithStats()
+    DRIVER_BASE = "python -m pbreports.report.stats_xml "
+    DRIVER_EMIT = DRIVER_BASE + " --emit-tool-contract "
+    DRIVER_RESOLVE = DRIVER_BASE + " --resolved-tool-contract "
+    REQUIRES_PBCORE = True
+    INPUT_FILES = [DATA]
+    TASK_OPTIONS = {}
+
+
 if __name__ == "__main__":
     unittest.main()